@@ -2,7 +2,11 @@
 
 __all__ = ["index", "modules", "custom_doc_links", "git_url"]
 
-index = {"Scaler": "data__scalers.ipynb",
+index = {"fourier_terms": "data__calendar.ipynb",
+         "register_calendar_generator": "data__calendar.ipynb",
+         "CALENDAR_GENERATORS": "data__calendar.ipynb",
+         "CalendarFeatures": "data__calendar.ipynb",
+         "Scaler": "data__scalers.ipynb",
          "norm_scaler": "data__scalers.ipynb",
          "inv_norm_scaler": "data__scalers.ipynb",
          "norm1_scaler": "data__scalers.ipynb",
@@ -21,6 +25,7 @@ index = {"Scaler": "data__scalers.ipynb",
          "BaseDataset.get_max_len": "data__tsdataset.ipynb",
          "BaseDataset.get_n_channels": "data__tsdataset.ipynb",
          "BaseDataset.get_frequency": "data__tsdataset.ipynb",
+         "BaseDataset.describe": "data__tsdataset.ipynb",
          "get_default_mask_df": "data__tsdataset.ipynb",
          "TimeSeriesDataset": "data__tsdataset.ipynb",
          "TimeSeriesDataset.__getitem__": "data__tsdataset.ipynb",
@@ -35,6 +40,7 @@ index = {"Scaler": "data__scalers.ipynb",
          "FastTimeSeriesLoader.__next__": "data__tsloader.ipynb",
          "FastTimeSeriesLoader.__len__": "data__tsloader.ipynb",
          "create_synthetic_tsdata": "data__utils.ipynb",
+         "create_synthetic_panel": "data__utils.ipynb",
          "NP": "data_datasets__epf.ipynb",
          "PJM": "data_datasets__epf.ipynb",
          "BE": "data_datasets__epf.ipynb",
@@ -44,6 +50,8 @@ index = {"Scaler": "data__scalers.ipynb",
          "EPF": "data_datasets__epf.ipynb",
          "epf_naive_forecast": "data_datasets__epf.ipynb",
          "logger": "data_datasets__utils.ipynb",
+         "extract_file": "data_datasets__utils.ipynb",
+         "extract_files": "data_datasets__utils.ipynb",
          "GEFCom2012": "data_datasets__gefcom2012.ipynb",
          "GEFCom2012_L": "data_datasets__gefcom2012.ipynb",
          "GEFCom2012_W": "data_datasets__gefcom2012.ipynb",
@@ -143,6 +151,21 @@ index = {"Scaler": "data__scalers.ipynb",
          "Weather": "data_datasets__long_horizon.ipynb",
          "LongHorizonInfo": "data_datasets__long_horizon.ipynb",
          "LongHorizon": "data_datasets__long_horizon.ipynb",
+         "example_inputs": "models__export.ipynb",
+         "freeze": "models__export.ipynb",
+         "export_torchscript": "models__export.ipynb",
+         "compile_forecast": "models__export.ipynb",
+         "export_onnx": "models__export.ipynb",
+         "OnnxRuntimeBackend": "models__export.ipynb",
+         "export_numpy": "models__export.ipynb",
+         "ArrayWriter": "models__inference.ipynb",
+         "NpyWriter": "models__inference.ipynb",
+         "InferenceRunner": "models__inference.ipynb",
+         "get_runner": "models__inference.ipynb",
+         "make_future_dataframe": "models__inference.ipynb",
+         "tail_series": "models__inference.ipynb",
+         "NumpyForecast": "models__numpy_forecast.ipynb",
+         "quantize_dynamic": "models__quantization.ipynb",
          "Yearly": "models_nbeats__ensemble.ipynb",
          "Quarterly": "models_nbeats__ensemble.ipynb",
          "Monthly": "models_nbeats__ensemble.ipynb",
@@ -160,8 +183,12 @@ index = {"Scaler": "data__scalers.ipynb",
          "TourismInfo": "data_datasets__tourism.ipynb",
          "Tourism": "data_datasets__tourism.ipynb",
          "download_file": "data_datasets__utils.ipynb",
+         "download_files": "data_datasets__utils.ipynb",
          "Info": "data_datasets__utils.ipynb",
          "TimeSeriesDataclass": "data_datasets__utils.ipynb",
+         "save_cache": "data_datasets__utils.ipynb",
+         "cache_exists": "data_datasets__utils.ipynb",
+         "load_cache": "data_datasets__utils.ipynb",
          "get_holiday_dates": "data_datasets__utils.ipynb",
          "holiday_kernel": "data_datasets__utils.ipynb",
          "create_calendar_variables": "data_datasets__utils.ipynb",
@@ -254,9 +281,12 @@ index = {"Scaler": "data__scalers.ipynb",
          "lookbacks": "models_nbeats__ensemble.ipynb",
          "ensemble_grid": "models_nbeats__ensemble.ipynb",
          "print_models_list": "models_nbeats__ensemble.ipynb",
+         "create_datasets_M4": "models_nbeats__ensemble.ipynb",
          "create_loaders_M4": "models_nbeats__ensemble.ipynb",
          "NBEATS_instantiate": "models_nbeats__ensemble.ipynb",
          "show_tensorboard": "models_nbeats__ensemble.ipynb",
+         "VectorizedNBEATS": "models_nbeats__ensemble.ipynb",
+         "OnlineMedian": "models_nbeats__ensemble.ipynb",
          "NBEATSEnsemble": "models_nbeats__ensemble.ipynb",
          "IdentityBasis": "models_nbeats__nbeats.ipynb",
          "TrendBasis": "models_nbeats__nbeats.ipynb",
@@ -267,9 +297,11 @@ index = {"Scaler": "data__scalers.ipynb",
          "init_weights": "models_nbeats__nbeats.ipynb",
          "NBEATS": "models_nbeats__nbeats.ipynb",
          "NBEATS.forecast": "models_nbeats__nbeats.ipynb",
+         "NBEATS.quantize": "models_nbeats__nbeats.ipynb",
          "suggested_space": "models_rnn__rnn.ipynb",
          "NHITS": "models_nhits__nhits.ipynb",
          "NHITS.forecast": "models_nhits__nhits.ipynb",
+         "NHITS.quantize": "models_nhits__nhits.ipynb",
          "RNN": "models_rnn__rnn.ipynb",
          "RNN.forecast": "models_rnn__rnn.ipynb",
          "Autoformer": "models_transformer__autoformer.ipynb",
@@ -279,7 +311,8 @@ index = {"Scaler": "data__scalers.ipynb",
          "Transformer": "models_transformer__transformer.ipynb",
          "Transformer.forecast": "models_transformer__transformer.ipynb"}
 
-modules = ["data/scalers.py",
+modules = ["data/calendar.py",
+           "data/scalers.py",
            "data/tsdataset.py",
            "data/tsloader.py",
            "data/utils.py",
@@ -298,6 +331,10 @@ modules = ["data/scalers.py",
            "losses/numpy.py",
            "losses/pytorch.py",
            "losses/utils.py",
+           "models/export.py",
+           "models/inference.py",
+           "models/numpy_forecast.py",
+           "models/quantization.py",
            "models/components/autocorrelation.py",
            "models/components/autoformer.py",
            "models/components/common.py",
@@ -0,0 +1,146 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/data__calendar.ipynb (unless otherwise specified).
+
+__all__ = ['fourier_terms', 'register_calendar_generator', 'CALENDAR_GENERATORS', 'CalendarFeatures']
+
+# Cell
+from functools import partial
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .datasets.utils import US_FEDERAL_HOLIDAYS, _holiday_distance, get_holiday_dates
+
+# Cell
+def fourier_terms(dates: pd.DatetimeIndex, period: pd.Timedelta, order: int) -> np.ndarray:
+    """Sine and cosine terms of the given period.
+
+    Parameters
+    ----------
+    dates: pd.DatetimeIndex
+        Timestamps.
+    period: pd.Timedelta
+        Seasonal period of the terms.
+    order: int
+        Number of harmonics.
+
+    Returns
+    -------
+    Array of shape (len(dates), 2 * order).
+    """
+    phase = (dates.asi8 / period.value) % 1
+    harmonics = 2 * np.pi * phase[:, None] * np.arange(1, order + 1)[None, :]
+    return np.concatenate([np.sin(harmonics), np.cos(harmonics)], axis=1)
+
+class _HolidayDistance:
+    """Day distance to the nearest holiday, as `holiday_kernel`.
+
+    The holiday dates are computed once and reused while the dates stay
+    in their range, each call only searches the dates in them.
+    """
+
+    def __init__(self, holiday: str):
+        self.holiday = holiday
+        self.start, self.end = None, None
+        self.holiday_dates = None
+
+    def __call__(self, dates: pd.DatetimeIndex) -> np.ndarray:
+        dates_np = np.array(pd.DatetimeIndex(dates)).astype('datetime64[D]')
+        start, end = dates_np.min(), dates_np.max()
+        if self.holiday_dates is None or start < self.start or end > self.end:
+            # The range grows to cover the dates of every call
+            if self.holiday_dates is not None:
+                start, end = min(start, self.start), max(end, self.end)
+            holiday_dates = get_holiday_dates(self.holiday, np.array([start, end]))
+            self.holiday_dates = np.sort(holiday_dates.astype('datetime64[D]'))
+            self.start, self.end = start, end
+
+        return _holiday_distance(dates_np, self.holiday_dates)
+
+CALENDAR_GENERATORS = {
+    'minute': lambda dates: dates.minute.values,
+    'hour': lambda dates: dates.hour.values,
+    'day_of_week': lambda dates: dates.dayofweek.values,
+    'day_of_month': lambda dates: dates.day.values,
+    'day_of_year': lambda dates: dates.dayofyear.values,
+    'month': lambda dates: dates.month.values,
+    # Normalized to [-0.5, 0.5], as the time features of Informer and Autoformer
+    'minute_of_hour_norm': lambda dates: dates.minute.values / 59.0 - 0.5,
+    'hour_of_day_norm': lambda dates: dates.hour.values / 23.0 - 0.5,
+    'day_of_week_norm': lambda dates: dates.dayofweek.values / 6.0 - 0.5,
+    'day_of_month_norm': lambda dates: (dates.day.values - 1) / 30.0 - 0.5,
+    'day_of_year_norm': lambda dates: (dates.dayofyear.values - 1) / 365.0 - 0.5,
+    'month_of_year_norm': lambda dates: (dates.month.values - 1) / 11.0 - 0.5,
+    'fourier_daily': partial(fourier_terms, period=pd.Timedelta(days=1), order=2),
+    'fourier_weekly': partial(fourier_terms, period=pd.Timedelta(days=7), order=2),
+    'fourier_yearly': partial(fourier_terms, period=pd.Timedelta(days=365.25), order=4),
+}
+
+for holiday in US_FEDERAL_HOLIDAYS.keys():
+    CALENDAR_GENERATORS[f'holiday_dist_{holiday}'] = _HolidayDistance(holiday)
+
+def register_calendar_generator(name: str,
+                                generator: Callable[[pd.DatetimeIndex], np.ndarray]) -> None:
+    """Registers a calendar generator to be used in `calendar_cols`.
+
+    Parameters
+    ----------
+    name: str
+        Name of the calendar feature.
+    generator: Callable
+        Function that maps a pd.DatetimeIndex of length n
+        to an array of shape (n,) or (n, k).
+    """
+    CALENDAR_GENERATORS[name] = generator
+
+# Cell
+class CalendarFeatures:
+    """
+    Computes registered calendar features from timestamps.
+    """
+
+    def __init__(self, cols: List[str]):
+        """
+        Parameters
+        ----------
+        cols: List[str]
+            Names of calendar generators in CALENDAR_GENERATORS.
+        """
+        unknown_cols = [col for col in cols if col not in CALENDAR_GENERATORS]
+        if unknown_cols:
+            str_cols = ', '.join(unknown_cols)
+            raise Exception(f'Calendar features {str_cols} are not registered in CALENDAR_GENERATORS.')
+
+        self.cols = list(cols)
+        self.generators = [CALENDAR_GENERATORS[col] for col in self.cols]
+
+        # Number of channels of each generator, a generator may return several
+        probe = pd.DatetimeIndex(['2000-01-01'])
+        self.n_features_col = [np.reshape(generator(probe), (1, -1)).shape[1]
+                               for generator in self.generators]
+        self.n_features = sum(self.n_features_col)
+
+    def transform(self, ds: np.ndarray) -> np.ndarray:
+        """Computes calendar features of ds.
+
+        Features are computed once per unique timestamp
+        and then broadcasted back to the shape of ds.
+
+        Parameters
+        ----------
+        ds: np.ndarray
+            Array of timestamps of any shape.
+
+        Returns
+        -------
+        Float array of shape ds.shape + (n_features,).
+        """
+        ds = np.asarray(ds, dtype='datetime64[ns]')
+        unique_ds, inverse = np.unique(ds.ravel(), return_inverse=True)
+        dates = pd.DatetimeIndex(unique_ds)
+
+        features = [np.reshape(generator(dates), (len(dates), -1)).astype(np.float32)
+                    for generator in self.generators]
+        features = np.concatenate(features, axis=1)
+
+        return features[inverse].reshape(ds.shape + (self.n_features,))
\ No newline at end of file
@@ -10,7 +10,7 @@ from typing import List, Optional, Tuple
 import numpy as np
 import pandas as pd
 
-from .utils import download_file, Info
+from .utils import download_files, Info
 
 # Cell
 @dataclass
@@ -150,9 +150,7 @@ class EPF:
             Directory path to download dataset.
         """
         path = f'{directory}/epf/datasets'
-        if not os.path.exists(path):
-            for group in EPFInfo.groups:
-                download_file(path, EPF.source_url + f'{group}.csv')
+        download_files(path, [EPF.source_url + f'{group}.csv' for group in EPFInfo.groups])
 
 # Cell
 # TODO: extend this to group_by unique_id application
@@ -17,7 +17,6 @@ __all__ = ['logger', 'Extended', 'Load', 'Price', 'Solar', 'Wind', 'GEFCom2014',
 import os
 import re
 import logging
-import zipfile
 
 from dataclasses import dataclass
 from typing import Tuple
@@ -27,6 +26,7 @@ import pandas as pd
 
 from .utils import (
     download_file,
+    extract_files,
     Info,
     create_calendar_variables,
     create_us_holiday_distance_variables,
@@ -87,16 +87,14 @@ class GEFCom2014:
 
         path = f'{directory}/gefcom2014'
         windpath = f'{path}/Wind'
+        filepaths, unzipdirs = [], []
         for task_number in range(1, 16):
             unzipdir = f'{windpath}/Task {task_number}'
-            ypath = f'{unzipdir}/Task{task_number}_W_Zone1_10.zip'
-            xpath = f'{unzipdir}/TaskExpVars{task_number}_W_Zone1_10.zip'
+            filepaths += [f'{unzipdir}/Task{task_number}_W_Zone1_10.zip',
+                          f'{unzipdir}/TaskExpVars{task_number}_W_Zone1_10.zip']
+            unzipdirs += [unzipdir, unzipdir]
 
-            with zipfile.ZipFile(ypath, 'r') as zip_ref:
-                zip_ref.extractall(path=unzipdir)
-
-            with zipfile.ZipFile(xpath, 'r') as zip_ref:
-                zip_ref.extractall(path=unzipdir)
+        extract_files(filepaths, unzipdirs)
 
         logger.info(f'Successfully decompressed Wind tasks')
 
@@ -112,11 +110,9 @@ class GEFCom2014:
         """
 
         # Unzip Load, Price, Solar and Wind data
-        for group in GEFCom2014Info.groups:
-            filepath = f'{path}/GEFCom2014 Data/GEFCom2014-{group}.zip'
-            with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                zip_ref.extractall(path)
-                logger.info(f'Successfully decompressed {filepath}')
+        filepaths = [f'{path}/GEFCom2014 Data/GEFCom2014-{group}.zip' \
+                     for group in GEFCom2014Info.groups]
+        extract_files(filepaths, path)
 
     @staticmethod
     def download(directory: str) -> None:
@@ -11,7 +11,7 @@ from typing import Optional, Tuple
 import numpy as np
 import pandas as pd
 
-from .utils import download_file, Info
+from .utils import download_file, Info, cache_exists, load_cache, save_cache
 
 # Cell
 @dataclass
@@ -210,7 +210,7 @@ class LongHorizon:
                                 'ECL', 'Exchange',
                                 'Traffic', 'Weather', 'ILI'.
             cache: bool
-                If `True` saves and loads
+                If `True` saves and loads a columnar numpy cache.
 
             Returns
             -------
@@ -226,12 +226,12 @@ class LongHorizon:
             raise Exception(f'group not found {group}')
 
         path = f'{directory}/longhorizon/datasets'
-        file_cache = f'{path}/{group}.p'
+        file_cache = f'{path}/{group}_cache'
 
-        if os.path.exists(file_cache) and cache:
-            df, X_df, S_df = pd.read_pickle(file_cache)
+        if cache_exists(file_cache) and cache:
+            frames = load_cache(file_cache)
 
-            return df, X_df, S_df
+            return frames['Y_df'], frames['X_df'], frames['S_df']
 
         LongHorizon.download(directory)
         path = f'{directory}/longhorizon/datasets'
@@ -246,7 +246,7 @@ class LongHorizon:
 
         S_df = None
         if cache:
-            pd.to_pickle((y_df, X_df, S_df), file_cache)
+            save_cache(file_cache, {'Y_df': y_df, 'X_df': X_df, 'S_df': S_df})
 
         return y_df, X_df, S_df
 
@@ -5,12 +5,12 @@ __all__ = ['Yearly', 'Quarterly', 'Monthly', 'Weekly', 'Daily', 'Hourly', 'Other
 # Cell
 import os
 from dataclasses import dataclass
-from typing import Optional, Tuple, Union
+from typing import Dict, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
-from .utils import download_file, Info
+from .utils import download_file, download_files, Info, cache_exists, load_cache, save_cache
 from ...losses.numpy import smape, mase
 
 # Cell
@@ -100,7 +100,7 @@ class M4:
             Allowed groups: 'Yearly', 'Quarterly', 'Monthly',
                             'Weekly', 'Daily', 'Hourly'.
         cache: bool
-            If `True` saves and loads
+            If `True` saves and loads a columnar numpy cache.
 
         Returns
         -------
@@ -111,12 +111,12 @@ class M4:
             and static variables.
         """
         path = f'{directory}/m4/datasets'
-        file_cache = f'{path}/{group}.p'
+        file_cache = f'{path}/{group}_cache'
 
-        if os.path.exists(file_cache) and cache:
-            df, X_df, S_df = pd.read_pickle(file_cache)
+        if cache_exists(file_cache) and cache:
+            frames = load_cache(file_cache)
 
-            return df, X_df, S_df
+            return frames['Y_df'], frames['X_df'], frames['S_df']
 
         if group == 'Other':
             #Special case.
@@ -158,7 +158,7 @@ class M4:
 
         X_df = None
         if cache:
-            pd.to_pickle((df, X_df, S_df), file_cache)
+            save_cache(file_cache, {'Y_df': df, 'X_df': X_df, 'S_df': S_df})
 
         return df, None, S_df
 
@@ -173,12 +173,47 @@ class M4:
             Directory path to download dataset.
         """
         path = f'{directory}/m4/datasets/'
-        if not os.path.exists(path):
-            for group in M4Info.groups:
-                download_file(path, f'{M4.source_url}/Train/{group}-train.csv')
-                download_file(path, f'{M4.source_url}/Test/{group}-test.csv')
-            download_file(path, f'{M4.source_url}/M4-info.csv')
-            download_file(path, M4.naive2_forecast_url, decompress=True)
+        source_urls = [f'{M4.source_url}/{split.title()}/{group}-{split}.csv' \
+                       for group in M4Info.groups for split in ['train', 'test']]
+        source_urls += [f'{M4.source_url}/M4-info.csv', M4.naive2_forecast_url]
+        decompress = [False] * (len(source_urls) - 1) + [True]
+        # Downloaded files are skipped, so interrupted downloads are resumed
+        download_files(path, source_urls, decompress=decompress)
+
+# Cell
+def _seasonal_naive_scales(y: np.ndarray, indptr: np.ndarray,
+                           seasonality: int, exclude_last: int = 0) -> np.ndarray:
+    """Mean absolute error of the seasonal naive of each series.
+
+    Parameters
+    ----------
+    y: numpy array
+        Values of the series concatenated, shape (n_obs,).
+    indptr: numpy array
+        Start of each series in y plus n_obs, shape (n_series + 1,).
+    seasonality: int
+        Seasonality of the seasonal naive.
+    exclude_last: int
+        Number of last observations of each series to ignore,
+        usually the test horizon.
+
+    Returns
+    -------
+    scales: numpy array
+        Scale of each series, shape (n_series,).
+    """
+    lengths = np.diff(indptr)
+    n_series = len(lengths)
+    series = np.repeat(np.arange(n_series), lengths)
+    position = np.arange(len(y)) - np.repeat(indptr[:-1], lengths)
+    valid = (position >= seasonality) & (position < (lengths - exclude_last)[series])
+
+    errors = np.zeros(len(y))
+    errors[seasonality:] = np.abs(y[seasonality:] - y[:-seasonality])
+    scales = np.bincount(series[valid], weights=errors[valid], minlength=n_series)
+    scales = scales / np.bincount(series[valid], minlength=n_series)
+
+    return scales
 
 # Cell
 class M4Evaluation:
@@ -248,38 +283,67 @@ class M4Evaluation:
             DataFrame with columns OWA, SMAPE, MASE
             and group as index.
         """
-        if isinstance(y_hat, str):
-            y_hat = M4Evaluation.load_benchmark(directory, group, y_hat)
+        return M4Evaluation.evaluate_many(directory, group, {group: y_hat})
 
-        initial = group[0]
+    @staticmethod
+    def evaluate_many(directory: str, group: str,
+                      y_hats: Dict[str, Union[np.ndarray, str]]) -> pd.DataFrame:
+        """Evaluates several forecasts according to M4 methodology.
+
+        The test values and the seasonal naive scales of the MASE
+        are computed once for all the series and shared by all forecasts.
+
+        Parameters
+        ----------
+        directory: str
+            Directory where data will be downloaded.
+        group: str
+            Group name.
+            Allowed groups: 'Yearly', 'Quarterly', 'Monthly',
+                            'Weekly', 'Daily', 'Hourly'.
+        y_hats: Dict[str, Union[np.ndarray, str]]
+            Group forecasts by name as numpy arrays or
+            benchmark urls from
+            https://github.com/Nixtla/m4-forecasts/tree/master/forecasts.
+
+        Returns
+        -------
+        evaluation: pandas dataframe
+            DataFrame with columns OWA, SMAPE, MASE
+            and forecast names as index.
+        """
         class_group = M4Info[group]
         horizon = class_group.horizon
         seasonality = class_group.seasonality
-        path = f'{directory}/m4/datasets'
         y_df, *_ = M4.load(directory, group)
 
-        y_train = y_df.groupby('unique_id')['y']
-        y_train = y_train.apply(lambda x: x.head(-horizon).values)
-        y_train = y_train.values
+        # Series are contiguous and sorted by ds
+        uids = y_df['unique_id'].values
+        y = y_df['y'].values
+        indptr = np.r_[0, np.flatnonzero(uids[1:] != uids[:-1]) + 1, len(y)]
 
-        y_test = y_df.groupby('unique_id')['y']
-        y_test = y_test.tail(horizon)
-        y_test = y_test.values.reshape(-1, horizon)
+        y_test = y[indptr[1:, None] - horizon + np.arange(horizon)]
+        scales = _seasonal_naive_scales(y, indptr, seasonality, exclude_last=horizon)
 
-        naive2 = M4Evaluation.load_benchmark(directory, group)
-        smape_y_hat = smape(y_test, y_hat)
-        smape_naive2 = smape(y_test, naive2)
-
-        mase_y_hat = np.mean([mase(y_test[i], y_hat[i], y_train[i], seasonality)
-                              for i in range(class_group.n_ts)])
-        mase_naive2 = np.mean([mase(y_test[i], naive2[i], y_train[i], seasonality)
-                               for i in range(class_group.n_ts)])
+        def _errors(y_hat):
+            smape_y_hat = smape(y_test, y_hat)
+            mase_y_hat = np.mean(np.mean(np.abs(y_test - y_hat), axis=1) / scales)
 
-        owa = .5 * (mase_y_hat / mase_naive2 + smape_y_hat / smape_naive2)
+            return smape_y_hat, mase_y_hat
 
-        evaluation = pd.DataFrame({'SMAPE': smape_y_hat,
-                                   'MASE': mase_y_hat,
-                                   'OWA': owa},
-                                   index=[group])
+        naive2 = M4Evaluation.load_benchmark(directory, group)
+        smape_naive2, mase_naive2 = _errors(naive2)
+
+        evaluation = []
+        for name, y_hat in y_hats.items():
+            if isinstance(y_hat, str):
+                y_hat = M4Evaluation.load_benchmark(directory, group, y_hat)
+            smape_y_hat, mase_y_hat = _errors(y_hat)
+            owa = .5 * (mase_y_hat / mase_naive2 + smape_y_hat / smape_naive2)
+            evaluation.append({'SMAPE': smape_y_hat,
+                               'MASE': mase_y_hat,
+                               'OWA': owa})
+
+        evaluation = pd.DataFrame(evaluation, index=list(y_hats.keys()))
 
         return evaluation
\ No newline at end of file
@@ -5,12 +5,14 @@ __all__ = ['M5', 'M5Evaluation']
 # Cell
 import os
 from dataclasses import dataclass
-from typing import Optional, Tuple, Union
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
-from .utils import download_file
+from .utils import download_file, cache_exists, load_cache, save_cache
 
 # Cell
 @dataclass
@@ -48,7 +50,7 @@ class M5:
         directory: str
             Directory where data will be downloaded.
         cache: bool
-            If `True` saves and loads.
+            If `True` saves and loads a columnar numpy cache.
 
         Returns
         -------
@@ -61,12 +63,12 @@ class M5:
             and static variables.
         """
         path = f'{directory}/m5/datasets'
-        file_cache = f'{path}/m5.p'
+        file_cache = f'{path}/m5_cache'
 
-        if os.path.exists(file_cache) and cache:
-            Y_df, X_df, S_df = pd.read_pickle(file_cache)
+        if cache_exists(file_cache) and cache:
+            frames = load_cache(file_cache)
 
-            return Y_df, X_df, S_df
+            return frames['Y_df'], frames['X_df'], frames['S_df']
 
         M5.download(directory)
         # Calendar data
@@ -84,76 +86,113 @@ class M5:
                           dtype=cal_dtypes,
                           usecols=list(cal_dtypes.keys()) + ['date'],
                           parse_dates=['date'])
-        cal['d'] = np.arange(cal.shape[0]) + 1
-        cal['d'] = 'd_' + cal['d'].astype('str')
-        cal['d'] = cal['d'].astype('category')
-
         event_cols = [k for k in cal_dtypes if k.startswith('event')]
         for col in event_cols:
             cal[col] = cal[col].cat.add_categories('nan').fillna('nan')
+        n_days = cal.shape[0]
+        # Week index of each day
+        weeks, day_week = np.unique(cal['wm_yr_wk'].values, return_inverse=True)
 
-        # Prices
-        prices_dtypes = {
-            'store_id': 'category',
-            'item_id': 'category',
-            'wm_yr_wk': np.uint16,
-            'sell_price': np.float32
-        }
-
-        prices = pd.read_csv(f'{path}/sell_prices.csv',
-                             dtype=prices_dtypes)
-
-        # Sales
+        # Sales, one row per series and one column per day
         sales_dtypes = {
-            'item_id': prices.item_id.dtype,
+            'item_id': 'category',
             'dept_id': 'category',
             'cat_id': 'category',
             'store_id': 'category',
             'state_id': 'category',
-            **{f'd_{i+1}': np.float32 for i in range(1969)}
+            **{f'd_{i+1}': np.float32 for i in range(n_days)}
         }
-        # Reading train and test sets
         sales_train = pd.read_csv(f'{path}/sales_train_evaluation.csv',
                                   dtype=sales_dtypes)
         sales_test = pd.read_csv(f'{path}/sales_test_evaluation.csv',
                                  dtype=sales_dtypes)
         sales = sales_train.merge(sales_test, how='left',
                                   on=['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id'])
-        sales['id'] = sales[['item_id', 'store_id']].astype(str).agg('_'.join, axis=1).astype('category')
-        # Long format
-        long = sales.melt(id_vars=['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id'],
-                          var_name='d', value_name='y')
-        long['d'] = long['d'].astype(cal.d.dtype)
-        long = long.merge(cal, on=['d'])
-        long = long.merge(prices, on=['store_id', 'item_id', 'wm_yr_wk'])
-        long = long.drop(columns=['d', 'wm_yr_wk'])
-
-        def first_nz_mask(values, index):
-            """Return a boolean mask where the True starts at the first non-zero value."""
-            mask = np.full(values.size, True)
-            for idx, value in enumerate(values):
-                if value == 0:
-                    mask[idx] = False
-                else:
-                    break
-            return mask
-
-        long = long.sort_values(['id', 'date'], ignore_index=True)
-        keep_mask = long.groupby('id')['y'].transform(first_nz_mask, engine='numba')
-        long = long[keep_mask.astype(bool)]
-        long.rename(columns={'id': 'unique_id', 'date': 'ds'}, inplace=True)
-        Y_df = long.filter(items=['unique_id', 'ds', 'y'])
+        del sales_train, sales_test
+        ids = (sales['item_id'].astype(str) + '_' + sales['store_id'].astype(str)).values
+        order = np.argsort(ids, kind='stable')
+        sales = sales.iloc[order].reset_index(drop=True)
+        ids = ids[order]
+        y = sales[[f'd_{i+1}' for i in range(n_days)]].to_numpy(dtype=np.float32)
+
+        # Prices, joined through integer series and week indices
+        prices_dtypes = {
+            'store_id': 'category',
+            'item_id': 'category',
+            'wm_yr_wk': np.uint16,
+            'sell_price': np.float32
+        }
+        prices = pd.read_csv(f'{path}/sell_prices.csv',
+                             dtype=prices_dtypes)
+        item_categories = sales['item_id'].cat.categories
+        store_categories = sales['store_id'].cat.categories
+        n_stores = len(store_categories)
+        series_key = sales['item_id'].cat.codes.values.astype(np.int64) * n_stores \
+                     + sales['store_id'].cat.codes.values
+        key_to_series = np.full(len(item_categories) * n_stores, -1)
+        key_to_series[series_key] = np.arange(sales.shape[0])
+
+        price_items = pd.Categorical(prices['item_id'], categories=item_categories).codes
+        price_stores = pd.Categorical(prices['store_id'], categories=store_categories).codes
+        price_series = np.full(prices.shape[0], -1)
+        known = (price_items >= 0) & (price_stores >= 0)
+        price_series[known] = key_to_series[price_items[known].astype(np.int64) * n_stores \
+                                            + price_stores[known]]
+        price_week = np.searchsorted(weeks, prices['wm_yr_wk'].values)
+        price_week = np.minimum(price_week, len(weeks) - 1)
+        known = (price_series >= 0) & (weeks[price_week] == prices['wm_yr_wk'].values)
+
+        weekly_price = np.full((sales.shape[0], len(weeks)), np.nan, dtype=np.float32)
+        weekly_price[price_series[known], price_week[known]] = prices['sell_price'].values[known]
+        del prices
+        price = weekly_price[:, day_week]
+        del weekly_price
+
+        # Drop leading zeros and days without price
+        keep_mask = np.maximum.accumulate(y != 0, axis=1) & ~np.isnan(price)
+        rows, days = np.nonzero(keep_mask)
+        del keep_mask
+        rows = rows.astype(np.int32)
+        days = days.astype(np.int32)
+
+        unique_id = pd.Categorical.from_codes(rows, categories=ids)
+        ds = cal['date'].values[days]
+        Y_df = pd.DataFrame({'unique_id': unique_id, 'ds': ds, 'y': y[rows, days]})
+        del y
+
+        X_df = {'unique_id': unique_id, 'ds': ds}
+        for col in cal_dtypes:
+            if col != 'wm_yr_wk':
+                X_df[col] = cal[col].values[days]
+        X_df['sell_price'] = price[rows, days]
+        X_df = pd.DataFrame(X_df)
+        del price
+
         cats = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
-        S_df = long.filter(items=['unique_id'] + cats)
-        S_df = S_df.drop_duplicates(ignore_index=True)
-        X_df = long.drop(columns=['y'] + cats)
+        kept_series = np.unique(rows)
+        S_df = {'unique_id': pd.Categorical.from_codes(kept_series, categories=ids)}
+        for col in cats:
+            S_df[col] = sales[col].values[kept_series]
+        S_df = pd.DataFrame(S_df)
 
         if cache:
-            pd.to_pickle((Y_df, X_df, S_df), file_cache)
+            save_cache(file_cache, {'Y_df': Y_df, 'X_df': X_df, 'S_df': S_df})
 
         return Y_df, X_df, S_df
 
 # Cell
+class _HashedCategories:
+    """Categories hashed by their content, used as key of the summing matrices cache."""
+    def __init__(self, categories: pd.DataFrame):
+        self.categories = categories
+        self.key = pd.util.hash_pandas_object(categories, index=False).values.tobytes()
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _HashedCategories) and self.key == other.key
+
 class M5Evaluation:
 
     levels: dict =  dict(
@@ -222,6 +261,50 @@ class M5Evaluation:
 
         return benchmark
 
+    @staticmethod
+    def summing_matrix(categories: pd.DataFrame) -> Tuple[sparse.csr_matrix, pd.MultiIndex]:
+        """
+        Sparse matrix that aggregates the 30_490 series into the 42_840 of the hierarchy.
+        The matrices of the last categories are cached.
+
+        Parameters
+        ----------
+        categories: pd.DataFrame
+            Categories of the bottom series with columns
+            ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id'].
+
+        Returns
+        -------
+        summing_matrix: sparse.csr_matrix
+            Summing matrix of shape (n_aggregated, n_series).
+        index: pd.MultiIndex
+            Index of the aggregated series with levels
+            ['Level_id', 'Agg_Level_1', 'Agg_Level_2'].
+        """
+        cat_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+        return M5Evaluation._summing_matrix(_HashedCategories(categories[cat_cols].astype(str)))
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _summing_matrix(hashed: '_HashedCategories') -> Tuple[sparse.csr_matrix, pd.MultiIndex]:
+        categories = hashed.categories.assign(total='Total')
+        n_series = categories.shape[0]
+        rows, index = [], []
+        for level, agg in M5Evaluation.levels.items():
+            groups = categories.groupby(agg, sort=True)
+            rows.append(len(index) + groups.ngroup().values)
+            for labels in groups.size().index:
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                index.append((level, *labels, *['X'] * (2 - len(agg))))
+
+        rows = np.concatenate(rows)
+        cols = np.tile(np.arange(n_series), len(M5Evaluation.levels))
+        summing_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                           shape=(len(index), n_series))
+        index = pd.MultiIndex.from_tuples(index, names=['Level_id', 'Agg_Level_1', 'Agg_Level_2'])
+
+        return summing_matrix, index
+
     @staticmethod
     def aggregate_levels(y_hat: pd.DataFrame,
                          categories: pd.DataFrame = None) -> pd.DataFrame:
@@ -240,19 +323,10 @@ class M5Evaluation:
         df_agg: pd.DataFrame
             Aggregated forecasts as wide pandas dataframe with columns ['unique_id'].
         """
-        y_hat_cat = y_hat.assign(total='Total')
-
-        df_agg = []
-        for level, agg in M5Evaluation.levels.items():
-            df = y_hat_cat.groupby(agg).sum().reset_index()
-            renamer = dict(zip(agg, ['Agg_Level_1', 'Agg_Level_2']))
-            df.rename(columns=renamer, inplace=True)
-            df.insert(0, 'Level_id', level)
-            df_agg.append(df)
-        df_agg = pd.concat(df_agg)
-        df_agg = df_agg.fillna('X')
-        df_agg = df_agg.set_index(['Level_id', 'Agg_Level_1', 'Agg_Level_2'])
-        df_agg.columns = [f'd_{i+1}' for i in range(df_agg.shape[1])]
+        summing_matrix, index = M5Evaluation.summing_matrix(y_hat)
+        values = y_hat.select_dtypes('number').values
+        df_agg = pd.DataFrame(summing_matrix @ values, index=index,
+                              columns=[f'd_{i+1}' for i in range(values.shape[1])])
 
         return df_agg
 
@@ -281,9 +355,36 @@ class M5Evaluation:
             DataFrame with columns OWA, SMAPE, MASE
             and group as index.
         """
-        if isinstance(y_hat, str):
-            y_hat = M5Evaluation.load_benchmark(directory, y_hat, validation)
+        return M5Evaluation.evaluate_many(directory, {'wrmsse': y_hat}, validation)
 
+    @staticmethod
+    def evaluate_many(directory: str,
+                      y_hats: Dict[str, Union[pd.DataFrame, str]],
+                      validation: bool = False) -> pd.DataFrame:
+        """Evaluates several forecasts with the WRMSSE.
+
+        Sales, test values, scales and weights are aggregated once
+        and shared by all forecasts.
+
+        Parameters
+        ----------
+        directory: str
+            Directory where data will be downloaded.
+        y_hats: Dict[str, Union[pd.DataFrame, str]]
+            Forecasts by name as wide pandas dataframes with columns
+            ['unique_id'] and forecasts or
+            benchmark urls from
+            https://github.com/Nixtla/m5-forecasts/tree/main/forecasts.
+        validation: bool
+            Wheter perform validation evaluation.
+            Default False, return test evaluation.
+
+        Returns
+        -------
+        evaluation: pandas dataframe
+            DataFrame with one column per forecast
+            and the total and levels as index.
+        """
         M5.download(directory)
         path = f'{directory}/m5/datasets'
         if validation:
@@ -295,32 +396,51 @@ class M5Evaluation:
             sales = pd.read_csv(f'{path}/sales_train_evaluation.csv')
             y_test = pd.read_csv(f'{path}/sales_test_evaluation.csv')
 
+        def _keys(df):
+            return (df['item_id'].astype(str) + '_' + df['store_id'].astype(str)).values
+
+        sales_keys = pd.Index(_keys(sales))
+        def _values(df):
+            # Bottom values in the order of sales
+            order = pd.Index(_keys(df)).get_indexer(sales_keys)
+            if (order < 0).any():
+                raise Exception('Forecasts do not contain all the M5 series')
+            return df.select_dtypes('number').values[order]
+
         # sales
-        sales = M5Evaluation.aggregate_levels(sales)
-        def scale(x):
-            x = x.values
-            x = x[np.argmax(x!=0):]
-            scale = ((x[1:] - x[:-1]) ** 2).mean()
-            return scale
-        scales = sales.agg(scale, 1).rename('scale').reset_index()
+        summing_matrix, index = M5Evaluation.summing_matrix(sales)
+        scales = _squared_naive_scales(summing_matrix @ sales.select_dtypes('number').values)
+
+        weights = weights.set_index(['Level_id', 'Agg_Level_1', 'Agg_Level_2'])
+        weights = weights['weight'].reindex(index).values
+        level_codes, levels = pd.factorize(index.get_level_values('Level_id'))
 
         # y_test
-        y_test = M5Evaluation.aggregate_levels(y_test)
-
-        #y_hat
-        y_hat = M5Evaluation.aggregate_levels(y_hat)
-
-        score = (y_test - y_hat) ** 2
-        score = score.mean(1)
-        score = score.rename('rmse').reset_index()
-        score = score.merge(weights, how='left',
-                            on=['Level_id', 'Agg_Level_1', 'Agg_Level_2'])
-        score = score.merge(scales, how='left',
-                            on=['Level_id', 'Agg_Level_1', 'Agg_Level_2'])
-        score['wrmsse'] = (score['rmse'] / score['scale']).pow(1 / 2) * score['weight']
-        score = score.groupby('Level_id')[['wrmsse']].sum()
-        score = score.loc[M5Evaluation.levels.keys()]
-        total = score.mean().rename('Total').to_frame().T
-        score = pd.concat([total, score])
-
-        return score
\ No newline at end of file
+        y_test = _values(y_test)
+
+        evaluation = {}
+        for name, y_hat in y_hats.items():
+            if isinstance(y_hat, str):
+                y_hat = M5Evaluation.load_benchmark(directory, y_hat, validation)
+            # Aggregation is linear, errors are aggregated directly
+            rmse = summing_matrix @ (y_test - _values(y_hat))
+            rmse = (rmse ** 2).mean(1)
+            wrmsse = np.sqrt(rmse / scales) * weights
+            wrmsse = np.bincount(level_codes, weights=np.nan_to_num(wrmsse),
+                                 minlength=len(levels))
+            evaluation[name] = np.r_[wrmsse.mean(), wrmsse]
+
+        evaluation = pd.DataFrame(evaluation, index=['Total', *levels])
+
+        return evaluation
+
+# Cell
+def _squared_naive_scales(x: np.ndarray) -> np.ndarray:
+    """Mean squared error of the naive forecast of each row, ignoring leading zeros."""
+    nonzero = x != 0
+    started = np.maximum.accumulate(nonzero, axis=1) | ~nonzero.any(1, keepdims=True)
+    valid = started[:, :-1]
+    errors = (x[:, 1:] - x[:, :-1]) ** 2
+    scales = (errors * valid).sum(1) / valid.sum(1)
+
+    return scales
\ No newline at end of file
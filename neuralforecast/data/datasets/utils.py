@@ -1,15 +1,19 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/data_datasets__utils.ipynb (unless otherwise specified).
 
-__all__ = ['logger', 'download_file', 'Info', 'TimeSeriesDataclass', 'get_holiday_dates', 'holiday_kernel',
+__all__ = ['logger', 'extract_file', 'extract_files', 'download_file', 'download_files', 'Info', 'TimeSeriesDataclass',
+           'save_cache', 'cache_exists', 'load_cache', 'get_holiday_dates', 'holiday_kernel',
            'create_calendar_variables', 'create_us_holiday_distance_variables', 'US_FEDERAL_HOLIDAYS']
 
 # Cell
+import hashlib
+import json
 import logging
 import requests
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -20,9 +24,77 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cell
-def download_file(directory: str, source_url: str, decompress: bool = False) -> None:
+def _file_checksum(filepath: Path, block_size: int = 1024 * 1024) -> str:
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), b''):
+            sha256.update(data)
+
+    return sha256.hexdigest()
+
+def extract_file(filepath: Union[str, Path], directory: Union[str, Path]) -> None:
+    """Extracts compressed file inside directory.
+
+    Parameters
+    ----------
+    filepath: str, Path
+        Path of the compressed file.
+    directory: str, Path
+        Directory where the content will be extracted.
+    """
+    filepath = Path(filepath)
+    if '.zip' in filepath.suffix:
+        logger.info('Decompressing zip file...')
+        with zipfile.ZipFile(filepath, 'r') as zip_ref:
+            zip_ref.extractall(directory)
+    else:
+        from patoolib import extract_archive
+        extract_archive(str(filepath), outdir=str(directory))
+    _extracted_marker(filepath, directory).touch()
+    logger.info(f'Successfully decompressed {filepath}')
+
+def _extracted_marker(filepath: Path, directory: Union[str, Path]) -> Path:
+    """Empty file written in directory once filepath is extracted."""
+    return Path(directory) / f'.{Path(filepath).name}.extracted'
+
+def _is_extracted(filepath: Path, directory: Path) -> bool:
+    """Whether every member of a zip file exists in directory,
+    other archives are extracted if their marker exists."""
+    if '.zip' not in filepath.suffix:
+        return _extracted_marker(filepath, directory).exists()
+    with zipfile.ZipFile(filepath, 'r') as zip_ref:
+        return all((directory / name).exists() for name in zip_ref.namelist())
+
+def extract_files(filepaths: List[Union[str, Path]],
+                  directories: Union[str, Path, List[Union[str, Path]]],
+                  n_jobs: int = 8) -> None:
+    """Extracts compressed files in parallel.
+
+    Parameters
+    ----------
+    filepaths: List[str]
+        Paths of the compressed files.
+    directories: str, Path, List
+        Directory where the files will be extracted, or one directory per file.
+    n_jobs: int
+        Number of files extracted concurrently.
+    """
+    if not isinstance(directories, list):
+        directories = [directories] * len(filepaths)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(executor.map(extract_file, filepaths, directories))
+
+def download_file(directory: str, source_url: str, decompress: bool = False,
+                  checksum: Optional[str] = None,
+                  block_size: int = 1024 * 1024) -> Path:
     """Download data from source_ulr inside directory.
 
+    The file is streamed into a `.part` file which is renamed once
+    completed, an interrupted download is resumed with an HTTP range request.
+    Already downloaded files are not downloaded again, but they are
+    extracted again with `decompress` if their content is missing.
+
     Parameters
     ----------
     directory: str, Path
@@ -31,6 +103,15 @@ def download_file(directory: str, source_url: str, decompress: bool = False) ->
         URL where data is hosted.
     decompress: bool
         Wheter decompress downloaded file. Default False.
+    checksum: str, optional
+        Expected sha256 hex digest of the file.
+    block_size: int
+        Size in bytes of the streamed blocks. Default 1 MiB.
+
+    Returns
+    -------
+    filepath: Path
+        Path of the downloaded file.
     """
     if isinstance(directory, str):
         directory = Path(directory)
@@ -43,37 +124,99 @@ def download_file(directory: str, source_url: str, decompress: bool = False) ->
         filename = Path(filename).stem + ".zip"
 
     filepath = Path(f'{directory}/{filename}')
+    if filepath.exists():
+        logger.info(f'{filename} already downloaded.')
+        if decompress and not _is_extracted(filepath, directory):
+            extract_file(filepath, directory)
+        return filepath
+
+    partpath = Path(f'{filepath}.part')
+    downloaded = partpath.stat().st_size if partpath.exists() else 0
 
     # Streaming, so we can iterate over the response.
-    headers = {'User-Agent': 'Mozilla/5.0'}
+    # Identity encoding keeps content-length and ranges in bytes of the file
+    headers = {'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'identity'}
+    if downloaded > 0:
+        headers['Range'] = f'bytes={downloaded}-'
     r = requests.get(source_url, stream=True, headers=headers)
-    # Total size in bytes.
-    total_size = int(r.headers.get('content-length', 0))
-    block_size = 1024 #1 Kibibyte
-
-    t = tqdm(total=total_size, unit='iB', unit_scale=True)
-    with open(filepath, 'wb') as f:
-        for data in r.iter_content(block_size):
-            t.update(len(data))
-            f.write(data)
-            f.flush()
-    t.close()
-
-    if total_size != 0 and t.n != total_size:
-        logger.error('ERROR, something went wrong downloading data')
-
-    size = filepath.stat().st_size
+
+    if r.status_code == 416:
+        # The part file already has all the content
+        total_size = downloaded
+    else:
+        r.raise_for_status()
+        if r.status_code != 206:
+            # Server ignored the range, start over
+            downloaded = 0
+        # Total size in bytes.
+        total_size = downloaded + int(r.headers.get('content-length', 0))
+
+        t = tqdm(total=total_size, initial=downloaded, unit='iB', unit_scale=True)
+        with open(partpath, 'ab' if downloaded > 0 else 'wb') as f:
+            for data in r.iter_content(block_size):
+                t.update(len(data))
+                f.write(data)
+        t.close()
+
+    size = partpath.stat().st_size
+    if total_size != 0 and size != total_size:
+        # The part file is kept, the next call resumes it
+        raise Exception(f'Incomplete download of {filename}, {size} of {total_size} bytes.')
+
+    if checksum is not None and _file_checksum(partpath) != checksum:
+        partpath.unlink()
+        raise Exception(f'Checksum mismatch for {filename}, corrupted file removed.')
+
+    partpath.rename(filepath)
     logger.info(f'Successfully downloaded {filename}, {size}, bytes.')
 
     if decompress:
-        if '.zip' in filepath.suffix:
-            logger.info('Decompressing zip file...')
-            with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                zip_ref.extractall(directory)
-        else:
-            from patoolib import extract_archive
-            extract_archive(filepath, outdir=directory)
-        logger.info(f'Successfully decompressed {filepath}')
+        extract_file(filepath, directory)
+
+    return filepath
+
+def download_files(directory: str, source_urls: List[str],
+                   decompress: Union[bool, List[bool]] = False,
+                   checksums: Optional[List[Optional[str]]] = None,
+                   n_jobs: int = 8,
+                   block_size: int = 1024 * 1024) -> List[Path]:
+    """Downloads several files concurrently inside directory.
+
+    Parameters
+    ----------
+    directory: str, Path
+        Custom directory where data will be downloaded.
+    source_urls: List[str]
+        URLs where data is hosted.
+    decompress: bool, List[bool]
+        Wheter decompress downloaded files, or one flag per file.
+    checksums: List[str], optional
+        Expected sha256 hex digest of each file.
+    n_jobs: int
+        Number of concurrent downloads.
+    block_size: int
+        Size in bytes of the streamed blocks. Default 1 MiB.
+
+    Returns
+    -------
+    filepaths: List[Path]
+        Paths of the downloaded files.
+    """
+    n_files = len(source_urls)
+    if not isinstance(decompress, list):
+        decompress = [decompress] * n_files
+    if checksums is None:
+        checksums = [None] * n_files
+
+    def _download(args):
+        source_url, decompress_file, checksum = args
+        return download_file(directory, source_url, decompress=decompress_file,
+                             checksum=checksum, block_size=block_size)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        filepaths = list(executor.map(_download, zip(source_urls, decompress, checksums)))
+
+    return filepaths
 
 # Cell
 @dataclass
@@ -128,6 +271,115 @@ class TimeSeriesDataclass:
     idx_categorical_static: Optional[List] = None
     group: Union[str, List[str]] = None
 
+# Cell
+def _column_file(directory: Path, frame: str, col: str, suffix: str = '') -> Path:
+    return directory / f'{frame}.{col}{suffix}.npy'
+
+def save_cache(directory: Union[str, Path],
+               frames: Dict[str, Optional[pd.DataFrame]]) -> None:
+    """Saves DataFrames in a columnar numpy cache.
+
+    Parameters
+    ----------
+    directory: str, Path
+        Directory of the cache.
+    frames: Dict[str, pd.DataFrame]
+        DataFrames to cache by name, None values are allowed.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    meta = {}
+    for frame, df in frames.items():
+        if df is None:
+            meta[frame] = None
+            continue
+
+        kinds = {}
+        for col in df.columns:
+            values = df[col]
+            if pd.api.types.is_datetime64_dtype(values):
+                kinds[col] = 'datetime'
+                np.save(_column_file(directory, frame, col), values.values.view(np.int64))
+            elif isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+                kinds[col] = 'category' if isinstance(values.dtype, pd.CategoricalDtype) else 'object'
+                # Missing values are stored as code -1
+                values = values.astype('category')
+                categories = values.cat.categories.values
+                # Only string categories are stored as str, other objects keep their type
+                if categories.dtype == object and all(isinstance(c, str) for c in categories):
+                    categories = categories.astype(str)
+                np.save(_column_file(directory, frame, col), values.cat.codes.values)
+                np.save(_column_file(directory, frame, col, '.categories'), categories)
+            else:
+                kinds[col] = 'numeric'
+                np.save(_column_file(directory, frame, col), values.values)
+        meta[frame] = {'columns': list(map(str, df.columns)), 'kinds': kinds}
+
+    # Meta is written last, it flags a complete cache
+    with open(directory / 'meta.json', 'w') as f:
+        json.dump(meta, f)
+
+def cache_exists(directory: Union[str, Path]) -> bool:
+    """Whether directory contains a complete cache."""
+    return (Path(directory) / 'meta.json').exists()
+
+def load_cache(directory: Union[str, Path],
+               mmap: bool = False,
+               as_arrays: bool = False) -> Dict[str, Optional[Union[pd.DataFrame, Dict[str, np.ndarray]]]]:
+    """Loads DataFrames saved with save_cache.
+
+    Parameters
+    ----------
+    directory: str, Path
+        Directory of the cache.
+    mmap: bool
+        Whether memory map the column files instead of reading them.
+        Memory mapped DataFrames are read-only.
+    as_arrays: bool
+        If True returns for each frame a dictionary of raw column arrays,
+        integer codes for categorical columns (with categories in
+        `'{col}.categories'`) and int64 timestamps for datetime columns,
+        ready to be sliced into the dataset tensors without pandas.
+
+    Returns
+    -------
+    frames: Dict
+        DataFrames (or dictionaries of arrays) by name.
+    """
+    directory = Path(directory)
+    with open(directory / 'meta.json') as f:
+        meta = json.load(f)
+    mmap_mode = 'r' if mmap else None
+
+    frames = {}
+    for frame, frame_meta in meta.items():
+        if frame_meta is None:
+            frames[frame] = None
+            continue
+
+        columns = {}
+        for col in frame_meta['columns']:
+            kind = frame_meta['kinds'][col]
+            values = np.load(_column_file(directory, frame, col), mmap_mode=mmap_mode)
+            if kind in ('category', 'object'):
+                categories = np.load(_column_file(directory, frame, col, '.categories'),
+                                     allow_pickle=True)
+                if as_arrays:
+                    columns[f'{col}.categories'] = categories
+                elif kind == 'category':
+                    values = pd.Categorical.from_codes(values, categories=categories)
+                else:
+                    # Code -1 is restored as NaN
+                    values = pd.Categorical.from_codes(values, categories=categories).astype(object)
+            elif kind == 'datetime' and not as_arrays:
+                values = np.asarray(values).view('datetime64[ns]')
+            columns[col] = values
+
+        frames[frame] = columns if as_arrays else pd.DataFrame(columns, copy=False)
+
+    return frames
+
 # Cell
 import pandas as pd
 from pandas.tseries.holiday import (
@@ -154,24 +406,32 @@ US_FEDERAL_HOLIDAYS = {'new_year': Holiday("New Years Day", month=1, day=1, obse
                        'christmas': Holiday("Christmas", month=12, day=25, observance=nearest_workday)}
 
 def get_holiday_dates(holiday, dates):
-    start_date = min(dates) + pd.DateOffset(days=-366)
-    end_date = max(dates) + pd.DateOffset(days=366)
+    start_date = pd.Timestamp(np.min(dates)) + pd.DateOffset(days=-366)
+    end_date = pd.Timestamp(np.max(dates)) + pd.DateOffset(days=366)
     holiday_calendar = AbstractHolidayCalendar(rules=[US_FEDERAL_HOLIDAYS[holiday]])
     holiday_dates = holiday_calendar.holidays(start=start_date, end=end_date)
     return np.array(holiday_dates)
 
 def holiday_kernel(holiday, dates):
     # Get holidays around dates
-    dates = pd.DatetimeIndex(dates)
-    dates_np = np.array(dates).astype('datetime64[D]')
-    holiday_dates = get_holiday_dates(holiday, dates)
-    holiday_dates_np = np.array(pd.DatetimeIndex(holiday_dates)).astype('datetime64[D]')
+    dates_np = np.array(pd.DatetimeIndex(dates)).astype('datetime64[D]')
+    holiday_dates = get_holiday_dates(holiday, dates_np)
+    holiday_dates_np = np.sort(holiday_dates.astype('datetime64[D]'))
+
+    return _holiday_distance(dates_np, holiday_dates_np)
+
+def _holiday_distance(dates_np: np.ndarray, holiday_dates_np: np.ndarray) -> np.ndarray:
+    """Day distance of dates to the nearest of the sorted holiday dates."""
+    # Nearest holiday is the last one before or the first one after each date,
+    # ties go to the previous holiday
+    next_idx = np.searchsorted(holiday_dates_np, dates_np, side='left')
+    prev_idx = np.clip(next_idx - 1, 0, len(holiday_dates_np) - 1)
+    next_idx = np.clip(next_idx, 0, len(holiday_dates_np) - 1)
 
     # Compute day distance to holiday
-    nearest_holiday_idx = np.expand_dims(dates_np, axis=1) - np.expand_dims(holiday_dates_np, axis=0)
-    nearest_holiday_idx = np.argmin(np.abs(nearest_holiday_idx), axis=1)
-    nearest_holiday = pd.DatetimeIndex([holiday_dates[idx] for idx in nearest_holiday_idx])
-    holiday_diff = (dates - nearest_holiday).days.values
+    prev_diff = (dates_np - holiday_dates_np[prev_idx]).astype(np.int64)
+    next_diff = (dates_np - holiday_dates_np[next_idx]).astype(np.int64)
+    holiday_diff = np.where(np.abs(prev_diff) <= np.abs(next_diff), prev_diff, next_diff)
     return holiday_diff
 
 def create_calendar_variables(X_df: pd.DataFrame):
@@ -181,8 +441,9 @@ def create_calendar_variables(X_df: pd.DataFrame):
     return X_df
 
 def create_us_holiday_distance_variables(X_df: pd.DataFrame):
-    dates = X_df.ds.dt.date
+    # Distances only depend on the date, compute them once per unique date
+    dates, dates_idx = np.unique(X_df.ds.values.astype('datetime64[D]'), return_inverse=True)
     for holiday in US_FEDERAL_HOLIDAYS.keys():
-        X_df[f'holiday_dist_{holiday}'] = holiday_kernel(holiday=holiday,
-                                                         dates=dates)
+        holiday_dist = holiday_kernel(holiday=holiday, dates=dates)
+        X_df[f'holiday_dist_{holiday}'] = holiday_dist[dates_idx]
     return X_df
\ No newline at end of file
@@ -13,6 +13,8 @@ import torch as t
 from fastcore.foundation import patch
 from torch.utils.data import Dataset
 
+from .calendar import CalendarFeatures
+
 # Cell
 class BaseDataset(Dataset):
     """
@@ -30,6 +32,7 @@ class BaseDataset(Dataset):
                  input_size: int = None,
                  output_size: int = None,
                  complete_windows: bool = True,
+                 calendar_cols: Optional[List] = None,
                  verbose: bool = False) -> 'BaseDataset':
         """
         Parameters
@@ -60,6 +63,9 @@ class BaseDataset(Dataset):
         complete_windows: bool
             Whether consider only windows with sample_mask equal to output_size.
             Default False.
+        calendar_cols: list
+            Calendar features computed from the timestamps of each batch
+            and appended to X, see CALENDAR_GENERATORS.
         verbose: bool
             Wheter or not log outputs.
         """
@@ -86,26 +92,6 @@ class BaseDataset(Dataset):
                                           is_test=is_test,
                                           ds_in_test=ds_in_test)
 
-        n_ds  = len(mask_df)
-        n_avl = mask_df.available_mask.sum()
-        n_ins = mask_df.sample_mask.sum()
-        n_out = len(mask_df) - mask_df.sample_mask.sum()
-
-        avl_prc = np.round((100 * n_avl) / n_ds, 2)
-        ins_prc = np.round((100 * n_ins) / n_ds, 2)
-        out_prc = np.round((100 * n_out) / n_ds, 2)
-        if self.verbose:
-            logging.info('Train Validation splits\n')
-            if len(mask_df.unique_id.unique()) < 10:
-                logging.info(mask_df.groupby(['unique_id', 'sample_mask']).agg({'ds': ['min', 'max']}))
-            else:
-                logging.info(mask_df.groupby(['sample_mask']).agg({'ds': ['min', 'max']}))
-            dataset_info  = f'\nTotal data \t\t\t{n_ds} time stamps \n'
-            dataset_info += f'Available percentage={avl_prc}, \t{n_avl} time stamps \n'
-            dataset_info += f'Insample  percentage={ins_prc}, \t{n_ins} time stamps \n'
-            dataset_info += f'Outsample percentage={out_prc}, \t{n_out} time stamps \n'
-            logging.info(dataset_info)
-
         self.ts_data, self.s_matrix, self.meta_data, self.t_cols, self.s_cols \
                          = self._df_to_lists(Y_df=Y_df, S_df=S_df, X_df=X_df, mask_df=mask_df)
 
@@ -130,6 +116,12 @@ class BaseDataset(Dataset):
         # numpy ts_tensor of shape (n_series, n_channels, max_len) n_channels = t_cols + masks
         self.len_series, self.ts_tensor = self._create_tensor()
 
+        # Calendar features are not stored, they are computed for each batch
+        self.calendar = CalendarFeatures(calendar_cols) if calendar_cols else None
+        if self.calendar is not None:
+            self.ds_grid, self.ds_end_idxs = self._create_calendar_index()
+            self.n_x += self.calendar.n_features
+
         # Defining sampleable time series
         self.ts_idxs = np.arange(self.n_series)
         self.sampleable_ts_idxs: np.ndarray
@@ -137,6 +129,12 @@ class BaseDataset(Dataset):
 
         self._define_sampleable_ts_idxs()
 
+        # Mask statistics are computed lazily from prefix sums, see describe
+        self._mask_cumsum: Optional[t.Tensor] = None
+        self._description: Optional[pd.DataFrame] = None
+        if self.verbose:
+            self._log_description()
+
 # Cell
 @patch
 def _define_sampleable_ts_idxs(self: BaseDataset) -> None:
@@ -249,6 +247,63 @@ def _create_tensor(self: BaseDataset) -> Tuple[np.array, t.Tensor]:
 
     return len_series, ts_tensor
 
+# Cell
+@patch
+def _create_calendar_index(self: BaseDataset) -> Tuple[np.ndarray, np.ndarray]:
+    """Creates the grid of timestamps used by the calendar features.
+
+    The timestamp of position p of the time series i in ts_tensor is
+    ds_grid[ds_end_idxs[i] - (max_len - 1 - p)], so each time series must
+    be contiguous in the grid of the panel. Time series with missing
+    timestamps, or offset from the others, raise an exception.
+
+    Returns
+    -------
+    Tuple of two elements:
+        - Sorted unique timestamps of the panel.
+        - Index in the grid of the last timestamp of each time series.
+    """
+    ds_grid = np.concatenate([meta[:, 1] for meta in self.meta_data])
+    ds_grid = np.unique(ds_grid.astype('datetime64[ns]'))
+    first_ds = np.array([meta[0, 1] for meta in self.meta_data], dtype='datetime64[ns]')
+    last_ds = np.array([meta[-1, 1] for meta in self.meta_data], dtype='datetime64[ns]')
+    ds_start_idxs = np.searchsorted(ds_grid, first_ds)
+    ds_end_idxs = np.searchsorted(ds_grid, last_ds)
+
+    # A contiguous time series spans as many grid stamps as its length
+    gaps = (ds_end_idxs - ds_start_idxs + 1) != np.array([len(meta) for meta in self.meta_data])
+    if gaps.any():
+        unique_ids = [meta[0, 0] for meta, gap in zip(self.meta_data, gaps) if gap]
+        raise Exception(f'Calendar features need time series without missing timestamps '
+                        f'in the grid of the panel, check unique_ids {unique_ids[:5]}.')
+
+    return ds_grid, ds_end_idxs
+
+@patch
+def _get_calendar_tensor(self: BaseDataset,
+                         ts_idxs: np.ndarray,
+                         positions: np.ndarray) -> t.Tensor:
+    """Computes calendar features for positions of ts_tensor.
+
+    Parameters
+    ----------
+    ts_idxs: np.ndarray
+        Indexes of time series of shape (n,).
+    positions: np.ndarray
+        Positions in ts_tensor of shape (n, len) or (len,).
+        Padded positions outside of the grid take the closest timestamp.
+
+    Returns
+    -------
+    Tensor of shape (n, n_calendar, len).
+    """
+    ts_idxs = np.asarray(ts_idxs).reshape(-1, 1)
+    grid_idxs = self.ds_end_idxs[ts_idxs] - (self.max_len - 1 - positions)
+    grid_idxs = np.clip(grid_idxs, 0, len(self.ds_grid) - 1)
+    calendar = self.calendar.transform(self.ds_grid[grid_idxs])
+
+    return t.Tensor(calendar).permute(0, 2, 1)
+
 # Cell
 @patch
 def _get_f_idxs(self: BaseDataset,
@@ -328,6 +383,94 @@ def get_frequency(self: BaseDataset) -> str:
     """Gets infered frequency."""
     return self.frequency
 
+# Cell
+@patch
+def _get_mask_cumsum(self: BaseDataset) -> t.Tensor:
+    """Gets per series prefix sums of the masks.
+
+    Returns
+    -------
+    Tensor of shape (n_series, 2, max_len) with the cumulative sums
+    of available_mask and sample_mask, computed once and cached.
+    """
+    if self._mask_cumsum is None:
+        mask_idxs = [self.t_cols.index('available_mask'), self.t_cols.index('sample_mask')]
+        self._mask_cumsum = t.cumsum(self.ts_tensor[:, mask_idxs, :], dim=-1)
+
+    return self._mask_cumsum
+
+@patch
+def describe(self: BaseDataset) -> pd.DataFrame:
+    """Summarizes the masks of each time series.
+
+    Returns
+    -------
+    DataFrame with one row per time series and columns
+    ['unique_id', 'n_ds', 'n_available', 'n_insample', 'n_outsample',
+     'insample_start', 'insample_end', 'outsample_start', 'outsample_end'].
+    """
+    if self._description is not None:
+        return self._description
+
+    cumsum = self._get_mask_cumsum()
+    n_avl = cumsum[:, 0, -1].numpy()
+    n_ins = cumsum[:, 1, -1].numpy()
+
+    # First and last insample and outsample stamps, relative to the start of each series
+    sample_cumsum = cumsum[:, 1, :].numpy()
+    padding = self.max_len - self.len_series
+    n_out = self.len_series - n_ins
+    # Left padded positions count no stamps
+    out_cumsum = np.maximum(np.arange(1, self.max_len + 1)[None, :] - padding[:, None], 0) - sample_cumsum
+
+    def stamps(idxs, has_stamps):
+        return [meta[idx, 1] if has else pd.NaT
+                for meta, idx, has in zip(self.meta_data, idxs - padding, has_stamps)]
+
+    ins_start = stamps(np.argmax(sample_cumsum > 0, axis=1), n_ins > 0)
+    ins_end = stamps(np.argmax(sample_cumsum >= n_ins[:, None], axis=1), n_ins > 0)
+    out_start = stamps(np.argmax(out_cumsum > 0, axis=1), n_out > 0)
+    out_end = stamps(np.argmax(out_cumsum >= n_out[:, None], axis=1), n_out > 0)
+
+    self._description = pd.DataFrame({'unique_id': [meta[0, 0] for meta in self.meta_data],
+                                      'n_ds': self.len_series,
+                                      'n_available': n_avl,
+                                      'n_insample': n_ins,
+                                      'n_outsample': n_out,
+                                      'insample_start': ins_start,
+                                      'insample_end': ins_end,
+                                      'outsample_start': out_start,
+                                      'outsample_end': out_end})
+
+    return self._description
+
+@patch
+def _log_description(self: BaseDataset) -> None:
+    """Logs train validation splits from describe."""
+    description = self.describe()
+
+    n_ds = description['n_ds'].sum()
+    n_avl = description['n_available'].sum()
+    n_ins = description['n_insample'].sum()
+    n_out = description['n_outsample'].sum()
+
+    avl_prc = np.round((100 * n_avl) / n_ds, 2)
+    ins_prc = np.round((100 * n_ins) / n_ds, 2)
+    out_prc = np.round((100 * n_out) / n_ds, 2)
+
+    logging.info('Train Validation splits\n')
+    if self.n_series < 10:
+        logging.info(description.set_index('unique_id')[['insample_start', 'insample_end',
+                                                         'outsample_start', 'outsample_end']])
+    else:
+        logging.info(description.agg({'insample_start': 'min', 'insample_end': 'max',
+                                      'outsample_start': 'min', 'outsample_end': 'max'}))
+    dataset_info  = f'\nTotal data \t\t\t{n_ds} time stamps \n'
+    dataset_info += f'Available percentage={avl_prc}, \t{n_avl} time stamps \n'
+    dataset_info += f'Insample  percentage={ins_prc}, \t{n_ins} time stamps \n'
+    dataset_info += f'Outsample percentage={out_prc}, \t{n_out} time stamps \n'
+    logging.info(dataset_info)
+
 # Cell
 def get_default_mask_df(Y_df: pd.DataFrame,
                         ds_in_test: int,
@@ -386,6 +529,7 @@ class TimeSeriesDataset(BaseDataset):
                  ds_in_test: int = 0,
                  is_test: bool = False,
                  complete_windows: bool = True,
+                 calendar_cols: Optional[List] = None,
                  verbose: bool = False) -> 'TimeSeriesDataset':
         """
         Parameters
@@ -413,6 +557,9 @@ class TimeSeriesDataset(BaseDataset):
         is_test: bool
             Only used when mask_df = None.
             Wheter target time series belongs to test set.
+        calendar_cols: list
+            Calendar features computed from the timestamps of each batch
+            and appended to X, see CALENDAR_GENERATORS.
         verbose: bool
             Wheter or not log outputs.
         """
@@ -421,7 +568,7 @@ class TimeSeriesDataset(BaseDataset):
                                                 X_df=X_df, S_df=S_df, f_cols=f_cols,
                                                 mask_df=mask_df, ds_in_test=ds_in_test,
                                                 is_test=is_test, complete_windows=complete_windows,
-                                                verbose=verbose)
+                                                calendar_cols=calendar_cols, verbose=verbose)
 
 # Cell
 @patch
@@ -456,6 +603,10 @@ def __getitem__(self: TimeSeriesDataset,
     S = t.Tensor(self.s_matrix[idx])
     Y = self.ts_tensor[idx, self.t_cols.index('y'), :]
     X = self.ts_tensor[idx, (self.t_cols.index('y') + 1):self.t_cols.index('available_mask'), :]
+    if self.calendar is not None:
+        calendar = self._get_calendar_tensor(ts_idxs=self.ts_idxs[idx],
+                                             positions=np.arange(self.max_len))
+        X = t.cat([X, calendar], dim=1)
 
     available_mask = self.ts_tensor[idx, self.t_cols.index('available_mask'), :]
     sample_mask = self.ts_tensor[idx, self.t_cols.index('sample_mask'), :]
@@ -484,6 +635,7 @@ class IterateWindowsDataset(BaseDataset):
                  mask_df: Optional[pd.DataFrame] = None,
                  ds_in_test: int = 0,
                  is_test: bool = False,
+                 calendar_cols: Optional[List] = None,
                  verbose: bool = False) -> 'IterateWindowsDataset':
         """
         Parameters
@@ -511,6 +663,9 @@ class IterateWindowsDataset(BaseDataset):
         is_test: bool
             Only used when mask_df = None.
             Wheter target time series belongs to test set.
+        calendar_cols: list
+            Calendar features computed from the timestamps of each batch
+            and appended to X, see CALENDAR_GENERATORS.
         verbose: bool
             Wheter or not log outputs.
         """
@@ -519,13 +674,12 @@ class IterateWindowsDataset(BaseDataset):
                                                     X_df=X_df, S_df=S_df, f_cols=f_cols,
                                                     mask_df=mask_df, ds_in_test=ds_in_test,
                                                     is_test=is_test, complete_windows=True,
-                                                    verbose=verbose)
-
-        self.first_sampleable_stamps = np.nonzero(self.ts_tensor[0, self.t_cols.index('sample_mask'), :])[0,0]
-        self.sampleable_stamps = t.sum(self.ts_tensor[0, self.t_cols.index('sample_mask'), :]) # TODO: now it assumes mask is correct
+                                                    calendar_cols=calendar_cols, verbose=verbose)
 
-        self.first_sampleable_stamps = int(self.first_sampleable_stamps.cpu().detach().numpy())
-        self.sampleable_stamps = int(self.sampleable_stamps.cpu().detach().numpy())
+        # Only the first series is needed, the panel cumsum is left to describe
+        sample_cumsum = t.cumsum(self.ts_tensor[0, self.t_cols.index('sample_mask'), :], dim=-1)
+        self.first_sampleable_stamps = int(t.nonzero(sample_cumsum)[0, 0])
+        self.sampleable_stamps = int(sample_cumsum[-1]) # TODO: now it assumes mask is correct
 
 # Cell
 @patch
@@ -561,6 +715,10 @@ def __getitem__(self: IterateWindowsDataset,
     S = t.Tensor(self.s_matrix)
     Y = self.ts_tensor[:, self.t_cols.index('y'), idx:end]
     X = self.ts_tensor[:, (self.t_cols.index('y') + 1):self.t_cols.index('available_mask'), idx:end]
+    if self.calendar is not None:
+        calendar = self._get_calendar_tensor(ts_idxs=self.ts_idxs,
+                                             positions=np.arange(self.max_len)[idx:end])
+        X = t.cat([X, calendar], dim=1)
 
     available_mask = self.ts_tensor[:, self.t_cols.index('available_mask'), idx:end]
     sample_mask = self.ts_tensor[:, self.t_cols.index('sample_mask'), idx:end]
@@ -600,6 +758,8 @@ class WindowsDataset(BaseDataset):
                  sample_freq: int = 1,
                  complete_windows: bool = False,
                  last_window: bool = False,
+                 final_windows: bool = False,
+                 calendar_cols: Optional[List] = None,
                  verbose: bool = False) -> 'TimeSeriesDataset':
         """
         Parameters
@@ -630,6 +790,13 @@ class WindowsDataset(BaseDataset):
         last_window: bool
             Only used for forecast (test)
             Wheter the dataset will include only last window for each time serie.
+        final_windows: bool
+            Only used for forecast (test).
+            Wheter the dataset gathers only the window ending at the last
+            timestamp of each time serie, instead of unfolding all windows.
+        calendar_cols: list
+            Calendar features computed from the timestamps of each batch
+            and appended to X, see CALENDAR_GENERATORS.
         verbose: bool
             Wheter or not log outputs.
         """
@@ -638,12 +805,13 @@ class WindowsDataset(BaseDataset):
                                              X_df=X_df, S_df=S_df, f_cols=f_cols,
                                              mask_df=mask_df, ds_in_test=ds_in_test,
                                              is_test=is_test, complete_windows=complete_windows,
-                                             verbose=verbose)
+                                             calendar_cols=calendar_cols, verbose=verbose)
         # WindowsDataset parameters
         self.windows_size = self.input_size + self.output_size
         self.padding = (self.input_size, self.output_size)
         self.sample_freq = sample_freq
         self.last_window = last_window
+        self.final_windows = final_windows
         self.device = 'cuda' if t.cuda.is_available() else 'cpu'
 
 # Cell
@@ -662,11 +830,15 @@ def _create_windows_tensor(self: WindowsDataset,
 
     Returns
     -------
-    Tuple of three elements:
+    Tuple of four elements:
         - Windows tensor of shape (windows, channels, input_size + output_size)
         - Static variables tensor of shape (windows * series, n_static)
         - Time Series indexes for each window.
+        - Position in ts_tensor of the first stamp of each window.
     """
+    if self.final_windows:
+        return self._gather_final_windows(idx=idx)
+
     # Default ts_idxs=ts_idxs sends all the data, otherwise filters series
     tensor = self.ts_tensor[idx, :, self.first_ds:]
 
@@ -695,6 +867,10 @@ def _create_windows_tensor(self: WindowsDataset,
     s_matrix = t.Tensor(s_matrix)
     ts_idxs = t.as_tensor(ts_idxs, dtype=t.long)
 
+    # Windows are unfolded from ts_tensor[:, :, first_ds:] left padded with input_size
+    windows_starts = np.arange(int(windows_per_serie)) * self.sample_freq + self.first_ds - self.input_size
+    windows_starts = np.tile(windows_starts, n_ts)
+
     windows_idxs = self._get_sampleable_windows_idxs(ts_windows_flatten=windows,
                                                      ts_idxs=ts_idxs)
 
@@ -710,8 +886,41 @@ def _create_windows_tensor(self: WindowsDataset,
     windows = windows[windows_idxs]
     s_matrix = s_matrix[windows_idxs]
     ts_idxs = ts_idxs[windows_idxs]
+    windows_starts = windows_starts[windows_idxs]
+
+    return windows, s_matrix, ts_idxs, windows_starts
+
+# Cell
+@patch
+def _gather_final_windows(self: WindowsDataset,
+                          idx: slice) -> Tuple[t.Tensor, t.Tensor, t.Tensor, np.ndarray]:
+    """Gathers the window ending at the last timestamp of each time series.
+
+    Time series are left padded in ts_tensor, so their last timestamps are
+    aligned and the final windows are a slice of ts_tensor, whatever the
+    date where each time series ends.
+
+    Parameters
+    ----------
+    index: slice
+        Indexes of time series to consider.
+
+    Returns
+    -------
+    Same tuple of four elements as _create_windows_tensor, with one window per time series.
+    """
+    start = self.max_len - self.windows_size
+    windows = self.ts_tensor[idx, :, max(start, 0):]
+    if start < 0:
+        windows = t.nn.functional.pad(windows, (-start, 0), value=0)
+    windows = windows.to(self.device)
+
+    ts_idxs = self.ts_idxs[idx]
+    s_matrix = t.Tensor(self.s_matrix[idx])
+    windows_starts = np.full(len(ts_idxs), start)
+    ts_idxs = t.as_tensor(ts_idxs, dtype=t.long)
 
-    return windows, s_matrix, ts_idxs
+    return windows, s_matrix, ts_idxs, windows_starts
 
 # Cell
 @patch
@@ -790,11 +999,15 @@ def __getitem__(self: WindowsDataset,
         raise Exception('Use slices, int or list for getitem.')
 
     # Create windows for each sampled ts and sample random unmasked windows from each ts
-    windows, S, ts_idxs = self._create_windows_tensor(idx=idx)
+    windows, S, ts_idxs, windows_starts = self._create_windows_tensor(idx=idx)
 
     # Parse windows to elements of batch
     Y = windows[:, self.t_cols.index('y'), :]
     X = windows[:, (self.t_cols.index('y') + 1):self.t_cols.index('available_mask'), :]
+    if self.calendar is not None:
+        positions = windows_starts[:, None] + np.arange(self.windows_size)[None, :]
+        calendar = self._get_calendar_tensor(ts_idxs=ts_idxs.numpy(), positions=positions)
+        X = t.cat([X, calendar.to(X.device)], dim=1)
     available_mask = windows[:, self.t_cols.index('available_mask'), :]
     sample_mask = windows[:, self.t_cols.index('sample_mask'), :]
 
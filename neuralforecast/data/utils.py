@@ -1,9 +1,9 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/data__utils.ipynb (unless otherwise specified).
 
-__all__ = ['create_synthetic_tsdata']
+__all__ = ['create_synthetic_tsdata', 'create_synthetic_panel']
 
 # Cell
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -37,17 +37,18 @@ def create_synthetic_tsdata(n_ts: int = 64,
     uids = np.array([f'uid_{i + 1}' for i in range(n_ts)])
     dss = pd.date_range(end='2020-12-31', periods=n_ts)
 
-    df = []
-    for idx in range(n_ts):
-        ts = pd.DataFrame({'unique_id': np.repeat(uids[idx], idx + 1),
-                           'ds': dss[-(idx + 1):],
-                           'y': 1 + np.arange(idx + 1)})
-        df.append(ts)
+    # Series idx has length idx + 1 and ends in the last date
+    lengths = 1 + np.arange(n_ts)
+    series = np.repeat(np.arange(n_ts), lengths)
+    position = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
 
-    df = pd.concat(df)
+    df = pd.DataFrame({'unique_id': uids[series],
+                       'ds': dss[n_ts - lengths[series] + position],
+                       'y': 1 + position},
+                      index=position)
     df['day_of_week'] = df['ds'].dt.day_of_week
     df['future_1'] = df['y'] + 1
-    df['id_ts'] = df['unique_id'].astype('category').cat.codes
+    df['id_ts'] = pd.Categorical(uids).codes[series]
     if sort:
         df = df.sort_values(['unique_id', 'ds'])
 
@@ -55,4 +56,135 @@ def create_synthetic_tsdata(n_ts: int = 64,
     X_df = df.filter(items=['unique_id', 'ds', 'day_of_week', 'future_1'])
     S_df = df.filter(items=['unique_id', 'id_ts']).drop_duplicates()
 
+    return Y_df, X_df, S_df
+
+# Cell
+def create_synthetic_panel(n_series: int = 1_000,
+                           min_length: int = 100,
+                           max_length: int = 1_000,
+                           length_distribution: str = 'uniform',
+                           freq: str = 'D',
+                           seasonality: int = 7,
+                           level: float = 100.,
+                           seasonal_amplitude: float = 0.2,
+                           trend: float = 0.001,
+                           noise: float = 0.05,
+                           intermittency: float = 0.,
+                           n_exogenous: int = 0,
+                           n_static: int = 0,
+                           end: str = '2020-12-31',
+                           random_seed: Optional[int] = 1) -> Tuple[pd.DataFrame,
+                                                                    Optional[pd.DataFrame],
+                                                                    pd.DataFrame]:
+    """
+    Creates a synthetic panel of time series for benchmarks.
+    All the rows are generated at once, series end in the same date
+    and are sorted by unique_id and ds.
+
+    Each series is `level_i * (1 + trend_i * t + seasonal_i(t) + noise) + exogenous effect`,
+    with zeros inserted with probability `intermittency`.
+
+    Parameters
+    ----------
+    n_series: int
+        Number of time series.
+    min_length: int
+        Minimum length of the series.
+    max_length: int
+        Maximum length of the series.
+    length_distribution: str
+        Distribution of the lengths between min_length and max_length,
+        one of 'fixed' (all max_length), 'uniform' or 'lognormal'
+        (most series short and a long tail).
+    freq: str
+        Frequency of the series.
+    seasonality: int
+        Period of the seasonal component.
+    level: float
+        Median level of the series, the level of each series is lognormal.
+    seasonal_amplitude: float
+        Maximum amplitude of the seasonal component relative to the level.
+    trend: float
+        Maximum absolute slope per period relative to the level.
+    noise: float
+        Standard deviation of the noise relative to the level.
+    intermittency: float
+        Probability of zero observations.
+    n_exogenous: int
+        Number of exogenous variables, named 'exog_1', ..., each with a
+        random linear effect on y.
+    n_static: int
+        Number of categorical static variables, named 'static_1', ....
+    end: str
+        Last date of the series.
+    random_seed: int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    Y_df: pd.DataFrame
+        Target time series with columns ['unique_id', 'ds', 'y'].
+    X_df: pd.DataFrame
+        Exogenous time series with columns ['unique_id', 'ds']
+        and exogenous variables, None if n_exogenous is 0.
+    S_df: pd.DataFrame
+        Static exogenous variables with columns ['unique_id']
+        and static variables.
+    """
+    if not 1 <= min_length <= max_length:
+        raise Exception(f'min_length {min_length} and max_length {max_length} not valid')
+    rng = np.random.default_rng(random_seed)
+
+    if length_distribution == 'fixed':
+        lengths = np.full(n_series, max_length)
+    elif length_distribution == 'uniform':
+        lengths = rng.integers(min_length, max_length + 1, size=n_series)
+    elif length_distribution == 'lognormal':
+        lengths = min_length * rng.lognormal(mean=1., sigma=1., size=n_series)
+        lengths = np.clip(lengths, min_length, max_length).astype(int)
+    else:
+        raise Exception(f'length_distribution {length_distribution} not available')
+
+    n_obs = lengths.sum()
+    series = np.repeat(np.arange(n_series), lengths)
+    position = np.arange(n_obs) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    # Position in the common dates grid
+    t = max_length - lengths[series] + position
+    dates = pd.date_range(end=end, periods=max_length, freq=freq)
+
+    # Series parameters
+    levels = level * rng.lognormal(sigma=0.5, size=n_series)
+    slopes = rng.uniform(-trend, trend, size=n_series)
+    amplitudes = rng.uniform(0, seasonal_amplitude, size=n_series)
+    phases = rng.uniform(0, 2 * np.pi, size=n_series)
+
+    y = 1 + slopes[series] * position
+    y += amplitudes[series] * np.sin(2 * np.pi * t / seasonality + phases[series])
+    y += noise * rng.standard_normal(n_obs)
+    y *= levels[series]
+
+    X_df = None
+    if n_exogenous > 0:
+        exogenous = rng.standard_normal((n_obs, n_exogenous)).astype(np.float32)
+        betas = 0.1 * level * rng.standard_normal((n_series, n_exogenous))
+        y += np.einsum('ij,ij->i', exogenous, betas[series])
+
+    if intermittency > 0:
+        y[rng.random(n_obs) < intermittency] = 0
+
+    # Zero padded ids keep the generation order sorted
+    uids = np.array([f'uid_{i:0{len(str(n_series))}d}' for i in range(n_series)])
+
+    Y_df = pd.DataFrame({'unique_id': uids[series],
+                         'ds': dates[t],
+                         'y': y.astype(np.float32)})
+    if n_exogenous > 0:
+        X_df = Y_df[['unique_id', 'ds']].copy()
+        for i in range(n_exogenous):
+            X_df[f'exog_{i + 1}'] = exogenous[:, i]
+
+    S_df = pd.DataFrame({'unique_id': uids})
+    for i in range(n_static):
+        S_df[f'static_{i + 1}'] = rng.integers(0, max(2, n_series // 10 ** (i + 1)), size=n_series)
+
     return Y_df, X_df, S_df
\ No newline at end of file
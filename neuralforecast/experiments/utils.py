@@ -19,7 +19,7 @@ import pickle
 os.environ.update(ENV_VARS)
 import time
 from functools import partial
-from typing import Tuple
+from typing import Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -37,6 +37,7 @@ from ..models.esrnn.mqesrnn import MQESRNN
 from ..models.nbeats.nbeats import NBEATS
 from ..models.nhits.nhits import NHITS
 from ..models.transformer.autoformer import Autoformer
+from ..models.inference import ArrayWriter, InferenceRunner, NpyWriter
 
 # Cell
 def get_mask_dfs(Y_df: pd.DataFrame,
@@ -250,6 +251,7 @@ def create_datasets(mc: dict, S_df: pd.DataFrame,
                                       normalizer_y=mc['normalizer_y'], normalizer_x=mc['normalizer_x'])
 
     #----------------------------------------- Declare Dataset and Loaders ----------------------------------#
+    calendar_cols = mc.get('calendar_cols', None)
 
     if mc['mode'] == 'simple':
         train_dataset = WindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -258,6 +260,7 @@ def create_datasets(mc: dict, S_df: pd.DataFrame,
                                        output_size=int(mc['n_time_out']),
                                        sample_freq=int(mc['idx_to_sample_freq']),
                                        complete_windows=mc['complete_windows'],
+                                       calendar_cols=calendar_cols,
                                        verbose=verbose)
 
         valid_dataset = WindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -266,6 +269,7 @@ def create_datasets(mc: dict, S_df: pd.DataFrame,
                                        output_size=int(mc['n_time_out']),
                                        sample_freq=int(mc['val_idx_to_sample_freq']),
                                        complete_windows=True,
+                                       calendar_cols=calendar_cols,
                                        verbose=verbose)
 
         test_dataset = WindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -274,24 +278,28 @@ def create_datasets(mc: dict, S_df: pd.DataFrame,
                                       output_size=int(mc['n_time_out']),
                                       sample_freq=int(mc['val_idx_to_sample_freq']),
                                       complete_windows=True,
+                                      calendar_cols=calendar_cols,
                                       verbose=verbose)
     if mc['mode'] == 'iterate_windows':
         train_dataset = IterateWindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
                                               mask_df=train_mask_df, f_cols=f_cols,
                                               input_size=int(mc['n_time_in']),
                                               output_size=int(mc['n_time_out']),
+                                              calendar_cols=calendar_cols,
                                               verbose=verbose)
 
         valid_dataset = IterateWindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
                                               mask_df=valid_mask_df, f_cols=f_cols,
                                               input_size=int(mc['n_time_in']),
                                               output_size=int(mc['n_time_out']),
+                                              calendar_cols=calendar_cols,
                                               verbose=verbose)
 
         test_dataset = IterateWindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
                                              mask_df=test_mask_df, f_cols=f_cols,
                                              input_size=int(mc['n_time_in']),
                                              output_size=int(mc['n_time_out']),
+                                             calendar_cols=calendar_cols,
                                              verbose=verbose)
 
     if mc['mode'] == 'full':
@@ -299,18 +307,21 @@ def create_datasets(mc: dict, S_df: pd.DataFrame,
                                           mask_df=train_mask_df, f_cols=f_cols,
                                           input_size=int(mc['n_time_in']),
                                           output_size=int(mc['n_time_out']),
+                                          calendar_cols=calendar_cols,
                                           verbose=verbose)
 
         valid_dataset = TimeSeriesDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
                                           mask_df=valid_mask_df, f_cols=f_cols,
                                           input_size=int(mc['n_time_in']),
                                           output_size=int(mc['n_time_out']),
+                                          calendar_cols=calendar_cols,
                                           verbose=verbose)
 
         test_dataset = TimeSeriesDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
                                          mask_df=test_mask_df, f_cols=f_cols,
                                          input_size=int(mc['n_time_in']),
                                          output_size=int(mc['n_time_out']),
+                                         calendar_cols=calendar_cols,
                                          verbose=verbose)
 
     if ds_in_test == 0:
@@ -436,7 +447,8 @@ def instantiate_nbeats(mc: dict) -> NBEATS:
                   loss_hypar=float(mc['loss_hypar']),
                   loss_valid=mc['loss_valid'],
                   frequency=mc['frequency'],
-                  random_seed=int(mc['random_seed']))
+                  random_seed=int(mc['random_seed']),
+                  calendar_cols=mc.get('calendar_cols', None))
     return model
 
 # Cell
@@ -485,7 +497,8 @@ def instantiate_esrnn(mc: dict) -> ESRNN:
                   training_percentile=mc['training_percentile'],
                   loss=mc['loss_train'],
                   val_loss=mc['loss_valid'],
-                  seasonality=mc['seasonality'])
+                  seasonality=mc['seasonality'],
+                  calendar_cols=mc.get('calendar_cols', None))
     return model
 
 # Cell
@@ -530,7 +543,8 @@ def instantiate_rnn(mc: dict) -> ESRNN:
                   loss_valid=mc['loss_valid'],
                   loss_hypar=mc['loss_hypar'],
                   frequency=mc['frequency'],
-                  random_seed=int(mc['random_seed']))
+                  random_seed=int(mc['random_seed']),
+                  calendar_cols=mc.get('calendar_cols', None))
     return model
 
 # Cell
@@ -632,7 +646,8 @@ def instantiate_nhits(mc: dict) -> NHITS:
                   loss_hypar=float(mc['loss_hypar']),
                   loss_valid=mc['loss_valid'],
                   frequency=mc['frequency'],
-                  random_seed=int(mc['random_seed']))
+                  random_seed=int(mc['random_seed']),
+                  calendar_cols=mc.get('calendar_cols', None))
     return model
 
 # Cell
@@ -681,7 +696,8 @@ def instantiate_autoformer(mc: dict) -> Autoformer:
                        loss_train=mc['loss_train'],
                        loss_hypar=float(mc['loss_hypar']),
                        loss_valid=mc['loss_valid'],
-                       random_seed=int(mc['random_seed']))
+                       random_seed=int(mc['random_seed']),
+                       calendar_cols=mc.get('calendar_cols', None))
 
     return model
 
@@ -712,7 +728,8 @@ def instantiate_model(mc: dict) -> pl.LightningModule:
 # Cell
 def predict(mc: dict, model: pl.LightningModule,
             trainer: pl.Trainer, loader: DataLoader,
-            scaler_y: Scaler) -> Tuple[np.array, np.array, np.array, np.array]:
+            scaler_y: Scaler,
+            writer: Union[ArrayWriter, NpyWriter] = None) -> Tuple[np.array, np.array, np.array, np.array]:
     """
     Predicts results on dataset using trained model.
 
@@ -724,10 +741,16 @@ def predict(mc: dict, model: pl.LightningModule,
         Forecast model.
     trainer: pl.Trainer
         Trainer object.
+        If None or if a writer is given, predictions are streamed
+        batch by batch with an `InferenceRunner`.
     loader: DataLoader
         Data loader.
     scaler_y: Scaler
         Scaler object for target time series.
+    writer: ArrayWriter, NpyWriter
+        Writer of the predictions of each batch, for example
+        `NpyWriter` to stream them to memory mapped files.
+        Predictions are inverse scaled before writing.
 
     Returns
     -------
@@ -740,9 +763,24 @@ def predict(mc: dict, model: pl.LightningModule,
     meta_data: np.array
         Metada from dataset.
     """
+    meta_data = loader.dataset.meta_data
+
+    if (trainer is None) or (writer is not None):
+        def _transform(outputs):
+            y_true, y_hat, mask = [output.cpu().numpy() for output in outputs]
+            # Scale to original scale
+            if mc['normalizer_y'] is not None:
+                y_true = np.reshape(scaler_y.inv_scale(x=y_true.flatten()), y_true.shape)
+                y_hat = np.reshape(scaler_y.inv_scale(x=y_hat.flatten()), y_true.shape)
+            return y_true, y_hat, mask
+
+        writer = ArrayWriter() if writer is None else writer
+        y_true, y_hat, mask = InferenceRunner(model).run(loader, transform=_transform, writer=writer)
+
+        return y_true, y_hat, mask, meta_data
+
     outputs = trainer.predict(model, loader)
     y_true, y_hat, mask = [t.cat(output).cpu().numpy() for output in zip(*outputs)]
-    meta_data = loader.dataset.meta_data
 
     # Scale to original scale
     if mc['normalizer_y'] is not None:
@@ -450,7 +450,7 @@ class _ESRNN(nn.Module):
         return y_out, y_hat, sample_mask
 
 # Cell
-from typing import Union, List
+from typing import List, Optional, Union
 
 import pandas as pd
 import pytorch_lightning as pl
@@ -462,6 +462,7 @@ from torch.optim.lr_scheduler import StepLR
 
 from ...data.tsdataset import TimeSeriesDataset
 from ...data.tsloader import TimeSeriesLoader
+from ..inference import get_runner, make_future_dataframe
 from ...losses.utils import LossFunction
 
 # Cell
@@ -483,7 +484,8 @@ class ESRNN(pl.LightningModule):
                  testing_percentile: Union[int, List] = 50,
                  training_percentile: Union[int, List] = 50,
                  loss: str = 'SMYL', val_loss: str = 'MAE',
-                 frequency: str = 'D'):
+                 frequency: str = 'D',
+                 calendar_cols: Optional[List[str]] = None):
         super(ESRNN, self).__init__()
         """ Exponential Smoothing Recurrent Neural Network
 
@@ -566,6 +568,9 @@ class ESRNN(pl.LightningModule):
             Loss used to validate.
         frequency: str
             Time series frequency.
+        calendar_cols: List[str]
+            Calendar features of the training datasets, see CALENDAR_GENERATORS.
+            The forecast datasets compute the same features.
 
         Notes
         -----
@@ -613,6 +618,9 @@ class ESRNN(pl.LightningModule):
                                         level_variability_penalty=self.level_variability_penalty)
 
         self.frequency = frequency
+        self.calendar_cols = calendar_cols
+        # If True forward returns the forecast of the last window, used by forecast with a trainer
+        self.return_last_window = False
         # MQESRNN
         self.mq = isinstance(self.training_percentile, list)
         self.output_size_m = len(self.training_percentile) if self.mq else 1
@@ -714,6 +722,9 @@ class ESRNN(pl.LightningModule):
         return loss
 
     def forward(self, batch):
+        if self.return_last_window:
+            return self.predict_last_window(batch)
+
         # Parsing batch
         S, Y, X, idxs, sample_mask, available_mask = self.parse_batch(batch)
 
@@ -726,6 +737,20 @@ class ESRNN(pl.LightningModule):
 
         return y_true, y_hat, sample_mask
 
+    def predict_last_window(self, batch):
+        """Forecast of the window ending at the last timestamp of the batch.
+
+        Unlike forward, the windows are not subsampled with sample_freq.
+        The ES recursion and the RNN state run over all the windows. Used by forecast.
+        """
+        # Parsing batch
+        S, Y, X, idxs, sample_mask, available_mask = self.parse_batch(batch)
+
+        _, y_hat, _ = self.model.predict(S=S, Y=Y, X=X, idxs=idxs,
+                                         sample_mask=sample_mask)
+
+        return y_hat[:, -1],
+
     def configure_optimizers(self):
         es_optimizer = Adam(params=self.model.es.parameters(),
                             lr=self.learning_rate * self.per_series_lr_multip,
@@ -747,7 +772,7 @@ class ESRNN(pl.LightningModule):
 # Cell
 @patch
 def forecast(self: ESRNN, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: pd.DataFrame = None,
-             batch_size: int =1, trainer: pl.Trainer =None) -> pd.DataFrame:
+             batch_size: int =1, trainer: pl.Trainer =None, return_numpy: bool = False) -> pd.DataFrame:
     """
     Method for forecasting self.output_size periods after last timestamp of Y_df.
 
@@ -764,22 +789,21 @@ def forecast(self: ESRNN, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: p
         Batch size for forecasting.
     trainer: pl.Trainer
         Trainer object for model training and evaluation.
+        If None the forecast runs without trainer with the model `InferenceRunner`.
+    return_numpy: bool
+        If True returns the arrays (ids, ds, y_hat) instead of a dataframe.
 
     Returns
     ----------
     forecast_df: pd.DataFrame
         Dataframe with forecasts.
+        If return_numpy, tuple of arrays (ids, ds, y_hat) of the forecasts.
     """
 
     # Add forecast dates to Y_df
-    Y_df['ds'] = pd.to_datetime(Y_df['ds'])
     if X_df is not None:
-        X_df['ds'] = pd.to_datetime(X_df['ds'])
-    forecast_dates = pd.date_range(Y_df['ds'].max(), periods=self.output_size+1, freq=self.frequency)[1:]
-    index = pd.MultiIndex.from_product([Y_df['unique_id'].unique(), forecast_dates], names=['unique_id', 'ds'])
-    forecast_df = pd.DataFrame({'y':[0]}, index=index).reset_index()
-
-    Y_df = Y_df.append(forecast_df).sort_values(['unique_id','ds']).reset_index(drop=True)
+        X_df = X_df.assign(ds=pd.to_datetime(X_df['ds']))
+    Y_df, ids, ds = make_future_dataframe(Y_df, horizon=self.output_size, freq=self.frequency)
 
     # Dataset, loader and trainer
     dataset = TimeSeriesDataset(Y_df=Y_df, X_df=X_df,
@@ -788,29 +812,36 @@ def forecast(self: ESRNN, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: p
                                 is_test=True,
                                 input_size=self.input_size,
                                 output_size=self.output_size,
+                                calendar_cols=self.calendar_cols,
                                 verbose=True)
 
     loader = TimeSeriesLoader(dataset=dataset,
                               batch_size=batch_size,
                               shuffle=False)
 
-    if trainer is None:
-        gpus = -1 if t.cuda.is_available() else 0
-        trainer = pl.Trainer(progress_bar_refresh_rate=1,
-                             gpus=gpus,
-                             logger=False)
-
     # Forecast
-    outputs = trainer.predict(self, loader)
-
-    # Process forecast and include in forecast_df
-    _, forecast, _ = zip(*outputs)
-    forecast = t.cat([forecast_[:, -1] for forecast_ in forecast]).cpu().numpy()
+    if trainer is None:
+        forecast, = get_runner(self).run(loader, copy=False, forward=self.predict_last_window)
+    else:
+        # Same last window as the runner, forward subsamples the windows with sample_freq
+        self.return_last_window = True
+        try:
+            outputs = trainer.predict(self, loader)
+        finally:
+            self.return_last_window = False
+        forecast, = zip(*outputs)
+        forecast = t.cat(forecast).cpu().numpy()
+
+    # Process forecast
     if self.mq:
-        for iq, q in enumerate(self.training_percentile):
-            forecast_df[f'y_p{q}'] = forecast[:, :, iq].flatten()
-        forecast_df = forecast_df.drop(columns='y')
+        y_hat = forecast.reshape(-1, forecast.shape[-1])
+        columns = {f'y_p{q}': y_hat[:, iq] for iq, q in enumerate(self.training_percentile)}
     else:
-        forecast_df['y'] = forecast.flatten()
+        y_hat = forecast.flatten()
+        columns = {'y': y_hat}
+    if return_numpy:
+        return ids, ds, y_hat
+
+    forecast_df = pd.DataFrame({'unique_id': ids, 'ds': ds, **columns})
 
     return forecast_df
@@ -0,0 +1,444 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/models__export.ipynb (unless otherwise specified).
+
+__all__ = ['example_inputs', 'freeze', 'export_torchscript', 'compile_forecast', 'export_onnx', 'OnnxRuntimeBackend',
+           'export_numpy']
+
+# Cell
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch as t
+import torch.nn as nn
+
+from .nbeats.nbeats import (NBEATS, ExogenousBasisInterpretable, IdentityBasis,
+                                                 SeasonalityBasis, TrendBasis)
+from .nhits.nhits import (NHITS, _ExogenousBasisInterpretable, _IdentityBasis,
+                                               _interpolation_matrix)
+from .rnn.rnn import RNN
+from .inference import _detached_copy
+
+# Cell
+class _Forecast(nn.Module):
+    def __init__(self, model: nn.Module):
+        """Forecast of the `_NHITS` or `_NBEATS` network, with the window tensors as inputs."""
+        super().__init__()
+        self.model = model
+
+    def forward(self, insample_y: t.Tensor, insample_x_t: t.Tensor, insample_mask: t.Tensor,
+                outsample_x_t: t.Tensor, x_s: t.Tensor) -> t.Tensor:
+        return self.model.forecast(insample_y=insample_y, insample_x_t=insample_x_t,
+                                   insample_mask=insample_mask, outsample_x_t=outsample_x_t,
+                                   x_s=x_s)
+
+class _RNNForecast(nn.Module):
+    def __init__(self, model: nn.Module):
+        """Forecast of the last window of the `_RNN` network, with the windows tensors as inputs."""
+        super().__init__()
+        self.model = model
+
+    def forward(self, insample_y: t.Tensor, x: t.Tensor) -> t.Tensor:
+        return self.model(Y=insample_y, X=x)[:, -1]
+
+_INPUT_NAMES = ['insample_y', 'insample_x_t', 'insample_mask', 'outsample_x_t', 'x_s']
+_RNN_INPUT_NAMES = ['insample_y', 'x']
+
+def _forecast_module(model: Union[NHITS, NBEATS, RNN]) -> nn.Module:
+    if isinstance(model, RNN):
+        return _RNNForecast(model.model)
+
+    return _Forecast(model.model)
+
+def _input_names(model: Union[NHITS, NBEATS, RNN]) -> List[str]:
+    return _RNN_INPUT_NAMES if isinstance(model, RNN) else _INPUT_NAMES
+
+def example_inputs(model: Union[NHITS, NBEATS, RNN], batch_size: int = 2,
+                   n_windows: int = 1) -> Tuple[t.Tensor, ...]:
+    """
+    Random inputs of the exported forecast, in the order of its arguments:
+    insample_y (batch_size, n_time_in), insample_x_t (batch_size, n_x, n_time_in),
+    insample_mask (batch_size, n_time_in), outsample_x_t (batch_size, n_x, n_time_out)
+    and x_s (batch_size, n_s).
+    For the RNN insample_y (n_windows, batch_size, input_size)
+    and x (n_windows, batch_size, n_x * (input_size + output_size)).
+    """
+    device = next(model.parameters()).device
+    if isinstance(model, RNN):
+        n_x = model.n_x * (model.input_size + model.output_size)
+        return (t.rand(n_windows, batch_size, model.input_size, device=device),
+                t.rand(n_windows, batch_size, n_x, device=device))
+
+    return (t.rand(batch_size, model.n_time_in, device=device),
+            t.rand(batch_size, model.n_x, model.n_time_in, device=device),
+            t.ones(batch_size, model.n_time_in, device=device),
+            t.rand(batch_size, model.n_x, model.n_time_out, device=device),
+            t.rand(batch_size, model.n_s, device=device))
+
+# Cell
+def _remove_weight_norm(module: nn.Module) -> None:
+    """Bakes the weight normalization into the weight of the convolutions."""
+    for child in module.modules():
+        if hasattr(child, 'weight_g'):
+            nn.utils.remove_weight_norm(child)
+
+def _strip_dropout(module: nn.Module) -> None:
+    """Removes the dropout from sequential modules and replaces the other ones with identities."""
+    for name, child in list(module.named_children()):
+        if not isinstance(child, nn.Dropout):
+            _strip_dropout(child)
+        elif isinstance(module, nn.Sequential):
+            del module._modules[name]
+        else:
+            setattr(module, name, nn.Identity())
+
+def _set_linear(linear: nn.Linear, weight: t.Tensor, bias: t.Tensor) -> None:
+    linear.weight = nn.Parameter(weight)
+    linear.bias = nn.Parameter(bias)
+
+def _fold_batch_norm(module: nn.Module) -> None:
+    """
+    Folds the BatchNorm1d of sequential modules into a neighbouring Linear.
+    In the blocks the BatchNorm1d follows the activation, so it is folded
+    into the next Linear, otherwise into the previous one.
+    """
+    for child in module.modules():
+        if not isinstance(child, nn.Sequential):
+            continue
+
+        layers = list(child._modules.items())
+        for i, (name, layer) in enumerate(layers):
+            if not isinstance(layer, nn.BatchNorm1d) or (layer.running_var is None):
+                continue
+
+            # Affine map x * scale + shift of the normalization in eval mode
+            scale = t.rsqrt(layer.running_var + layer.eps)
+            if layer.affine:
+                scale = scale * layer.weight
+            shift = -layer.running_mean * scale
+            if layer.affine:
+                shift = shift + layer.bias
+
+            previous = layers[i - 1][1] if i > 0 else None
+            following = layers[i + 1][1] if i + 1 < len(layers) else None
+            if isinstance(following, nn.Linear):
+                bias = following.bias if following.bias is not None else t.zeros_like(following.weight[:, 0])
+                _set_linear(following, following.weight * scale[None, :], bias + following.weight @ shift)
+            elif isinstance(previous, nn.Linear):
+                bias = previous.bias if previous.bias is not None else t.zeros_like(previous.weight[:, 0])
+                _set_linear(previous, previous.weight * scale[:, None], bias * scale + shift)
+            else:
+                continue
+            del child._modules[name]
+
+def _parameters_to_buffers(module: nn.Module) -> None:
+    """Registers the parameters without gradient, such as the NBEATS basis, as buffers."""
+    for child in module.modules():
+        for name, parameter in list(child.named_parameters(recurse=False)):
+            if not parameter.requires_grad:
+                delattr(child, name)
+                child.register_buffer(name, parameter.data)
+
+# Cell
+def freeze(model: nn.Module) -> nn.Module:
+    """
+    Copy of the model for inference, with fewer operations in its forward.
+
+    The weight normalization of the convolutions is baked into their weights,
+    the dropout is removed, the BatchNorm1d of the blocks are folded into the
+    Linear layers and the constant parameters, such as the NBEATS basis, become buffers.
+    The copy is in eval mode and can not be trained.
+    Used by the exports, which trace the frozen model.
+
+    Parameters
+    ----------
+    model: nn.Module
+        Trained model, for example NHITS, NBEATS or RNN, it is not modified.
+
+    Returns
+    -------
+    frozen: nn.Module
+        Frozen copy of the model.
+    """
+    frozen = _detached_copy(model).eval()
+
+    with t.no_grad():
+        _remove_weight_norm(frozen)
+        _strip_dropout(frozen)
+        _fold_batch_norm(frozen)
+        _parameters_to_buffers(frozen)
+
+    for parameter in frozen.parameters():
+        parameter.requires_grad_(False)
+
+    return frozen
+
+# Cell
+def export_torchscript(model: Union[NHITS, NBEATS], path: Optional[str] = None,
+                       optimize: bool = True) -> t.jit.ScriptModule:
+    """
+    Traces the forecast of a NHITS or NBEATS model to TorchScript.
+
+    Tracing runs the forecast once, so the loop over the blocks is unrolled
+    and the basis of each block is fixed in the graph. The batch size is not fixed.
+    The module saved in `path` is loaded with `torch.jit.load(path)` alone,
+    without importing neuralforecast, Lightning, hyperopt or pandas.
+    The traced model is the `freeze` copy of the model.
+
+    Parameters
+    ----------
+    model: NHITS, NBEATS
+        Trained model.
+    path: str, optional
+        File where the TorchScript module is saved.
+    optimize: bool
+        If True freezes the parameters as constants of the graph and
+        applies `torch.jit.optimize_for_inference`, requires torch>=1.9.
+
+    Returns
+    -------
+    scripted: t.jit.ScriptModule
+        Module called with the `example_inputs` tensors that
+        returns the forecast of shape (batch_size, n_time_out).
+    """
+    model = freeze(model)
+    with t.no_grad():
+        scripted = t.jit.trace(_Forecast(model.model), example_inputs(model))
+
+    if optimize:
+        scripted = t.jit.freeze(scripted)
+        scripted = t.jit.optimize_for_inference(scripted)
+
+    if path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        t.jit.save(scripted, path)
+
+    return scripted
+
+# Cell
+def compile_forecast(model: Union[NHITS, NBEATS], **kwargs) -> Callable:
+    """
+    Compiles the forecast of a NHITS or NBEATS model with `torch.compile`, requires torch>=2.0.
+    In process alternative to `export_torchscript`, of the `freeze` copy of the model.
+
+    Parameters
+    ----------
+    model: NHITS, NBEATS
+        Trained model.
+    **kwargs:
+        Arguments of `torch.compile`, for example mode='reduce-overhead'.
+
+    Returns
+    -------
+    compiled: Callable
+        Function called with the `example_inputs` tensors that
+        returns the forecast of shape (batch_size, n_time_out).
+    """
+    if not hasattr(t, 'compile'):
+        raise Exception('torch.compile requires torch>=2.0, use export_torchscript instead')
+
+    return t.compile(_Forecast(freeze(model).model), **kwargs)
+
+# Cell
+def export_onnx(model: Union[NHITS, NBEATS, RNN], path: str, n_windows: int = 1,
+                opset_version: int = 13) -> None:
+    """
+    Exports the forecast of a NHITS, NBEATS or RNN model to ONNX,
+    run with `OnnxRuntimeBackend` or any ONNX runtime.
+
+    The graph inputs are named as the `example_inputs` and the output is 'forecast'.
+    The batch axis of the inputs and the output is dynamic.
+    The RNN state runs over the windows with python loops,
+    so the number of windows of its inputs is fixed to `n_windows`.
+    The exported model is the `freeze` copy of the model.
+
+    Parameters
+    ----------
+    model: NHITS, NBEATS, RNN
+        Trained model.
+    path: str
+        File where the ONNX graph is saved.
+    n_windows: int
+        Number of windows of the RNN inputs, the windows of a
+        `forecast` of series with input_size + n_windows - 1 timestamps.
+        Not used by NHITS and NBEATS.
+    opset_version: int
+        ONNX opset of the graph.
+    """
+    input_names = _input_names(model)
+    batch_axis = 1 if isinstance(model, RNN) else 0
+    dynamic_axes = {name: {batch_axis: 'batch_size'} for name in input_names}
+    dynamic_axes['forecast'] = {0: 'batch_size'}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    model = freeze(model)
+    with t.no_grad():
+        t.onnx.export(_forecast_module(model), example_inputs(model, n_windows=n_windows), path,
+                      input_names=input_names, output_names=['forecast'],
+                      dynamic_axes=dynamic_axes, opset_version=opset_version)
+
+# Cell
+class OnnxRuntimeBackend:
+    def __init__(self, model: Union[NHITS, NBEATS, RNN], path: str,
+                 n_threads: Optional[int] = None, providers: Optional[List[str]] = None):
+        """Runs the forecast exported by `export_onnx` with ONNX Runtime.
+
+        Called with the batches of the model loader, it returns the outputs
+        of the forward it replaces, so it is passed as the `backend` of `forecast`.
+
+        Parameters
+        ----------
+        model: NHITS, NBEATS, RNN
+            Exported model, only its windows parameters are used.
+        path: str
+            File of the ONNX graph.
+        n_threads: int, optional
+            Threads of each operator, by default ONNX Runtime uses all physical cores.
+        providers: List[str], optional
+            Execution providers of ONNX Runtime, by default CPUExecutionProvider.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise Exception('OnnxRuntimeBackend requires onnxruntime, install it with `pip install onnxruntime`')
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if n_threads is not None:
+            options.intra_op_num_threads = n_threads
+        if providers is None:
+            providers = ['CPUExecutionProvider']
+
+        self.model = model
+        self.session = ort.InferenceSession(str(path), sess_options=options, providers=providers)
+        # Inputs not used by the graph, such as the exogenous of models
+        # without them, are not kept by the export
+        self.inputs = {input.name: input for input in self.session.get_inputs()}
+
+    def run(self, *inputs: t.Tensor) -> t.Tensor:
+        """Forecast of the `example_inputs` like tensors."""
+        feed = {name: input.detach().float().cpu().numpy() \
+                for name, input in zip(_input_names(self.model), inputs) if name in self.inputs}
+        forecast, = self.session.run(['forecast'], feed)
+
+        return t.from_numpy(forecast)
+
+    def __call__(self, batch: Dict[str, t.Tensor]) -> Tuple[t.Tensor, ...]:
+        if isinstance(self.model, RNN):
+            _, Y, X, _, _, _ = self.model.parse_batch(batch)
+            n_windows = self.inputs['insample_y'].shape[0]
+            if len(Y) != n_windows:
+                raise Exception(f'The graph was exported with n_windows={n_windows} and the batch has {len(Y)} windows, '
+                                f'keep the last {self.model.input_size + n_windows - 1} timestamps of each series')
+            return self.run(Y[:, :, :self.model.input_size], X),
+
+        n_time_out = self.model.n_time_out
+        Y, X = batch['Y'], batch['X']
+        forecast = self.run(Y[:, :-n_time_out], X[:, :, :-n_time_out], batch['available_mask'][:, :-n_time_out],
+                            X[:, :, -n_time_out:], batch['S'])
+
+        return Y[:, -n_time_out:], forecast, batch['sample_mask'][:, -n_time_out:]
+
+# Cell
+def _numpy_layers(layers: nn.Module, prefix: str, arrays: Dict[str, np.ndarray]) -> List[Dict]:
+    """Specification of the frozen sequential layers, their weights are added to `arrays`."""
+    specs = []
+    for i, layer in enumerate(layers):
+        key = f'{prefix}.{i}'
+        if isinstance(layer, nn.Linear):
+            arrays[f'{key}.weight'] = layer.weight.detach().cpu().numpy().T.copy()
+            spec = {'type': 'linear', 'weight': f'{key}.weight', 'bias': None}
+            if layer.bias is not None:
+                arrays[f'{key}.bias'] = layer.bias.detach().cpu().numpy()
+                spec['bias'] = f'{key}.bias'
+        elif isinstance(layer, nn.PReLU):
+            arrays[f'{key}.weight'] = layer.weight.detach().cpu().numpy()
+            spec = {'type': 'PReLU', 'weight': f'{key}.weight'}
+        elif isinstance(layer, nn.LeakyReLU):
+            spec = {'type': 'LeakyReLU', 'negative_slope': layer.negative_slope}
+        elif isinstance(layer, nn.Softplus):
+            spec = {'type': 'Softplus', 'beta': layer.beta, 'threshold': layer.threshold}
+        elif isinstance(layer, (nn.ReLU, nn.Tanh, nn.SELU, nn.Sigmoid)):
+            spec = {'type': type(layer).__name__}
+        else:
+            raise Exception(f'{type(layer).__name__} layer not supported by the numpy forecast')
+        specs.append(spec)
+
+    return specs
+
+def _numpy_basis(block: nn.Module, prefix: str, arrays: Dict[str, np.ndarray]) -> Dict:
+    """Specification of the basis as slices of theta projected on optional templates."""
+    basis = block.basis
+    if isinstance(basis, (_ExogenousBasisInterpretable, ExogenousBasisInterpretable)):
+        return {'type': 'exogenous'}
+
+    if isinstance(basis, _IdentityBasis):
+        matrix = basis.interpolation_matrix
+        if matrix is None:
+            n_knots = block.layers[-1].out_features - basis.backcast_size
+            matrix = _interpolation_matrix(n_knots, basis.forecast_size, basis.interpolation_mode)
+        arrays[f'{prefix}.forecast_basis'] = matrix.detach().cpu().numpy()
+        return {'type': 'linear',
+                'backcast': [0, basis.backcast_size], 'backcast_basis': None,
+                'forecast': [basis.backcast_size, None], 'forecast_basis': f'{prefix}.forecast_basis'}
+
+    if isinstance(basis, IdentityBasis):
+        return {'type': 'linear',
+                'backcast': [0, basis.backcast_size], 'backcast_basis': None,
+                'forecast': [-basis.forecast_size, None], 'forecast_basis': None}
+
+    if isinstance(basis, (TrendBasis, SeasonalityBasis)):
+        cut_point = basis.forecast_basis.shape[0]
+        arrays[f'{prefix}.backcast_basis'] = basis.backcast_basis.detach().cpu().numpy()
+        arrays[f'{prefix}.forecast_basis'] = basis.forecast_basis.detach().cpu().numpy()
+        return {'type': 'linear',
+                'backcast': [cut_point, None], 'backcast_basis': f'{prefix}.backcast_basis',
+                'forecast': [0, cut_point], 'forecast_basis': f'{prefix}.forecast_basis'}
+
+    raise Exception(f'{type(basis).__name__} not supported by the numpy forecast')
+
+def export_numpy(model: Union[NHITS, NBEATS], path: str) -> None:
+    """
+    Exports the weights of a NHITS or NBEATS model for the `NumpyForecast`,
+    which forecasts without torch.
+
+    The `freeze` copy of the model is saved in a npz file, with the
+    weights of the layers, the interpolation matrices and the trend and
+    seasonality templates, and a json specification of the blocks.
+    The exogenous_tcn and exogenous_wavenet stacks are not supported.
+
+    Parameters
+    ----------
+    model: NHITS, NBEATS
+        Trained model.
+    path: str
+        File where the arrays are saved.
+    """
+    network = freeze(model).model
+
+    arrays = {}
+    blocks, order, indexes = [], [], {}
+    for block in network.blocks:
+        # Blocks with shared weights are stored once
+        if id(block) not in indexes:
+            prefix = f'blocks.{len(blocks)}'
+            pooling = None
+            if hasattr(block, 'pooling_layer'):
+                pooling = {'mode': 'max' if isinstance(block.pooling_layer, nn.MaxPool1d) else 'average',
+                           'kernel_size': block.n_pool_kernel_size}
+            static_encoder = None
+            if hasattr(block, 'static_encoder'):
+                static_encoder = _numpy_layers(block.static_encoder.encoder, f'{prefix}.static_encoder', arrays)
+
+            indexes[id(block)] = len(blocks)
+            blocks.append({'pooling': pooling, 'n_x': block.n_x, 'static_encoder': static_encoder,
+                           'layers': _numpy_layers(block.layers, f'{prefix}.layers', arrays),
+                           'basis': _numpy_basis(block, f'{prefix}.basis', arrays)})
+        order.append(indexes[id(block)])
+
+    spec = {'n_time_in': model.n_time_in, 'n_time_out': model.n_time_out,
+            'n_x': model.n_x, 'n_s': model.n_s, 'blocks': blocks, 'order': order}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as file:
+        np.savez(file, spec=np.array(json.dumps(spec)), **arrays)
\ No newline at end of file
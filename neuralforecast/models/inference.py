@@ -0,0 +1,342 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/models__inference.ipynb (unless otherwise specified).
+
+__all__ = ['ArrayWriter', 'NpyWriter', 'InferenceRunner', 'get_runner', 'make_future_dataframe', 'tail_series']
+
+# Cell
+import copy
+import struct
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import torch as t
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+# Cell
+class ArrayWriter:
+    def __init__(self, n_rows: Optional[int] = None):
+        """Writes the outputs into preallocated numpy arrays.
+
+        Arrays are kept between runs and grown geometrically
+        only when a larger request arrives.
+
+        Parameters
+        ----------
+        n_rows: int, optional
+            Number of rows to preallocate, if known.
+        """
+        self.n_rows = n_rows
+        self.buffers = None
+        self.n_filled = 0
+
+    def open(self) -> None:
+        self.n_filled = 0
+
+    def write(self, outputs: List[np.ndarray]) -> None:
+        batch_size = len(outputs[0])
+        n_rows = self.n_filled + batch_size
+        layout = [(output.shape[1:], output.dtype) for output in outputs]
+        if self.buffers is not None and layout == [(buffer.shape[1:], buffer.dtype) for buffer in self.buffers]:
+            if len(self.buffers[0]) < n_rows:
+                # Grow geometrically to amortize reallocations
+                n_rows = max(n_rows, 2 * len(self.buffers[0]))
+                self.buffers = [np.concatenate([buffer[:self.n_filled], np.empty((n_rows - self.n_filled, *shape), dtype=dtype)]) \
+                                for buffer, (shape, dtype) in zip(self.buffers, layout)]
+        elif self.n_filled > 0:
+            raise Exception('Outputs shapes must be equal across batches, use transform to make them equal')
+        else:
+            n_rows = max(n_rows, self.n_rows or 0)
+            self.buffers = [np.empty((n_rows, *shape), dtype=dtype) for shape, dtype in layout]
+
+        for buffer, output in zip(self.buffers, outputs):
+            buffer[self.n_filled:self.n_filled + batch_size] = output
+        self.n_filled += batch_size
+
+    def close(self) -> Tuple[np.ndarray, ...]:
+        """Returns views of the filled rows, overwritten by the next run."""
+        return tuple(buffer[:self.n_filled] for buffer in self.buffers)
+
+# Cell
+_NPY_HEADER_SIZE = 128
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int]) -> bytes:
+    """Version 1.0 npy header padded to a fixed size, so it can be rewritten in place."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+    header = header.ljust(_NPY_HEADER_SIZE - 10 - 1) + '\n'
+    if len(header) != _NPY_HEADER_SIZE - 10:
+        raise Exception(f'Output of shape {shape} too large for the npy header')
+
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+class NpyWriter:
+    def __init__(self, directory: Union[str, Path], names: Optional[List[str]] = None):
+        """Streams the outputs to `.npy` files, one per output.
+
+        Each batch is appended to the files, so memory is bounded by the batch.
+        At the end the headers are completed and the files are memory mapped.
+
+        Parameters
+        ----------
+        directory: str, Path
+            Directory of the files.
+        names: List[str], optional
+            Names of the files of each output, by default 'output_0', 'output_1', ....
+        """
+        self.directory = Path(directory)
+        self.names = names
+        self.files = None
+
+    def open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.files = None
+        self.n_filled = 0
+
+    def _paths(self, n_outputs: int) -> List[Path]:
+        names = self.names or [f'output_{i}' for i in range(n_outputs)]
+        return [self.directory / f'{name}.npy' for name in names]
+
+    def write(self, outputs: List[np.ndarray]) -> None:
+        layout = [(output.shape[1:], output.dtype) for output in outputs]
+        if self.files is None:
+            self.layout = layout
+            self.files = [open(path, 'wb') for path in self._paths(len(outputs))]
+            for f, (shape, dtype) in zip(self.files, layout):
+                f.write(_npy_header(dtype, (0, *shape)))
+        elif layout != self.layout:
+            raise Exception('Outputs shapes must be equal across batches, use transform to make them equal')
+
+        for f, output in zip(self.files, outputs):
+            f.write(np.ascontiguousarray(output).tobytes())
+        self.n_filled += len(outputs[0])
+
+    def close(self) -> Tuple[np.ndarray, ...]:
+        """Completes the files and returns them memory mapped."""
+        for f, (shape, dtype) in zip(self.files, self.layout):
+            f.seek(0)
+            f.write(_npy_header(dtype, (self.n_filled, *shape)))
+            f.close()
+
+        return tuple(np.load(path, mmap_mode='r') for path in self._paths(len(self.files)))
+
+# Cell
+# torch.inference_mode is available from torch 1.9
+_inference_mode = getattr(t, 'inference_mode', t.no_grad)
+
+class InferenceRunner:
+    def __init__(self, model: nn.Module, device: Optional[Union[str, t.device]] = None):
+        """Runs the forward of a model over a loader without a Lightning trainer.
+
+        Parameters
+        ----------
+        model: nn.Module
+            Model whose forward receives a batch dictionary and
+            returns a tuple of tensors with the batch in the first dimension.
+        device: str, optional
+            Device where the model is moved to run.
+            By default the model runs on its current device and is not moved.
+        """
+        self.model = model
+        self.device = t.device(device) if device is not None else None
+        self.writer = ArrayWriter()
+
+    def _model_device(self) -> t.device:
+        parameter = next(self.model.parameters(), None)
+        return parameter.device if parameter is not None else t.device('cpu')
+
+    def _to_device(self, batch: Dict[str, t.Tensor], device: t.device) -> Dict[str, t.Tensor]:
+        non_blocking = device.type == 'cuda'
+        return {key: value.to(device, non_blocking=non_blocking) if isinstance(value, t.Tensor) else value \
+                for key, value in batch.items()}
+
+    def run(self, loader: DataLoader, copy: bool = True,
+            transform: Optional[Callable] = None,
+            writer: Optional[Union[ArrayWriter, NpyWriter]] = None,
+            forward: Optional[Callable] = None) -> Tuple[np.ndarray, ...]:
+        """Evaluates the model over all the batches of the loader.
+
+        Parameters
+        ----------
+        loader: DataLoader
+            Loader of the batches, usually a `TimeSeriesLoader`.
+        copy: bool
+            If False returns views of the runner arrays,
+            which are overwritten by the next call.
+            Only used with the default writer.
+        transform: Callable, optional
+            Function applied to the outputs tuple of each batch,
+            for example to keep only the last window or inverse scale.
+            It can return tensors or numpy arrays.
+        writer: ArrayWriter, NpyWriter, optional
+            Writer of the outputs of each batch, by default the runner `ArrayWriter`.
+        forward: Callable, optional
+            Method of the model called with each batch, by default the model forward.
+            For example a forecast of only the last window.
+
+        Returns
+        -------
+        outputs: Tuple[np.ndarray]
+            Outputs of the forward concatenated over the batches.
+        """
+        default_writer = writer is None
+        writer = self.writer if default_writer else writer
+        forward = self.model if forward is None else forward
+
+        training = self.model.training
+        self.model.eval()
+        if self.device is not None:
+            self.model.to(self.device)
+        device = self._model_device()
+
+        n_rows = 0
+        writer.open()
+        try:
+            with _inference_mode():
+                for batch in loader:
+                    outputs = forward(self._to_device(batch, device))
+                    if transform is not None:
+                        outputs = transform(outputs)
+                    outputs = [output.cpu().numpy() if isinstance(output, t.Tensor) else output \
+                               for output in outputs]
+                    writer.write(outputs)
+                    n_rows += len(outputs[0])
+        finally:
+            self.model.train(training)
+
+        if n_rows == 0:
+            raise Exception('The loader has no batches')
+
+        outputs = writer.close()
+        if copy and default_writer:
+            outputs = tuple(output.copy() for output in outputs)
+
+        return outputs
+
+# Cell
+def get_runner(model: nn.Module) -> InferenceRunner:
+    """Returns the runner of the model, created on the first call and reused after."""
+    runner = getattr(model, '_inference_runner', None)
+    if runner is None:
+        runner = InferenceRunner(model)
+        model._inference_runner = runner
+
+    return runner
+
+# Attributes of a trained LightningModule that are not copied with it,
+# the trainer holds the loaders and the logger threads
+_DETACHED_ATTRIBUTES = ['trainer', '_trainer', '_inference_runner']
+
+def _detached_copy(model: nn.Module) -> nn.Module:
+    """Deep copy of the model without its Lightning trainer and its inference runner."""
+    # Objects in the memo are not copied, they are replaced by None
+    memo = {id(model.__dict__[name]): None for name in _DETACHED_ATTRIBUTES
+            if model.__dict__.get(name) is not None}
+
+    return copy.deepcopy(model, memo)
+
+# Cell
+def _series_order(codes: np.ndarray, ds: np.ndarray) -> Optional[np.ndarray]:
+    """Order of the rows sorted by series and ds, None if they are sorted already."""
+    codes_diff = np.diff(codes)
+    if np.all((codes_diff > 0) | ((codes_diff == 0) & (np.diff(ds) > np.timedelta64(0)))):
+        return None
+
+    return np.lexsort((ds, codes))
+
+def make_future_dataframe(Y_df: pd.DataFrame, horizon: int, freq: str) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """Appends `horizon` future rows to each series of `Y_df`.
+
+    The future dates of each series start after its own last timestamp,
+    they are generated once for each distinct last timestamp and broadcasted.
+    The rows are scattered into place, so the history is only sorted if it
+    was not sorted already. `Y_df` is not modified.
+
+    Parameters
+    ----------
+    Y_df: pd.DataFrame
+        Target time series with columns ['unique_id', 'ds', 'y'].
+    horizon: int
+        Number of future timestamps of each series.
+    freq: str
+        Frequency of the timestamps.
+
+    Returns
+    -------
+    Y_df: pd.DataFrame
+        Target time series sorted by ['unique_id', 'ds'] with the future rows with y=0.
+    ids: np.ndarray
+        unique_id of the future rows, of shape (n_series * horizon,).
+    ds: np.ndarray
+        ds of the future rows, of shape (n_series * horizon,).
+    """
+    codes, uids = pd.factorize(Y_df['unique_id'].to_numpy(), sort=True)
+    ds = pd.to_datetime(Y_df['ds']).to_numpy()
+    y = Y_df['y'].to_numpy()
+
+    order = _series_order(codes, ds)
+    if order is not None:
+        codes, ds, y = codes[order], ds[order], y[order]
+
+    n_series = len(uids)
+    sizes = np.bincount(codes, minlength=n_series)
+    ends = np.cumsum(sizes)
+
+    # Future dates of each series, generated once per distinct last timestamp
+    last_ds = ds[ends - 1]
+    starts, inverse = np.unique(last_ds, return_inverse=True)
+    future_ds = np.stack([pd.date_range(start, periods=horizon + 1, freq=freq)[1:].to_numpy() \
+                          for start in starts])[inverse]
+
+    # History row j of series s moves to j + horizon * s, future rows follow each series
+    shift = horizon * np.arange(n_series)
+    history_idxs = np.arange(len(ds)) + shift[codes]
+    future_idxs = ((ends + shift)[:, None] + np.arange(horizon)).flatten()
+
+    n_rows = len(ds) + n_series * horizon
+    all_ds = np.empty(n_rows, dtype=ds.dtype)
+    all_ds[history_idxs] = ds
+    all_ds[future_idxs] = future_ds.flatten()
+    all_y = np.zeros(n_rows, dtype=np.result_type(y.dtype, np.float32))
+    all_y[history_idxs] = y
+
+    ids = np.asarray(uids)
+    Y_df = pd.DataFrame({'unique_id': np.repeat(ids, sizes + horizon),
+                         'ds': all_ds,
+                         'y': all_y})
+
+    return Y_df, np.repeat(ids, horizon), future_ds.flatten()
+
+# Cell
+def tail_series(df: pd.DataFrame, n: int) -> pd.DataFrame:
+    """Last `n` rows of each series of `df`, sorted by ['unique_id', 'ds'].
+
+    Vectorized `df.sort_values(['unique_id', 'ds']).groupby('unique_id').tail(n)`,
+    used to keep only the history needed by the last window.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Time series with columns ['unique_id', 'ds'].
+    n: int
+        Number of rows kept for each series.
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Rows of `df` with the last `n` timestamps of each series.
+    """
+    codes, _ = pd.factorize(df['unique_id'].to_numpy(), sort=True)
+    ds = pd.to_datetime(df['ds']).to_numpy()
+    order = _series_order(codes, ds)
+    if order is not None:
+        codes = codes[order]
+
+    # Rows closer than n to the end of their series
+    sizes = np.bincount(codes)
+    starts = np.cumsum(sizes) - np.minimum(sizes, n)
+    idxs = np.flatnonzero(np.arange(len(codes)) >= starts[codes])
+    if order is not None:
+        idxs = order[idxs]
+
+    return df.iloc[idxs]
\ No newline at end of file
@@ -1,22 +1,30 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/models_nbeats__ensemble.ipynb (unless otherwise specified).
 
 __all__ = ['Yearly', 'Quarterly', 'Monthly', 'common_grid', 'lookbacks', 'ensemble_grid', 'print_models_list',
-           'create_loaders_M4', 'NBEATS_instantiate', 'show_tensorboard', 'NBEATSEnsemble']
+           'create_datasets_M4', 'create_loaders_M4', 'NBEATS_instantiate', 'show_tensorboard', 'VectorizedNBEATS',
+           'OnlineMedian', 'NBEATSEnsemble']
 
 # Cell
+import copy
 from dataclasses import dataclass
+from functools import partial
 from itertools import product
+import os
 from pathlib import Path
+import random
 import shutil
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from IPython.display import clear_output
 import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch import optim
 import numpy as np
 import pandas as pd
 import pytorch_lightning as pl
 from pytorch_lightning.loggers import TensorBoardLogger
 
-from .nbeats import NBEATS
+from .nbeats import NBEATS, IdentityBasis, TrendBasis, SeasonalityBasis
 from ...data.datasets.m4 import M4Info, M4
 from ...data.tsdataset import WindowsDataset
 from ...data.tsloader import TimeSeriesLoader
@@ -137,10 +145,10 @@ def print_models_list(frequencies: list, table_width: int) -> None:
         print(f'{freq_table_header}{table_width*"="}\n{freq_grid_table}\n{table_width*"="}\n')
 
 # Cell
-def create_loaders_M4(Y_df: pd.DataFrame, S_df: pd.DataFrame, hparams: dict,
-                        num_workers: int) -> Tuple[TimeSeriesLoader, TimeSeriesLoader]:
+def create_datasets_M4(Y_df: pd.DataFrame, S_df: pd.DataFrame,
+                       hparams: dict) -> Tuple[WindowsDataset, WindowsDataset]:
     """
-    Creates loaders for M4 dataset.
+    Creates train and validation datasets for M4 dataset.
 
     Parameters
     ----------
@@ -151,19 +159,14 @@ def create_loaders_M4(Y_df: pd.DataFrame, S_df: pd.DataFrame, hparams: dict,
         and static variables.
     hparams: Dictionary
         Hyperparameters for model.
-    num_workers: int
-        How many subprocesses to use for data loading.
 
     Returns
     -------
-    train_loader: TimeSeriesLoader
-        Time series loader for train dataset.
-    valid_loader: TimeSeriesLoader
-        Time series loader for validation dataset.
+    train_dataset: WindowsDataset
+        Windows dataset for train.
+    valid_dataset: WindowsDataset
+        Windows dataset for validation, with the last window of each series.
     """
-
-    print(f'Instantiating loaders (n_time_in = {hparams["n_time_in"]})...', end=' ')
-
     train_mask_df, valid_mask_df, _ = get_mask_dfs(Y_df=Y_df,
                                                    ds_in_test=0,
                                                    ds_in_val=hparams['n_time_out'])
@@ -183,18 +186,56 @@ def create_loaders_M4(Y_df: pd.DataFrame, S_df: pd.DataFrame, hparams: dict,
                                    complete_windows=hparams['complete_inputs'],
                                    last_window=True)
 
+    return train_dataset, valid_dataset
+
+def _loaders_M4(train_dataset: WindowsDataset, valid_dataset: WindowsDataset,
+                batch_size: int, num_workers: int) -> Tuple[TimeSeriesLoader, TimeSeriesLoader]:
     train_loader = TimeSeriesLoader(dataset=train_dataset,
-                                    batch_size=int(hparams['batch_size']),
+                                    batch_size=batch_size,
                                     eq_batch_size=True,
                                     num_workers=num_workers,
                                     shuffle=True)
 
     valid_loader = TimeSeriesLoader(dataset=valid_dataset,
-                                    batch_size=int(hparams['batch_size']),
+                                    batch_size=batch_size,
                                     eq_batch_size=False,
                                     num_workers=num_workers,
                                     shuffle=False)
 
+    return train_loader, valid_loader
+
+def create_loaders_M4(Y_df: pd.DataFrame, S_df: pd.DataFrame, hparams: dict,
+                        num_workers: int) -> Tuple[TimeSeriesLoader, TimeSeriesLoader]:
+    """
+    Creates loaders for M4 dataset.
+
+    Parameters
+    ----------
+    Y_df: pd.DataFrame
+        Target time series with columns ['unique_id', 'ds', 'y'].
+    S_df: pd.DataFrame
+        Static exogenous variables with columns ['unique_id', 'ds']
+        and static variables.
+    hparams: Dictionary
+        Hyperparameters for model.
+    num_workers: int
+        How many subprocesses to use for data loading.
+
+    Returns
+    -------
+    train_loader: TimeSeriesLoader
+        Time series loader for train dataset.
+    valid_loader: TimeSeriesLoader
+        Time series loader for validation dataset.
+    """
+
+    print(f'Instantiating loaders (n_time_in = {hparams["n_time_in"]})...', end=' ')
+
+    train_dataset, valid_dataset = create_datasets_M4(Y_df=Y_df, S_df=S_df, hparams=hparams)
+    train_loader, valid_loader = _loaders_M4(train_dataset, valid_dataset,
+                                             batch_size=int(hparams['batch_size']),
+                                             num_workers=num_workers)
+
     print('Data loaders ready.\n')
 
     del train_dataset, valid_dataset
@@ -229,7 +270,7 @@ def NBEATS_instantiate(hparams: dict) -> NBEATS:
                    stack_types=hparams['stack_types'],
                    n_blocks=hparams['n_blocks'],
                    n_layers=hparams['n_layers'],
-                   n_theta_hidden=hparams['n_theta_hidden'],
+                   n_mlp_units=hparams['n_theta_hidden'],
                    n_harmonics=int(hparams['n_harmonics']),
                    n_polynomials=int(hparams['n_polynomials']),
                    batch_normalization = hparams['batch_normalization'],
@@ -242,7 +283,6 @@ def NBEATS_instantiate(hparams: dict) -> NBEATS:
                    loss_hypar=int(hparams['seasonality']),
                    loss_valid=hparams['loss_val'],
                    frequency=hparams['frequency'],
-                   seasonality=int(hparams['seasonality']),
                    random_seed=int(hparams['random_seed']))
 
     return model
@@ -265,6 +305,339 @@ def show_tensorboard(logs_path: str, model_path: str) -> None:
     os.system('load_ext tensorboard')
     os.system('tensorboard --logdir $logs_model_path')
 
+# Cell
+class _StackedLinear(nn.Module):
+    """
+    Linear layers of the ensemble members stacked on a leading member axis.
+    """
+    def __init__(self, layers: List[nn.Linear]):
+        super().__init__()
+        # (n_members, in_features, out_features) and (n_members, 1, out_features)
+        self.weight = nn.Parameter(torch.stack([layer.weight.detach().t() for layer in layers]))
+        self.bias = nn.Parameter(torch.stack([layer.bias.detach()[None, :] for layer in layers]))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.baddbmm(self.bias, x, self.weight)
+
+class _VectorizedNBEATSBlock(nn.Module):
+    """
+    Same block of every ensemble member, with stacked linear layers.
+    """
+    def __init__(self, blocks: list):
+        super().__init__()
+        block = blocks[0]
+        if (block.n_x > 0) or ((block.n_s > 0) and (block.n_s_hidden > 0)):
+            raise Exception('Vectorized ensembles do not support exogenous or static variables.')
+        if not isinstance(block.basis, (IdentityBasis, TrendBasis, SeasonalityBasis)):
+            raise Exception(f'Vectorized ensembles do not support {type(block.basis).__name__} blocks.')
+
+        layers = []
+        for member_layers in zip(*[member_block.layers for member_block in blocks]):
+            layer = member_layers[0]
+            if isinstance(layer, nn.Linear):
+                layers.append(_StackedLinear(member_layers))
+            elif isinstance(layer, (nn.BatchNorm1d, nn.PReLU)):
+                raise Exception(f'Vectorized ensembles do not support {type(layer).__name__} layers.')
+            else:
+                # Stateless activations and dropout apply to the stacked members as they are
+                layers.append(layer)
+        self.layers = nn.Sequential(*layers)
+        # Templates are the same for all the members
+        self.basis = block.basis
+
+    def forward(self, insample_y: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        theta = self.layers(insample_y)
+
+        if isinstance(self.basis, IdentityBasis):
+            backcast = theta[..., :self.basis.backcast_size]
+            forecast = theta[..., -self.basis.forecast_size:]
+        else:
+            cut_point = self.basis.forecast_basis.shape[0]
+            backcast = theta[..., cut_point:] @ self.basis.backcast_basis
+            forecast = theta[..., :cut_point] @ self.basis.forecast_basis
+
+        return backcast, forecast
+
+class _VectorizedNBEATS(nn.Module):
+    """
+    N-Beats networks of the ensemble members evaluated as a batch.
+    """
+    def __init__(self, models: list):
+        super().__init__()
+        self.n_time_out = models[0].n_time_out
+        self.n_members = len(models)
+
+        # Blocks with shared weights stay shared
+        vectorized_blocks = {}
+        blocks = []
+        for i, block in enumerate(models[0].blocks):
+            if id(block) not in vectorized_blocks:
+                vectorized_blocks[id(block)] = _VectorizedNBEATSBlock([model.blocks[i] for model in models])
+            blocks.append(vectorized_blocks[id(block)])
+        self.blocks = nn.ModuleList(blocks)
+
+    def forward(self, S: torch.Tensor, Y: torch.Tensor, X: torch.Tensor,
+                insample_mask: torch.Tensor, outsample_mask: torch.Tensor):
+
+        insample_y    = Y[:, :-self.n_time_out]
+        insample_mask = insample_mask[:, :-self.n_time_out]
+
+        outsample_y    = Y[:, -self.n_time_out:]
+        outsample_mask = outsample_mask[:, -self.n_time_out:]
+
+        forecasts = self.forecast(insample_y=insample_y, insample_mask=insample_mask)
+
+        return outsample_y, forecasts, outsample_mask
+
+    def forecast(self, insample_y: torch.Tensor, insample_mask: torch.Tensor) -> torch.Tensor:
+        """Forecasts of the members of shape (n_members, batch_size, n_time_out)."""
+        residuals = insample_y.flip(dims=(-1,)).expand(self.n_members, -1, -1)
+        insample_mask = insample_mask.flip(dims=(-1,))
+
+        forecast = insample_y[:, -1:] # Level with Naive1
+        for block in self.blocks:
+            backcast, block_forecast = block(residuals)
+            residuals = (residuals - backcast) * insample_mask
+            forecast = forecast + block_forecast
+
+        return forecast
+
+def _median(forecasts: torch.Tensor) -> torch.Tensor:
+    """
+    Median over the member axis, averaging the two middle members
+    of an even ensemble like the pandas median.
+    """
+    forecasts = forecasts.sort(dim=0).values
+    n_members = forecasts.shape[0]
+
+    return (forecasts[(n_members - 1) // 2] + forecasts[n_members // 2]) / 2
+
+# Cell
+_SHARED_HPARAMS = ['n_time_in', 'n_time_out', 'n_x', 'n_s', 'shared_weights', 'activation',
+                   'stack_types', 'n_blocks', 'n_layers', 'n_mlp_units', 'n_harmonics',
+                   'n_polynomials', 'batch_normalization', 'dropout_prob_theta',
+                   'learning_rate', 'lr_decay', 'lr_decay_step_size', 'weight_decay', 'loss_valid']
+
+class VectorizedNBEATS(pl.LightningModule):
+    def __init__(self, models: List[NBEATS]):
+        """
+        Ensemble of NBEATS models trained and evaluated as a single batched network.
+        The members must share the architecture and optimization parameters,
+        they can differ in the training loss and the random seed.
+
+        Parameters
+        ----------
+        models: List[NBEATS]
+            Ensemble members. Their weights initialize the stacked network,
+            the members themselves are not updated.
+        """
+        super(VectorizedNBEATS, self).__init__()
+
+        reference = models[0]
+        for name in _SHARED_HPARAMS:
+            if any(getattr(model, name) != getattr(reference, name) for model in models):
+                raise Exception(f'Ensemble members must share {name}.')
+
+        self.n_members = len(models)
+        self.n_time_out = reference.n_time_out
+        self.loss_fns_train = [model.loss_fn_train for model in models]
+        self.loss_fn_valid = reference.loss_fn_valid
+        self.learning_rate = reference.learning_rate
+        self.lr_decay = reference.lr_decay
+        self.lr_decay_step_size = reference.lr_decay_step_size
+        self.weight_decay = reference.weight_decay
+        self.random_seed = reference.random_seed
+        # If True forward returns the forecasts of every member instead of their median
+        self.return_members = False
+
+        self.model = _VectorizedNBEATS([model.model for model in models])
+
+    def training_step(self, batch, batch_idx):
+        S = batch['S']
+        Y = batch['Y']
+        X = batch['X']
+        sample_mask = batch['sample_mask']
+        available_mask = batch['available_mask']
+
+        outsample_y, forecasts, outsample_mask = self.model(S=S, Y=Y, X=X,
+                                                            insample_mask=available_mask,
+                                                            outsample_mask=sample_mask)
+
+        loss = sum(loss_fn(y=outsample_y,
+                           y_hat=forecasts[i],
+                           mask=outsample_mask,
+                           y_insample=Y) for i, loss_fn in enumerate(self.loss_fns_train))
+
+        self.log('train_loss', loss / self.n_members, prog_bar=True, on_epoch=True)
+
+        return loss
+
+    def validation_step(self, batch, idx):
+        S = batch['S']
+        Y = batch['Y']
+        X = batch['X']
+        sample_mask = batch['sample_mask']
+        available_mask = batch['available_mask']
+
+        outsample_y, forecasts, outsample_mask = self.model(S=S, Y=Y, X=X,
+                                                            insample_mask=available_mask,
+                                                            outsample_mask=sample_mask)
+
+        loss = self.loss_fn_valid(y=outsample_y,
+                                  y_hat=_median(forecasts),
+                                  mask=outsample_mask,
+                                  y_insample=Y)
+
+        self.log('val_loss', loss, prog_bar=True)
+
+        return loss
+
+    def on_fit_start(self):
+        torch.manual_seed(self.random_seed)
+        np.random.seed(self.random_seed)
+        random.seed(self.random_seed)
+
+    def forward(self, batch):
+        S = batch['S']
+        Y = batch['Y']
+        X = batch['X']
+        sample_mask = batch['sample_mask']
+        available_mask = batch['available_mask']
+
+        outsample_y, forecasts, outsample_mask = self.model(S=S, Y=Y, X=X,
+                                                            insample_mask=available_mask,
+                                                            outsample_mask=sample_mask)
+        if self.return_members:
+            return outsample_y, forecasts, outsample_mask
+
+        return outsample_y, _median(forecasts), outsample_mask
+
+    def configure_optimizers(self):
+        optimizer = optim.Adam(self.model.parameters(),
+                               lr=self.learning_rate,
+                               weight_decay=self.weight_decay)
+
+        lr_scheduler = optim.lr_scheduler.StepLR(optimizer,
+                                                 step_size=self.lr_decay_step_size,
+                                                 gamma=self.lr_decay)
+
+        return {'optimizer': optimizer, 'lr_scheduler': lr_scheduler}
+
+# Cell
+class OnlineMedian:
+    def __init__(self, n_members: int):
+        """
+        Median of the ensemble forecasts, updated one member at a time.
+        The member forecasts are written in a preallocated buffer,
+        so no DataFrame is kept per member.
+
+        Parameters
+        ----------
+        n_members: int
+            Number of members of the ensemble.
+        """
+        self.n_members = n_members
+        self.n_updates = 0
+        self._forecasts = None
+
+    def update(self, forecast: np.ndarray) -> None:
+        """Adds the forecast of a member, of shape (n_series, n_time_out)."""
+        if self.n_updates == self.n_members:
+            raise Exception(f'All the {self.n_members} members were already added.')
+        if self._forecasts is None:
+            self._forecasts = np.empty((self.n_members, *forecast.shape), dtype=forecast.dtype)
+
+        self._forecasts[self.n_updates] = forecast
+        self.n_updates += 1
+
+    def median(self) -> np.ndarray:
+        """Median over the members added so far."""
+        if self.n_updates == 0:
+            raise Exception('No member was added.')
+
+        return np.median(self._forecasts[:self.n_updates], axis=0)
+
+    def to_df(self) -> pd.DataFrame:
+        """Median forecasts with the unique_id of each series."""
+        forecasts = pd.DataFrame(self.median())
+        forecasts.insert(0, 'unique_id', np.arange(forecasts.shape[0]))
+
+        return forecasts
+
+# Cell
+def _shared_dataset(dataset: WindowsDataset) -> WindowsDataset:
+    """
+    Copy of the dataset with its tensor in shared memory, sent to the
+    pool workers as a handle. The series list, only used at construction, is dropped;
+    meta_data is kept for `describe` and the forecasts outputs.
+    """
+    dataset = copy.copy(dataset)
+    dataset.ts_tensor = dataset.ts_tensor.share_memory_()
+    dataset.ts_data = None
+
+    return dataset
+
+def _task_dataset(dataset: WindowsDataset) -> WindowsDataset:
+    """
+    Copy of a shared dataset pickled in each task, without its per series
+    meta_data and lazy caches. The workers receive meta_data once, see `_init_worker`.
+    """
+    dataset = copy.copy(dataset)
+    dataset.meta_data = None
+    dataset._mask_cumsum = None
+    dataset._description = None
+
+    return dataset
+
+# meta_data of the panel in the pool workers, shared by the datasets of every grid row
+_worker_meta_data = None
+
+def _init_worker(n_threads: int, meta_data: Optional[list] = None) -> None:
+    global _worker_meta_data
+    torch.set_num_threads(n_threads)
+    _worker_meta_data = meta_data
+
+def _fit_members(members_hparams: List[dict],
+                 train_dataset: WindowsDataset, valid_dataset: WindowsDataset,
+                 trainer_kwargs: dict, logger_kwargs: Optional[dict],
+                 num_workers: int) -> List[np.ndarray]:
+    """
+    Trains ensemble members and returns their forecasts of shape (n_series, n_time_out).
+    Several members are trained together as a `VectorizedNBEATS`.
+    """
+    # Datasets of the pool tasks get back the meta_data of the worker
+    for dataset in (train_dataset, valid_dataset):
+        if dataset.meta_data is None:
+            dataset.meta_data = _worker_meta_data
+
+    hparams = members_hparams[0]
+    train_loader, valid_loader = _loaders_M4(train_dataset, valid_dataset,
+                                             batch_size=int(hparams['batch_size']),
+                                             num_workers=num_workers)
+
+    members = []
+    for member_hparams in members_hparams:
+        # The seed sets the initialization of each member
+        torch.manual_seed(int(member_hparams['random_seed']))
+        members.append(NBEATS_instantiate(member_hparams))
+
+    if len(members) == 1:
+        model = members[0]
+    else:
+        model = VectorizedNBEATS(members)
+        model.return_members = True
+
+    logger = TensorBoardLogger(**logger_kwargs) if logger_kwargs is not None else False
+    trainer = pl.Trainer(max_steps=int(hparams['n_steps']), logger=logger, **trainer_kwargs)
+    trainer.fit(model, train_dataloader=train_loader, val_dataloaders=train_loader)
+    outputs = trainer.predict(model, valid_loader)
+
+    forecasts = torch.cat([output[1] for output in outputs], dim=-2).detach().cpu().numpy()
+    if len(members) == 1:
+        forecasts = forecasts[None]
+
+    return list(forecasts)
+
 # Cell
 class NBEATSEnsemble:
 
@@ -301,7 +674,10 @@ class NBEATSEnsemble:
             val_freq_steps: int,
             tensorboard_logs: bool,
             logs_path: str,
-            num_workers: int) -> Dict:
+            num_workers: int,
+            vectorized: bool = False,
+            n_processes: int = 1,
+            n_threads: Optional[int] = None) -> Dict:
         """
         Train and evaluate NBEATS models for given grid of hyperparameters.
 
@@ -317,73 +693,157 @@ class NBEATSEnsemble:
             Path to directory where log will be saved.
         num_workers: int
             How many subprocesses to use for data loading.
+            Ignored with n_processes > 1, the pool workers load their own data.
+        vectorized: bool
+            If true the members of each grid row with the same number of steps
+            are trained together as a `VectorizedNBEATS`.
+        n_processes: int
+            Number of processes training members in parallel, on cpu.
+        n_threads: int
+            Number of torch threads of each process. With n_processes == 1 it is set
+            in this process during the training and restored afterwards.
+            Defaults to the cpu count divided by n_processes, or to the current
+            number of threads with n_processes == 1.
 
         Returns
         -------
         results: Dictionary
             Results dictionary that contains output dataframes for every model.
         """
+        if n_processes > 1 and self.gpus is not None:
+            raise Exception('Parallel training with n_processes > 1 is only supported on cpu.')
+        if n_threads is None:
+            n_threads = max(1, os.cpu_count() // n_processes) if n_processes > 1 else torch.get_num_threads()
 
+        trainer_kwargs = self.trainer_kwargs(val_freq_steps=val_freq_steps,
+                                             progress_bar_refresh_rate=50 if n_processes == 1 else 0)
         results = {}
 
         for freq in frequencies:
-            idx_ensemble = 0
-
             Y_df, _, S_df = M4.load(directory='data', group=freq.group.name)
-            freq_grid = _parameter_grid(freq.grid)
-            forecasts = []
-
-            if tensorboard_logs and Path(f'{logs_path}/{freq.group.name}').exists():
-                shutil.rmtree(f'{logs_path}/{freq.group.name}')
-                show_tensorboard(logs_path=logs_path, model_path=freq.group.name)
-
-            for idx_hparams, row_hparams in freq_grid.iterrows():
-                hparams = row_hparams.to_dict()
-                train_loader, test_loader = create_loaders_M4(Y_df=Y_df,
-                                                              S_df=S_df,
-                                                              hparams=hparams,
-                                                              num_workers=num_workers)
-
-                ensemble_grid = _parameter_grid(freq.ensemble_grid)
-
-                for idx_ensemble_hparams, row_ensemble_hparams in ensemble_grid.iterrows():
-                    clear_output(wait=True)
-                    idx_ensemble += 1
-                    hparams_ensemble = {**hparams, **row_ensemble_hparams.to_dict()}
+            results[freq.group.name] = self.fit_frequency(freq=freq, Y_df=Y_df, S_df=S_df,
+                                                          trainer_kwargs=trainer_kwargs,
+                                                          tensorboard_logs=tensorboard_logs,
+                                                          logs_path=logs_path,
+                                                          num_workers=num_workers,
+                                                          vectorized=vectorized,
+                                                          n_processes=n_processes,
+                                                          n_threads=n_threads)
+            del Y_df, _, S_df
 
-                    model = NBEATS_instantiate(hparams_ensemble)
-                    self.print_model_version(freq, hparams_ensemble, idx_ensemble)
-
-                    if tensorboard_logs: logger = self.create_logger(freq,
-                                                                     hparams_ensemble,
-                                                                     logs_path)
-                    else: logger = False
+        return results
 
-                    trainer = pl.Trainer(max_steps=hparams_ensemble['n_steps'],
-                                         gradient_clip_val=0,
-                                         progress_bar_refresh_rate=50,
-                                         gpus=self.gpus,
-                                         auto_select_gpus=self.auto_select_gpus,
-                                         check_val_every_n_epoch=val_freq_steps,
-                                         logger=logger)
-                    trainer.fit(model, train_dataloader=train_loader, val_dataloaders=train_loader)
-                    outputs = trainer.predict(model, test_loader)
+    def fit_frequency(self,
+                      freq: type,
+                      Y_df: pd.DataFrame,
+                      S_df: pd.DataFrame,
+                      trainer_kwargs: dict,
+                      tensorboard_logs: bool,
+                      logs_path: str,
+                      num_workers: int,
+                      vectorized: bool,
+                      n_processes: int,
+                      n_threads: int) -> pd.DataFrame:
+        """
+        Trains the members of a frequency on its panel and returns their median forecasts.
+        See `fit` for the parameters.
+        """
+        idx_ensemble = 0
 
-                    outputs_df = self.outputs_to_df(outputs, idx_ensemble)
-                    forecasts.append(outputs_df.copy())
+        freq_grid = _parameter_grid(freq.grid)
+        ensemble_grid = _parameter_grid(freq.ensemble_grid)
+        aggregator = OnlineMedian(n_members=len(freq_grid) * len(ensemble_grid))
 
-                    del trainer, model, outputs, outputs_df
+        # Members trained by the same task
+        if vectorized:
+            groups = [steps_grid for _, steps_grid in ensemble_grid.groupby('n_steps', sort=False)]
+        else:
+            groups = [ensemble_grid.iloc[[i]] for i in range(len(ensemble_grid))]
 
-                del train_loader, test_loader
+        if tensorboard_logs and Path(f'{logs_path}/{freq.group.name}').exists():
+            shutil.rmtree(f'{logs_path}/{freq.group.name}')
+            show_tensorboard(logs_path=logs_path, model_path=freq.group.name)
 
-            forecasts = pd.concat(forecasts).groupby('unique_id').median(0)
-            forecasts.reset_index(inplace=True)
+        # The serial path trains in this process
+        parent_threads = torch.get_num_threads()
+        if n_processes == 1:
+            torch.set_num_threads(n_threads)
 
-            results[freq.group.name] = forecasts.copy()
+        # Shared datasets of each grid row stay referenced until its tasks are done
+        pool, pending, datasets, n_pending = None, [], {}, {}
 
-            del forecasts, Y_df, _, S_df
+        def update(forecasts, idx_hparams=None):
+            for forecast in forecasts:
+                aggregator.update(forecast)
+            if idx_hparams is not None:
+                n_pending[idx_hparams] -= 1
+                if n_pending[idx_hparams] == 0:
+                    del datasets[idx_hparams]
 
-        return results
+        try:
+            for idx_hparams, row_hparams in freq_grid.iterrows():
+                hparams = row_hparams.to_dict()
+                train_dataset, valid_dataset = create_datasets_M4(Y_df=Y_df, S_df=S_df, hparams=hparams)
+                if n_processes > 1:
+                    if pool is None:
+                        # The meta_data of the panel is the same for every grid row,
+                        # it is sent once to each worker instead of with each task
+                        pool = mp.get_context('spawn').Pool(n_processes,
+                                                            initializer=_init_worker,
+                                                            initargs=(n_threads, train_dataset.meta_data))
+                    train_dataset, valid_dataset = _shared_dataset(train_dataset), _shared_dataset(valid_dataset)
+                    datasets[idx_hparams] = (train_dataset, valid_dataset)
+                    n_pending[idx_hparams] = len(groups)
+
+                for group in groups:
+                    clear_output(wait=True)
+                    members_hparams = [{**hparams, **row.to_dict()} for _, row in group.iterrows()]
+                    for member_hparams in members_hparams:
+                        idx_ensemble += 1
+                        self.print_model_version(freq, member_hparams, idx_ensemble)
+
+                    if tensorboard_logs: logger_kwargs = self.logger_kwargs(freq,
+                                                                            members_hparams,
+                                                                            logs_path)
+                    else: logger_kwargs = None
+
+                    if pool is None:
+                        update(_fit_members(members_hparams, train_dataset, valid_dataset,
+                                            trainer_kwargs, logger_kwargs, num_workers))
+                    else:
+                        # Pool workers are daemonic and cannot start data loading workers
+                        pending.append(pool.apply_async(_fit_members,
+                                                        (members_hparams,
+                                                         _task_dataset(train_dataset),
+                                                         _task_dataset(valid_dataset),
+                                                         trainer_kwargs, logger_kwargs, 0),
+                                                        callback=partial(update, idx_hparams=idx_hparams)))
+
+                del train_dataset, valid_dataset
+
+            if pool is not None:
+                pool.close()
+                pool.join()
+                # Raises the errors of the workers
+                for result in pending:
+                    result.get()
+        finally:
+            # Stops the workers if a task or the parent failed
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            torch.set_num_threads(parent_threads)
+
+        return aggregator.to_df()
+
+    def trainer_kwargs(self, val_freq_steps, progress_bar_refresh_rate=50):
+        trainer_kwargs = dict(gradient_clip_val=0,
+                              progress_bar_refresh_rate=progress_bar_refresh_rate,
+                              gpus=self.gpus,
+                              auto_select_gpus=self.auto_select_gpus,
+                              check_val_every_n_epoch=val_freq_steps)
+
+        return trainer_kwargs
 
     def outputs_to_df(self, outputs, idx_ensemble):
         outputs_df = torch.vstack([outputs[i][1] \
@@ -395,15 +855,23 @@ class NBEATSEnsemble:
         return outputs_df
 
     def create_logger(self, freq, hparams, logs_path):
-        name = freq.group.name
-        version  = f'loss-{hparams["loss_train"]}_'
-        version += f'lbl-{hparams["n_time_in"] // freq.group.horizon}_'
-        version += f'_rs-{hparams["random_seed"]}'
-
-        logger = TensorBoardLogger(logs_path, name=name, version=version, default_hp_metric=False)
+        logger = TensorBoardLogger(**self.logger_kwargs(freq, [hparams], logs_path))
 
         return logger
 
+    def logger_kwargs(self, freq, members_hparams, logs_path):
+        hparams = members_hparams[0]
+        name = freq.group.name
+        if len(members_hparams) == 1:
+            version  = f'loss-{hparams["loss_train"]}_'
+            version += f'lbl-{hparams["n_time_in"] // freq.group.horizon}_'
+            version += f'_rs-{hparams["random_seed"]}'
+        else:
+            version  = f'lbl-{hparams["n_time_in"] // freq.group.horizon}_'
+            version += f'steps-{hparams["n_steps"]}'
+
+        return dict(save_dir=logs_path, name=name, version=version, default_hp_metric=False)
+
     def print_model_version(self, freq, hparams, idx_ensemble):
         n_models = len(freq.ensemble_grid['loss_train']) * \
                    len(freq.grid['n_time_in']) * \
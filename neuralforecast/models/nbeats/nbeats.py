@@ -6,7 +6,7 @@ __all__ = ['IdentityBasis', 'TrendBasis', 'SeasonalityBasis', 'ExogenousBasisInt
 # Cell
 import math
 from functools import partial
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from fastcore.foundation import patch
 
 import numpy as np
@@ -14,6 +14,7 @@ import pandas as pd
 import pytorch_lightning as pl
 import torch as t
 import torch.nn as nn
+import torch.nn.functional as F
 from hyperopt import hp
 
 from ..components.tcn import _TemporalConvNet
@@ -21,6 +22,8 @@ from ..components.common import Chomp1d, RepeatVector
 from ...losses.utils import LossFunction
 from ...data.tsdataset import WindowsDataset
 from ...data.tsloader import TimeSeriesLoader
+from ..inference import get_runner, make_future_dataframe
+from ..quantization import quantize_dynamic
 
 # Cell
 class _StaticFeaturesEncoder(nn.Module):
@@ -66,12 +69,13 @@ class TrendBasis(nn.Module):
     def __init__(self, degree_of_polynomial: int, backcast_size: int, forecast_size: int):
         super().__init__()
         polynomial_size = degree_of_polynomial + 1
-        self.backcast_basis = nn.Parameter(
+        # Constant templates, buffers with the state dict keys of the former parameters
+        self.register_buffer('backcast_basis',
             t.tensor(np.concatenate([np.power(np.arange(backcast_size, dtype=float) / backcast_size, i)[None, :]
-                                    for i in range(polynomial_size)]), dtype=t.float32), requires_grad=False)
-        self.forecast_basis = nn.Parameter(
+                                    for i in range(polynomial_size)]), dtype=t.float32))
+        self.register_buffer('forecast_basis',
             t.tensor(np.concatenate([np.power(np.arange(forecast_size, dtype=float) / forecast_size, i)[None, :]
-                                    for i in range(polynomial_size)]), dtype=t.float32), requires_grad=False)
+                                    for i in range(polynomial_size)]), dtype=t.float32))
 
     def forward(self, theta: t.Tensor, insample_x_t: t.Tensor, outsample_x_t: t.Tensor) -> Tuple[t.Tensor, t.Tensor]:
         cut_point = self.forecast_basis.shape[0]
@@ -98,8 +102,9 @@ class SeasonalityBasis(nn.Module):
         forecast_sin_template = t.tensor(np.transpose(np.sin(forecast_grid)), dtype=t.float32)
         forecast_template = t.cat([forecast_cos_template, forecast_sin_template], dim=0)
 
-        self.backcast_basis = nn.Parameter(backcast_template, requires_grad=False)
-        self.forecast_basis = nn.Parameter(forecast_template, requires_grad=False)
+        # Constant templates, buffers with the state dict keys of the former parameters
+        self.register_buffer('backcast_basis', backcast_template)
+        self.register_buffer('forecast_basis', forecast_template)
 
     def forward(self, theta: t.Tensor, insample_x_t: t.Tensor, outsample_x_t: t.Tensor) -> Tuple[t.Tensor, t.Tensor]:
         cut_point = self.forecast_basis.shape[0]
@@ -266,21 +271,69 @@ class _NBEATSBlock(nn.Module):
         self.layers = nn.Sequential(*layers)
         self.basis = basis
 
-    def forward(self, insample_y: t.Tensor, insample_x_t: t.Tensor,
-                outsample_x_t: t.Tensor, x_s: t.Tensor) -> Tuple[t.Tensor, t.Tensor]:
+    def exogenous_term(self, x_t: Optional[t.Tensor], x_s: t.Tensor) -> Optional[t.Tensor]:
+        """
+        Contribution of the exogenous and static inputs to the first layer, without its bias.
+        They do not change across the blocks, so the forecast computes it before the residuals
+        loop instead of concatenating them with the residuals. None without exogenous inputs.
 
-        batch_size = len(insample_y)
+        Parameters
+        ----------
+        x_t: t.Tensor
+            Flattened insample and outsample exogenous of shape (batch_size, n_x * (n_time_in + n_time_out)).
+        x_s: t.Tensor
+            Static exogenous of shape (batch_size, n_s).
+        """
+        first_layer = self.layers[0]
+        has_static = (self.n_s > 0) and (self.n_s_hidden > 0)
+        # Quantized layers keep the concatenation
+        if not isinstance(first_layer, nn.Linear) or ((self.n_x == 0) and not has_static):
+            return None
+
+        n_x_t = self.n_x * (self.n_time_in + self.n_time_out)
+        start = first_layer.in_features - n_x_t - (self.n_s_hidden if has_static else 0)
+        term = None
         if self.n_x > 0:
-            insample_y = t.cat(( insample_y, insample_x_t.reshape(batch_size, -1) ), 1)
-            insample_y = t.cat(( insample_y, outsample_x_t.reshape(batch_size, -1) ), 1)
+            term = F.linear(x_t, first_layer.weight[:, start:start + n_x_t])
+        if has_static:
+            static_term = F.linear(self.static_encoder(x_s), first_layer.weight[:, start + n_x_t:])
+            term = static_term if term is None else term + static_term
+
+        return term
+
+    def theta(self, insample_y: t.Tensor, insample_x_t: t.Tensor,
+              outsample_x_t: t.Tensor, x_s: t.Tensor,
+              exogenous_term: Optional[t.Tensor] = None) -> t.Tensor:
+        """Coefficients of the basis projection."""
+
+        if exogenous_term is not None:
+            # First layer split in the insample_y part and the precomputed exogenous part
+            first_layer = self.layers[0]
+            theta = F.linear(insample_y, first_layer.weight[:, :insample_y.shape[1]], first_layer.bias)
+            theta = theta + exogenous_term
+            for layer in list(self.layers)[1:]:
+                theta = layer(theta)
+            return theta
+
+        # Flattened without the batch size, so it is not fixed when traced
+        if self.n_x > 0:
+            insample_y = t.cat(( insample_y, insample_x_t.flatten(start_dim=1) ), 1)
+            insample_y = t.cat(( insample_y, outsample_x_t.flatten(start_dim=1) ), 1)
 
         # Static exogenous
         if (self.n_s > 0) and (self.n_s_hidden > 0):
             x_s = self.static_encoder(x_s)
             insample_y = t.cat((insample_y, x_s), 1)
 
-        # Compute local projection weights and projection
-        theta = self.layers(insample_y)
+        # Compute local projection weights
+        return self.layers(insample_y)
+
+    def forward(self, insample_y: t.Tensor, insample_x_t: t.Tensor,
+                outsample_x_t: t.Tensor, x_s: t.Tensor,
+                exogenous_term: Optional[t.Tensor] = None) -> Tuple[t.Tensor, t.Tensor]:
+
+        theta = self.theta(insample_y=insample_y, insample_x_t=insample_x_t,
+                           outsample_x_t=outsample_x_t, x_s=x_s, exogenous_term=exogenous_term)
         backcast, forecast = self.basis(theta, insample_x_t, outsample_x_t)
 
         return backcast, forecast
@@ -340,6 +393,8 @@ class _NBEATS(nn.Module):
 
         block_list = []
         for i in range(len(stack_types)):
+            # Trend and seasonality templates shared by the blocks of the stack
+            stack_basis = None
             for block_id in range(n_blocks[i]):
 
                 # Batch norm only on first block
@@ -354,15 +409,19 @@ class _NBEATS(nn.Module):
                 else:
                     if stack_types[i] == 'seasonality':
                         n_theta = 4 * int(np.ceil(n_harmonics / 2 * n_time_out) - (n_harmonics - 1))
-                        basis = SeasonalityBasis(harmonics=n_harmonics,
-                                                 backcast_size=n_time_in,
-                                                 forecast_size=n_time_out)
+                        if stack_basis is None:
+                            stack_basis = SeasonalityBasis(harmonics=n_harmonics,
+                                                           backcast_size=n_time_in,
+                                                           forecast_size=n_time_out)
+                        basis = stack_basis
 
                     elif stack_types[i] == 'trend':
                         n_theta = 2 * (n_polynomials + 1)
-                        basis = TrendBasis(degree_of_polynomial=n_polynomials,
-                                           backcast_size=n_time_in,
-                                           forecast_size=n_time_out)
+                        if stack_basis is None:
+                            stack_basis = TrendBasis(degree_of_polynomial=n_polynomials,
+                                                     backcast_size=n_time_in,
+                                                     forecast_size=n_time_out)
+                        basis = stack_basis
 
                     elif stack_types[i] == 'identity':
                         n_theta = n_time_in + n_time_out
@@ -433,19 +492,68 @@ class _NBEATS(nn.Module):
                                      x_s=S)
             return outsample_y, forecast, outsample_mask
 
+    def exogenous_terms(self, insample_x_t: t.Tensor, outsample_x_t: t.Tensor,
+                        x_s: t.Tensor) -> List[Optional[t.Tensor]]:
+        """
+        Exogenous terms of the first layer of each block, computed once per forecast.
+        In eval mode blocks with shared weights reuse the same term. In training
+        each block computes its own, so the dropout of the static encoder keeps
+        drawing a mask per block.
+        """
+        # Flattened once for all the blocks
+        x_t = None
+        if self.n_x > 0:
+            x_t = t.cat((insample_x_t.flatten(start_dim=1), outsample_x_t.flatten(start_dim=1)), 1)
+
+        if self.training:
+            return [block.exogenous_term(x_t, x_s) for block in self.blocks]
+
+        # Blocks with shared weights have the same term
+        terms = {}
+        for block in self.blocks:
+            if id(block) not in terms:
+                terms[id(block)] = block.exogenous_term(x_t, x_s)
+
+        return [terms[id(block)] for block in self.blocks]
+
     def forecast(self, insample_y: t.Tensor, insample_x_t: t.Tensor, insample_mask: t.Tensor,
                  outsample_x_t: t.Tensor, x_s: t.Tensor):
 
         residuals = insample_y.flip(dims=(-1,))
         insample_x_t = insample_x_t.flip(dims=(-1,))
         insample_mask = insample_mask.flip(dims=(-1,))
+        exogenous_terms = self.exogenous_terms(insample_x_t, outsample_x_t, x_s)
+
+        # The forecast of the trend and seasonality blocks is linear in theta,
+        # so the theta of the blocks sharing the templates of a stack are
+        # summed and projected once. Only the backcasts run per block.
+        stack_bases, stack_thetas = {}, {}
 
         forecast = insample_y[:, -1:] # Level with Naive1
         for i, block in enumerate(self.blocks):
-            backcast, block_forecast = block(insample_y=residuals, insample_x_t=insample_x_t,
-                                             outsample_x_t=outsample_x_t, x_s=x_s)
+            if isinstance(block.basis, (TrendBasis, SeasonalityBasis)):
+                basis = block.basis
+                theta = block.theta(insample_y=residuals, insample_x_t=insample_x_t,
+                                    outsample_x_t=outsample_x_t, x_s=x_s,
+                                    exogenous_term=exogenous_terms[i])
+                cut_point = basis.forecast_basis.shape[0]
+                backcast = theta[:, cut_point:] @ basis.backcast_basis
+
+                key = id(basis)
+                stack_bases[key] = basis
+                if key in stack_thetas:
+                    stack_thetas[key] = stack_thetas[key] + theta[:, :cut_point]
+                else:
+                    stack_thetas[key] = theta[:, :cut_point]
+            else:
+                backcast, block_forecast = block(insample_y=residuals, insample_x_t=insample_x_t,
+                                                 outsample_x_t=outsample_x_t, x_s=x_s,
+                                                 exogenous_term=exogenous_terms[i])
+                forecast = forecast + block_forecast
             residuals = (residuals - backcast) * insample_mask
-            forecast = forecast + block_forecast
+
+        for key, theta in stack_thetas.items():
+            forecast = forecast + theta @ stack_bases[key].forecast_basis
 
         return forecast
 
@@ -455,6 +563,7 @@ class _NBEATS(nn.Module):
         residuals = insample_y.flip(dims=(-1,))
         insample_x_t = insample_x_t.flip(dims=(-1,))
         insample_mask = insample_mask.flip(dims=(-1,))
+        exogenous_terms = self.exogenous_terms(insample_x_t, outsample_x_t, x_s)
 
         n_batch, n_channels, n_t = outsample_x_t.size(0), outsample_x_t.size(1), outsample_x_t.size(2)
 
@@ -464,7 +573,8 @@ class _NBEATS(nn.Module):
         forecast = level
         for i, block in enumerate(self.blocks):
             backcast, block_forecast = block(insample_y=residuals, insample_x_t=insample_x_t,
-                                             outsample_x_t=outsample_x_t, x_s=x_s)
+                                             outsample_x_t=outsample_x_t, x_s=x_s,
+                                             exogenous_term=exogenous_terms[i])
             residuals = (residuals - backcast) * insample_mask
             forecast = forecast + block_forecast
             block_forecasts.append(block_forecast)
@@ -511,7 +621,8 @@ class NBEATS(pl.LightningModule):
                  loss_hypar: float = 0.,
                  loss_valid: str = 'MAE',
                  frequency: str = 'D',
-                 random_seed: int = 1):
+                 random_seed: int = 1,
+                 calendar_cols: Optional[List[str]] = None):
         super(NBEATS, self).__init__()
         """
         N-BEATS model.
@@ -586,6 +697,9 @@ class NBEATS(pl.LightningModule):
         random_seed: int
             random_seed for pseudo random pytorch initializer and
             numpy random generator.
+        calendar_cols: List[str]
+            Calendar features of the training datasets, see CALENDAR_GENERATORS.
+            The forecast datasets compute the same features.
         """
 
         if activation == 'SELU': initialization = 'lecun_normal'
@@ -630,6 +744,7 @@ class NBEATS(pl.LightningModule):
 
         # Data parameters
         self.frequency = frequency
+        self.calendar_cols = calendar_cols
         self.return_decomposition = False
 
         self.model = _NBEATS(n_time_in=self.n_time_in,
@@ -732,9 +847,10 @@ class NBEATS(pl.LightningModule):
 # Cell
 @patch
 def forecast(self: NBEATS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: pd.DataFrame = None,
-                batch_size: int=1, trainer: pl.Trainer =None) -> pd.DataFrame:
+                batch_size: int=1, trainer: pl.Trainer =None, return_numpy: bool = False,
+                backend: Optional[Callable] = None) -> pd.DataFrame:
     """
-    Method for forecasting self.n_time_out periods after last timestamp of Y_df.
+    Method for forecasting self.n_time_out periods after the last timestamp of each series of Y_df.
 
     Parameters
     ----------
@@ -749,23 +865,28 @@ def forecast(self: NBEATS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df:
         Batch size for forecasting.
     trainer: pl.Trainer
         Trainer object for model training and evaluation.
+        If None the forecast runs without trainer with the model `InferenceRunner`.
 
+    return_numpy: bool
+        If True returns the arrays (ids, ds, y_hat) instead of a dataframe.
+    backend: Callable, optional
+        Called with each batch instead of the model, for example an
+        `OnnxRuntimeBackend` of the exported forecast. Only used without trainer.
 
     Returns
     ----------
     forecast_df: pd.DataFrame
         Dataframe with forecasts.
+        If return_numpy, tuple of arrays (ids, ds, y_hat) of the forecasts.
     """
 
+    if (backend is not None) and (trainer is not None):
+        raise Exception('The backend runs the forecast without trainer')
+
     # Add forecast dates to Y_df
-    Y_df['ds'] = pd.to_datetime(Y_df['ds'])
     if X_df is not None:
-        X_df['ds'] = pd.to_datetime(X_df['ds'])
-    forecast_dates = pd.date_range(Y_df['ds'].max(), periods=self.n_time_out+1, freq=self.frequency)[1:]
-    index = pd.MultiIndex.from_product([Y_df['unique_id'].unique(), forecast_dates], names=['unique_id', 'ds'])
-    forecast_df = pd.DataFrame({'y':[0]}, index=index).reset_index()
-
-    Y_df = Y_df.append(forecast_df).sort_values(['unique_id','ds']).reset_index(drop=True)
+        X_df = X_df.assign(ds=pd.to_datetime(X_df['ds']))
+    Y_df, ids, ds = make_future_dataframe(Y_df, horizon=self.n_time_out, freq=self.frequency)
 
     # Dataset, loader and trainer
     dataset = WindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -774,30 +895,61 @@ def forecast(self: NBEATS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df:
                                 output_size=self.n_time_out,
                                 sample_freq=1,
                                 complete_windows=True,
+                                final_windows=True,
                                 ds_in_test=self.n_time_out,
                                 is_test=True,
+                                calendar_cols=self.calendar_cols,
                                 verbose=True)
 
     loader = TimeSeriesLoader(dataset=dataset,
                                 batch_size=batch_size,
                                 shuffle=False)
 
+    # Forecast
     if trainer is None:
-        gpus = -1 if t.cuda.is_available() else 0
-        trainer = pl.Trainer(progress_bar_refresh_rate=1,
-                             gpus=gpus,
-                             logger=False)
+        forecast, = get_runner(self).run(loader, copy=False, transform=lambda outputs: [outputs[1]],
+                                         forward=backend)
+    else:
+        outputs = trainer.predict(self, loader)
+        _, forecast, _ = [t.cat(output).cpu().numpy() for output in zip(*outputs)]
 
-    # Forecast
-    outputs = trainer.predict(self, loader)
+    # Process forecast
+    y_hat = forecast.flatten()
+    if return_numpy:
+        return ids, ds, y_hat
 
-    # Process forecast and include in forecast_df
-    _, forecast, _ = [t.cat(output).cpu().numpy() for output in zip(*outputs)]
-    forecast_df['y'] = forecast.flatten()
+    forecast_df = pd.DataFrame({'unique_id': ids, 'ds': ds, 'y': y_hat})
 
     return forecast_df
 
 
+# Cell
+@patch
+def quantize(self: NBEATS, valid_loader: Optional[TimeSeriesLoader] = None,
+             calibration_loader: Optional[TimeSeriesLoader] = None,
+             tolerance: float = 0.01) -> Tuple['NBEATS', Dict]:
+    """
+    Dynamic int8 quantization of the Linear layers for CPU forecasts, see `quantize_dynamic`.
+
+    Parameters
+    ----------
+    valid_loader: TimeSeriesLoader, optional
+        Validation loader where the loss delta of the quantization is reported.
+    calibration_loader: TimeSeriesLoader, optional
+        Loader where the layers that increase the loss more than `tolerance` are kept in float.
+    tolerance: float
+        Maximum relative increase of the calibration loss.
+
+    Returns
+    -------
+    quantized: NBEATS
+        Quantized copy of the model.
+    report: Dict
+        Quantized layers and valid losses of the float and quantized models.
+    """
+    return quantize_dynamic(self, valid_loader=valid_loader,
+                            calibration_loader=calibration_loader, tolerance=tolerance)
+
 # Cell
 def suggested_space(n_time_out: int, n_series: int, n_x: int, n_s: int,
                     frequency: str) -> dict:
@@ -6,7 +6,7 @@ __all__ = ['ACTIVATIONS', 'NHITS', 'suggested_space']
 import math
 import random
 from functools import partial
-from typing import Tuple, List
+from typing import Callable, Dict, List, Optional, Tuple
 from fastcore.foundation import patch
 
 import numpy as np
@@ -23,6 +23,8 @@ from ..components.common import Chomp1d, RepeatVector
 from ...losses.utils import LossFunction
 from ...data.tsdataset import WindowsDataset
 from ...data.tsloader import TimeSeriesLoader
+from ..inference import get_runner, make_future_dataframe
+from ..quantization import quantize_dynamic
 
 # Cell
 class _StaticFeaturesEncoder(nn.Module):
@@ -53,35 +55,45 @@ class _sEncoder(nn.Module):
         return x
 
 # Cell
+def _interpolation_matrix(n_knots: int, forecast_size: int, interpolation_mode: str) -> t.Tensor:
+    """
+    Matrix W of shape (n_knots, forecast_size) such that knots @ W
+    is the interpolation of the knots to forecast_size.
+    Interpolation is linear on the knots, so W is the interpolation of the identity.
+    """
+    identity = t.eye(n_knots, dtype=t.float64)
+    if interpolation_mode in ['linear', 'nearest']:
+        matrix = F.interpolate(identity[:,None,:], size=forecast_size, mode=interpolation_mode)
+        matrix = matrix[:,0,:]
+    elif 'cubic' in interpolation_mode:
+        matrix = F.interpolate(identity[:,None,None,:], size=forecast_size, mode='bicubic')
+        matrix = matrix[:,0,0,:]
+
+    return matrix.float()
+
 class _IdentityBasis(nn.Module):
-    def __init__(self, backcast_size: int, forecast_size: int, interpolation_mode: str):
+    def __init__(self, backcast_size: int, forecast_size: int, interpolation_mode: str, n_knots: int = None):
         super().__init__()
         assert (interpolation_mode in ['linear','nearest']) or ('cubic' in interpolation_mode)
         self.forecast_size = forecast_size
         self.backcast_size = backcast_size
         self.interpolation_mode = interpolation_mode
 
+        # Knots to forecast operator, not persistent so checkpoints are unchanged
+        interpolation_matrix = None
+        if n_knots is not None:
+            interpolation_matrix = _interpolation_matrix(n_knots, forecast_size, interpolation_mode)
+        self.register_buffer('interpolation_matrix', interpolation_matrix, persistent=False)
+
     def forward(self, theta: t.Tensor, insample_x_t: t.Tensor, outsample_x_t: t.Tensor) -> Tuple[t.Tensor, t.Tensor]:
 
         backcast = theta[:, :self.backcast_size]
         knots = theta[:, self.backcast_size:]
 
-        if self.interpolation_mode=='nearest':
-            knots = knots[:,None,:]
-            forecast = F.interpolate(knots, size=self.forecast_size, mode=self.interpolation_mode)
-            forecast = forecast[:,0,:]
-        elif self.interpolation_mode=='linear':
-            knots = knots[:,None,:]
-            forecast = F.interpolate(knots, size=self.forecast_size, mode=self.interpolation_mode)
-            forecast = forecast[:,0,:]
-        elif 'cubic' in self.interpolation_mode:
-            batch_size = len(backcast)
-            knots = knots[:,None,None,:]
-            forecast = t.zeros((len(knots), self.forecast_size)).to(knots.device)
-            n_batches = int(np.ceil(len(knots)/batch_size))
-            for i in range(n_batches):
-                forecast_i = F.interpolate(knots[i*batch_size:(i+1)*batch_size], size=self.forecast_size, mode='bicubic')
-                forecast[i*batch_size:(i+1)*batch_size] += forecast_i[:,0,0,:]
+        if self.interpolation_matrix is None:
+            self.interpolation_matrix = _interpolation_matrix(knots.shape[1], self.forecast_size,
+                                                              self.interpolation_mode).to(knots)
+        forecast = knots @ self.interpolation_matrix
 
         return backcast, forecast
 
@@ -256,17 +268,58 @@ class _NHITSBlock(nn.Module):
         self.layers = nn.Sequential(*layers)
         self.basis = basis
 
+    def exogenous_term(self, x_t: Optional[t.Tensor], x_s: t.Tensor) -> Optional[t.Tensor]:
+        """
+        Contribution of the exogenous and static inputs to the first layer, without its bias.
+        They do not change across the blocks, so the forecast computes it before the residuals
+        loop instead of concatenating them with the residuals. None without exogenous inputs.
+
+        Parameters
+        ----------
+        x_t: t.Tensor
+            Flattened insample and outsample exogenous of shape (batch_size, n_x * (n_time_in + n_time_out)).
+        x_s: t.Tensor
+            Static exogenous of shape (batch_size, n_s).
+        """
+        first_layer = self.layers[0]
+        has_static = (self.n_s > 0) and (self.n_s_hidden > 0)
+        # Quantized layers keep the concatenation
+        if not isinstance(first_layer, nn.Linear) or ((self.n_x == 0) and not has_static):
+            return None
+
+        n_x_t = self.n_x * (self.n_time_in + self.n_time_out)
+        start = first_layer.in_features - n_x_t - (self.n_s_hidden if has_static else 0)
+        term = None
+        if self.n_x > 0:
+            term = F.linear(x_t, first_layer.weight[:, start:start + n_x_t])
+        if has_static:
+            static_term = F.linear(self.static_encoder(x_s), first_layer.weight[:, start + n_x_t:])
+            term = static_term if term is None else term + static_term
+
+        return term
+
     def forward(self, insample_y: t.Tensor, insample_x_t: t.Tensor,
-                outsample_x_t: t.Tensor, x_s: t.Tensor) -> Tuple[t.Tensor, t.Tensor]:
+                outsample_x_t: t.Tensor, x_s: t.Tensor,
+                exogenous_term: Optional[t.Tensor] = None) -> Tuple[t.Tensor, t.Tensor]:
 
         insample_y = insample_y.unsqueeze(1)
         insample_y = self.pooling_layer(insample_y)
         insample_y = insample_y.squeeze(1)
 
-        batch_size = len(insample_y)
+        if exogenous_term is not None:
+            # First layer split in the insample_y part and the precomputed exogenous part
+            first_layer = self.layers[0]
+            theta = F.linear(insample_y, first_layer.weight[:, :insample_y.shape[1]], first_layer.bias)
+            theta = theta + exogenous_term
+            for layer in list(self.layers)[1:]:
+                theta = layer(theta)
+            backcast, forecast = self.basis(theta, insample_x_t, outsample_x_t)
+            return backcast, forecast
+
+        # Flattened without the batch size, so it is not fixed when traced
         if self.n_x > 0:
-            insample_y = t.cat(( insample_y, insample_x_t.reshape(batch_size, -1) ), 1)
-            insample_y = t.cat(( insample_y, outsample_x_t.reshape(batch_size, -1) ), 1)
+            insample_y = t.cat(( insample_y, insample_x_t.flatten(start_dim=1) ), 1)
+            insample_y = t.cat(( insample_y, outsample_x_t.flatten(start_dim=1) ), 1)
 
         # Static exogenous
         if (self.n_s > 0) and (self.n_s_hidden > 0):
@@ -355,7 +408,8 @@ class _NHITS(nn.Module):
                         n_theta = (n_time_in + max(n_time_out//n_freq_downsample[i], 1) )
                         basis = _IdentityBasis(backcast_size=n_time_in,
                                               forecast_size=n_time_out,
-                                              interpolation_mode=interpolation_mode)
+                                              interpolation_mode=interpolation_mode,
+                                              n_knots=max(n_time_out//n_freq_downsample[i], 1))
 
                     elif stack_types[i] == 'exogenous':
                         n_theta = 2 * n_x
@@ -420,17 +474,43 @@ class _NHITS(nn.Module):
                                      x_s=S)
             return outsample_y, forecast, outsample_mask
 
+    def exogenous_terms(self, insample_x_t: t.Tensor, outsample_x_t: t.Tensor,
+                        x_s: t.Tensor) -> List[Optional[t.Tensor]]:
+        """
+        Exogenous terms of the first layer of each block, computed once per forecast.
+        In eval mode blocks with shared weights reuse the same term. In training
+        each block computes its own, so the dropout of the static encoder keeps
+        drawing a mask per block.
+        """
+        # Flattened once for all the blocks
+        x_t = None
+        if self.n_x > 0:
+            x_t = t.cat((insample_x_t.flatten(start_dim=1), outsample_x_t.flatten(start_dim=1)), 1)
+
+        if self.training:
+            return [block.exogenous_term(x_t, x_s) for block in self.blocks]
+
+        # Blocks with shared weights have the same term
+        terms = {}
+        for block in self.blocks:
+            if id(block) not in terms:
+                terms[id(block)] = block.exogenous_term(x_t, x_s)
+
+        return [terms[id(block)] for block in self.blocks]
+
     def forecast(self, insample_y: t.Tensor, insample_x_t: t.Tensor, insample_mask: t.Tensor,
                  outsample_x_t: t.Tensor, x_s: t.Tensor):
 
         residuals = insample_y.flip(dims=(-1,))
         insample_x_t = insample_x_t.flip(dims=(-1,))
         insample_mask = insample_mask.flip(dims=(-1,))
+        exogenous_terms = self.exogenous_terms(insample_x_t, outsample_x_t, x_s)
 
         forecast = insample_y[:, -1:] # Level with Naive1
         for i, block in enumerate(self.blocks):
             backcast, block_forecast = block(insample_y=residuals, insample_x_t=insample_x_t,
-                                             outsample_x_t=outsample_x_t, x_s=x_s)
+                                             outsample_x_t=outsample_x_t, x_s=x_s,
+                                             exogenous_term=exogenous_terms[i])
             residuals = (residuals - backcast) * insample_mask
             forecast = forecast + block_forecast
 
@@ -442,6 +522,7 @@ class _NHITS(nn.Module):
         residuals = insample_y.flip(dims=(-1,))
         insample_x_t = insample_x_t.flip(dims=(-1,))
         insample_mask = insample_mask.flip(dims=(-1,))
+        exogenous_terms = self.exogenous_terms(insample_x_t, outsample_x_t, x_s)
 
         n_batch, n_channels, n_t = outsample_x_t.size(0), outsample_x_t.size(1), outsample_x_t.size(2)
 
@@ -451,7 +532,8 @@ class _NHITS(nn.Module):
         forecast = level
         for i, block in enumerate(self.blocks):
             backcast, block_forecast = block(insample_y=residuals, insample_x_t=insample_x_t,
-                                             outsample_x_t=outsample_x_t, x_s=x_s)
+                                             outsample_x_t=outsample_x_t, x_s=x_s,
+                                             exogenous_term=exogenous_terms[i])
             residuals = (residuals - backcast) * insample_mask
             forecast = forecast + block_forecast
             block_forecasts.append(block_forecast)
@@ -492,7 +574,8 @@ class NHITS(pl.LightningModule):
                  loss_hypar: float,
                  loss_valid: str,
                  frequency: str,
-                 random_seed: int):
+                 random_seed: int,
+                 calendar_cols: Optional[List[str]] = None):
         """
         N-HiTS model.
 
@@ -570,6 +653,9 @@ class NHITS(pl.LightningModule):
             random_seed: int
                 random_seed for pseudo random pytorch initializer and
                 numpy random generator.
+            calendar_cols: List[str]
+                Calendar features of the training datasets, see CALENDAR_GENERATORS.
+                The forecast datasets compute the same features.
         """
 
         super(NHITS, self).__init__()
@@ -618,6 +704,7 @@ class NHITS(pl.LightningModule):
 
         # Data parameters
         self.frequency = frequency
+        self.calendar_cols = calendar_cols
         self.return_decomposition = False
 
         self.model = _NHITS(n_time_in=self.n_time_in,
@@ -722,9 +809,10 @@ class NHITS(pl.LightningModule):
 # Cell
 @patch
 def forecast(self: NHITS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: pd.DataFrame = None,
-                batch_size: int =1, trainer: pl.Trainer =None) -> pd.DataFrame:
+                batch_size: int =1, trainer: pl.Trainer =None, return_numpy: bool = False,
+                backend: Optional[Callable] = None) -> pd.DataFrame:
     """
-    Method for forecasting self.n_time_out periods after last timestamp of Y_df.
+    Method for forecasting self.n_time_out periods after the last timestamp of each series of Y_df.
 
     Parameters
     ----------
@@ -739,22 +827,27 @@ def forecast(self: NHITS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: p
         Batch size for forecasting.
     trainer: pl.Trainer
         Trainer object for model training and evaluation.
+        If None the forecast runs without trainer with the model `InferenceRunner`.
+    return_numpy: bool
+        If True returns the arrays (ids, ds, y_hat) instead of a dataframe.
+    backend: Callable, optional
+        Called with each batch instead of the model, for example an
+        `OnnxRuntimeBackend` of the exported forecast. Only used without trainer.
 
     Returns
     ----------
     forecast_df: pd.DataFrame
         Dataframe with forecasts.
+        If return_numpy, tuple of arrays (ids, ds, y_hat) of the forecasts.
     """
 
+    if (backend is not None) and (trainer is not None):
+        raise Exception('The backend runs the forecast without trainer')
+
     # Add forecast dates to Y_df
-    Y_df['ds'] = pd.to_datetime(Y_df['ds'])
     if X_df is not None:
-        X_df['ds'] = pd.to_datetime(X_df['ds'])
-    forecast_dates = pd.date_range(Y_df['ds'].max(), periods=self.n_time_out+1, freq=self.frequency)[1:]
-    index = pd.MultiIndex.from_product([Y_df['unique_id'].unique(), forecast_dates], names=['unique_id', 'ds'])
-    forecast_df = pd.DataFrame({'y':[0]}, index=index).reset_index()
-
-    Y_df = Y_df.append(forecast_df).sort_values(['unique_id','ds']).reset_index(drop=True)
+        X_df = X_df.assign(ds=pd.to_datetime(X_df['ds']))
+    Y_df, ids, ds = make_future_dataframe(Y_df, horizon=self.n_time_out, freq=self.frequency)
 
     # Dataset, loader and trainer
     dataset = WindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -763,30 +856,61 @@ def forecast(self: NHITS, Y_df: pd.DataFrame, X_df: pd.DataFrame = None, S_df: p
                                 output_size=self.n_time_out,
                                 sample_freq=1,
                                 complete_windows=True,
+                                final_windows=True,
                                 ds_in_test=self.n_time_out,
                                 is_test=True,
+                                calendar_cols=self.calendar_cols,
                                 verbose=True)
 
     loader = TimeSeriesLoader(dataset=dataset,
                                 batch_size=batch_size,
                                 shuffle=False)
 
+    # Forecast
     if trainer is None:
-        gpus = -1 if t.cuda.is_available() else 0
-        trainer = pl.Trainer(progress_bar_refresh_rate=1,
-                             gpus=gpus,
-                             logger=False)
+        forecast, = get_runner(self).run(loader, copy=False, transform=lambda outputs: [outputs[1]],
+                                         forward=backend)
+    else:
+        outputs = trainer.predict(self, loader)
+        _, forecast, _ = [t.cat(output).cpu().numpy() for output in zip(*outputs)]
 
-    # Forecast
-    outputs = trainer.predict(self, loader)
+    # Process forecast
+    y_hat = forecast.flatten()
+    if return_numpy:
+        return ids, ds, y_hat
 
-    # Process forecast and include in forecast_df
-    _, forecast, _ = [t.cat(output).cpu().numpy() for output in zip(*outputs)]
-    forecast_df['y'] = forecast.flatten()
+    forecast_df = pd.DataFrame({'unique_id': ids, 'ds': ds, 'y': y_hat})
 
     return forecast_df
 
 
+# Cell
+@patch
+def quantize(self: NHITS, valid_loader: Optional[TimeSeriesLoader] = None,
+             calibration_loader: Optional[TimeSeriesLoader] = None,
+             tolerance: float = 0.01) -> Tuple['NHITS', Dict]:
+    """
+    Dynamic int8 quantization of the Linear layers for CPU forecasts, see `quantize_dynamic`.
+
+    Parameters
+    ----------
+    valid_loader: TimeSeriesLoader, optional
+        Validation loader where the loss delta of the quantization is reported.
+    calibration_loader: TimeSeriesLoader, optional
+        Loader where the layers that increase the loss more than `tolerance` are kept in float.
+    tolerance: float
+        Maximum relative increase of the calibration loss.
+
+    Returns
+    -------
+    quantized: NHITS
+        Quantized copy of the model.
+    report: Dict
+        Quantized layers and valid losses of the float and quantized models.
+    """
+    return quantize_dynamic(self, valid_loader=valid_loader,
+                            calibration_loader=calibration_loader, tolerance=tolerance)
+
 # Cell
 def suggested_space(n_time_out: int, n_series: int, n_x: int, n_s: int,
                     frequency: str) -> dict:
@@ -0,0 +1,140 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/models__numpy_forecast.ipynb (unless otherwise specified).
+
+__all__ = ['NumpyForecast']
+
+# Cell
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Cell
+_SELU_ALPHA = 1.6732632423543772848170429916717
+_SELU_SCALE = 1.0507009873554804934193349852946
+
+def _pool(x: np.ndarray, mode: str, kernel_size: int) -> np.ndarray:
+    """Pooling of the time axis with stride kernel_size and ceil mode, as `MaxPool1d` and `AvgPool1d`."""
+    batch_size, n_time = x.shape
+    n_pooled = -(-n_time // kernel_size)
+    n_pad = n_pooled * kernel_size - n_time
+    if mode == 'max':
+        x = np.pad(x, ((0, 0), (0, n_pad)), constant_values=-np.inf)
+        return x.reshape(batch_size, n_pooled, kernel_size).max(axis=2)
+
+    # The last window averages only the timestamps inside the input
+    x = np.pad(x, ((0, 0), (0, n_pad))).reshape(batch_size, n_pooled, kernel_size).sum(axis=2)
+    counts = np.full(n_pooled, kernel_size, dtype=x.dtype)
+    counts[-1] -= n_pad
+
+    return x / counts
+
+def _activation(layer: Dict, x: np.ndarray, arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    name = layer['type']
+    if name == 'ReLU':
+        return np.maximum(x, 0)
+    elif name == 'Tanh':
+        return np.tanh(x)
+    elif name == 'Sigmoid':
+        return np.exp(-np.logaddexp(0, -x))
+    elif name == 'Softplus':
+        beta = layer['beta']
+        return np.where(x * beta > layer['threshold'], x, np.logaddexp(0, x * beta) / beta)
+    elif name == 'SELU':
+        return _SELU_SCALE * np.where(x > 0, x, _SELU_ALPHA * np.expm1(np.minimum(x, 0)))
+    elif name == 'LeakyReLU':
+        return np.where(x >= 0, x, x * layer['negative_slope'])
+    elif name == 'PReLU':
+        return np.where(x >= 0, x, x * arrays[layer['weight']])
+
+    raise Exception(f'Layer {name} not supported')
+
+# Cell
+class NumpyForecast:
+    def __init__(self, path: str):
+        """
+        Forecast of a NHITS or NBEATS model exported with `export_numpy`.
+
+        Called like the forecast of the network, with the arrays of the `example_inputs`:
+        insample_y (batch_size, n_time_in), insample_x_t (batch_size, n_x, n_time_in),
+        insample_mask (batch_size, n_time_in), outsample_x_t (batch_size, n_x, n_time_out)
+        and x_s (batch_size, n_s).
+
+        Parameters
+        ----------
+        path: str
+            File written by `export_numpy`.
+        """
+        with np.load(path) as npz:
+            spec = json.loads(str(npz['spec']))
+            self.arrays = {key: npz[key] for key in npz.files if key != 'spec'}
+
+        self.n_time_in = spec['n_time_in']
+        self.n_time_out = spec['n_time_out']
+        self.n_x = spec['n_x']
+        self.n_s = spec['n_s']
+        # Blocks with shared weights are stored once
+        self.blocks = [spec['blocks'][i] for i in spec['order']]
+
+    def _layers(self, layers: List[Dict], x: np.ndarray) -> np.ndarray:
+        for layer in layers:
+            if layer['type'] == 'linear':
+                x = x @ self.arrays[layer['weight']]
+                if layer['bias'] is not None:
+                    x = x + self.arrays[layer['bias']]
+            else:
+                x = _activation(layer, x, self.arrays)
+
+        return x
+
+    def _project(self, theta: np.ndarray, cut: List[Optional[int]], basis: Optional[str]) -> np.ndarray:
+        theta = theta[:, slice(*cut)]
+        if basis is None:
+            return theta
+
+        return theta @ self.arrays[basis]
+
+    def _block(self, block: Dict, insample_y: np.ndarray, insample_x_t: np.ndarray,
+               outsample_x_t: np.ndarray, x_s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        x = insample_y
+        if block['pooling'] is not None:
+            x = _pool(x, **block['pooling'])
+
+        if block['n_x'] > 0:
+            batch_size = len(x)
+            x = np.concatenate([x, insample_x_t.reshape(batch_size, -1),
+                                outsample_x_t.reshape(batch_size, -1)], axis=1)
+
+        if block['static_encoder'] is not None:
+            x = np.concatenate([x, self._layers(block['static_encoder'], x_s)], axis=1)
+
+        theta = self._layers(block['layers'], x)
+
+        basis = block['basis']
+        if basis['type'] == 'exogenous':
+            cut_point = outsample_x_t.shape[1]
+            backcast = np.einsum('bp,bpt->bt', theta[:, cut_point:], insample_x_t)
+            forecast = np.einsum('bp,bpt->bt', theta[:, :cut_point], outsample_x_t)
+        else:
+            backcast = self._project(theta, basis['backcast'], basis['backcast_basis'])
+            forecast = self._project(theta, basis['forecast'], basis['forecast_basis'])
+
+        return backcast, forecast
+
+    def __call__(self, insample_y: np.ndarray, insample_x_t: np.ndarray, insample_mask: np.ndarray,
+                 outsample_x_t: np.ndarray, x_s: np.ndarray) -> np.ndarray:
+        """Forecast of shape (batch_size, n_time_out)."""
+        insample_y, insample_x_t, insample_mask, outsample_x_t, x_s = \
+            [np.asarray(x, dtype=np.float32) for x in (insample_y, insample_x_t, insample_mask, outsample_x_t, x_s)]
+
+        residuals = insample_y[:, ::-1]
+        insample_x_t = insample_x_t[:, :, ::-1]
+        insample_mask = insample_mask[:, ::-1]
+
+        forecast = insample_y[:, -1:] # Level with Naive1
+        for block in self.blocks:
+            backcast, block_forecast = self._block(block, insample_y=residuals, insample_x_t=insample_x_t,
+                                                   outsample_x_t=outsample_x_t, x_s=x_s)
+            residuals = (residuals - backcast) * insample_mask
+            forecast = forecast + block_forecast
+
+        return forecast
\ No newline at end of file
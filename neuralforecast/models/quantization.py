@@ -0,0 +1,93 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/models__quantization.ipynb (unless otherwise specified).
+
+__all__ = ['quantize_dynamic']
+
+# Cell
+import copy
+from typing import Dict, Iterable, Optional, Tuple
+
+import torch as t
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from .inference import InferenceRunner, _detached_copy
+
+# Cell
+def _valid_loss(model: nn.Module, network: nn.Module, loader: DataLoader) -> float:
+    """Mean over the batches of the loader of the valid loss of the model with the `network` forecast."""
+    network.eval()
+    losses = []
+    with t.no_grad():
+        for batch in loader:
+            outsample_y, forecast, outsample_mask = network(S=batch['S'], Y=batch['Y'], X=batch['X'],
+                                                            insample_mask=batch['available_mask'],
+                                                            outsample_mask=batch['sample_mask'],
+                                                            return_decomposition=False)
+            losses.append(model.loss_fn_valid(y=outsample_y, y_hat=forecast,
+                                              mask=outsample_mask, y_insample=batch['Y']))
+
+    if len(losses) == 0:
+        raise Exception('The loader has no batches')
+
+    return float(t.stack(losses).mean())
+
+def _quantize_network(network: nn.Module, layers: Iterable[str]) -> nn.Module:
+    """Copy of the network with the `layers` Linear modules quantized to int8."""
+    return t.quantization.quantize_dynamic(network, qconfig_spec=set(layers), dtype=t.qint8)
+
+# Cell
+def quantize_dynamic(model: nn.Module, valid_loader: Optional[DataLoader] = None,
+                     calibration_loader: Optional[DataLoader] = None,
+                     tolerance: float = 0.01) -> Tuple[nn.Module, Dict]:
+    """
+    Post training dynamic quantization of the Linear layers of a NHITS or NBEATS model.
+
+    The weights are stored in int8 and the activations are quantized
+    on the fly, which speeds up the CPU forecast and shrinks the saved model.
+    The quantized model runs on CPU only.
+
+    Parameters
+    ----------
+    model: NHITS, NBEATS
+        Trained model, it is not modified.
+    valid_loader: DataLoader, optional
+        Loader of validation windows, where the valid loss
+        of the float and quantized models is reported.
+    calibration_loader: DataLoader, optional
+        Loader of calibration windows. If given, the Linear layers are quantized
+        one at a time and kept in float when the calibration loss grows
+        more than `tolerance` relative to the float model.
+        By default all the Linear layers are quantized.
+    tolerance: float
+        Maximum relative increase of the calibration loss.
+
+    Returns
+    -------
+    quantized: NHITS, NBEATS
+        Copy of the model with the quantized network, forecast with its CPU `InferenceRunner`.
+    report: Dict
+        'layers' the names of the quantized layers and, with valid_loader,
+        'loss' and 'quantized_loss' the valid losses and 'delta' their difference.
+    """
+    model = _detached_copy(model).cpu().eval()
+
+    layers = [name for name, module in model.model.named_modules() if isinstance(module, nn.Linear)]
+    if calibration_loader is not None:
+        max_loss = _valid_loss(model, model.model, calibration_loader) * (1 + tolerance)
+        candidates, layers = layers, []
+        for layer in candidates:
+            network = _quantize_network(model.model, layers + [layer])
+            if _valid_loss(model, network, calibration_loader) <= max_loss:
+                layers.append(layer)
+
+    quantized = copy.deepcopy(model)
+    quantized.model = _quantize_network(model.model, layers)
+    quantized._inference_runner = InferenceRunner(quantized, device='cpu')
+
+    report = {'layers': layers}
+    if valid_loader is not None:
+        report['loss'] = _valid_loss(model, model.model, valid_loader)
+        report['quantized_loss'] = _valid_loss(quantized, quantized.model, valid_loader)
+        report['delta'] = report['quantized_loss'] - report['loss']
+
+    return quantized, report
\ No newline at end of file
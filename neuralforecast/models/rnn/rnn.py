@@ -71,7 +71,7 @@ class _RNN(nn.Module):
         return input_data
 
 # Cell
-from typing import Union, List
+from typing import Callable, List, Optional, Union
 
 import pandas as pd
 import pytorch_lightning as pl
@@ -83,6 +83,7 @@ from torch.optim.lr_scheduler import StepLR
 
 from ...data.tsdataset import TimeSeriesDataset
 from ...data.tsloader import TimeSeriesLoader
+from ..inference import get_runner, make_future_dataframe
 from ...losses.utils import LossFunction
 
 # Cell
@@ -102,7 +103,8 @@ class RNN(pl.LightningModule):
                  loss_train: str = 'MAE', loss_valid: str = 'MAE',
                  loss_hypar: float = 0.,
                  frequency: str = 'D',
-                 random_seed: int = 1):
+                 random_seed: int = 1,
+                 calendar_cols: Optional[List[str]] = None):
         super(RNN, self).__init__()
 
         """ Recurrent Neural Network
@@ -160,6 +162,9 @@ class RNN(pl.LightningModule):
         random_seed: int
             random_seed for pseudo random pytorch initializer and
             numpy random generator.
+        calendar_cols: List[str]
+            Calendar features of the training datasets, see CALENDAR_GENERATORS.
+            The forecast datasets compute the same features.
 
         """
 
@@ -197,6 +202,7 @@ class RNN(pl.LightningModule):
                                           seasonality=self.loss_hypar)
 
         self.frequency = frequency
+        self.calendar_cols = calendar_cols
 
         #Defining model
         self.model = _RNN(input_size=self.input_size,
@@ -332,6 +338,19 @@ class RNN(pl.LightningModule):
 
         return y_true, y_hat, sample_mask
 
+    def predict_last_window(self, batch):
+        """Forecast of the window ending at the last timestamp of the batch.
+
+        The RNN state runs over all the windows. Used by forecast.
+        """
+        # Parsing batch
+        S, Y, X, idxs, sample_mask, available_mask = self.parse_batch(batch)
+
+        insample_Y = Y[:,:, :self.input_size]
+        y_hat = self.model(Y=insample_Y, X=X)
+
+        return y_hat[:, -1],
+
     def configure_optimizers(self):
         rnn_optimizer = Adam(params=self.model.parameters(),
                              lr=self.learning_rate,
@@ -346,7 +365,8 @@ class RNN(pl.LightningModule):
 
 # Cell
 @patch
-def forecast(self: RNN, Y_df, X_df = None, S_df = None, batch_size=1, trainer=None):
+def forecast(self: RNN, Y_df, X_df = None, S_df = None, batch_size=1, trainer=None, return_numpy=False,
+             backend: Optional[Callable] = None):
     """
     Method for forecasting self.output_size periods after last timestamp of Y_df.
 
@@ -361,22 +381,26 @@ def forecast(self: RNN, Y_df, X_df = None, S_df = None, batch_size=1, trainer=No
         Dataframe with static data, needs 'unique_id' column.
     bath_size: int
         Batch size for forecasting.
+    return_numpy: bool
+        If True returns the arrays (ids, ds, y_hat) instead of a dataframe.
+    backend: Callable, optional
+        Called with each batch instead of the model, for example an
+        `OnnxRuntimeBackend` of the exported forecast. Only used without trainer.
 
     Returns
     ----------
     forecast_df: pd.DataFrame
         Dataframe with forecasts.
+        If return_numpy, tuple of arrays (ids, ds, y_hat) of the forecasts.
     """
 
+    if (backend is not None) and (trainer is not None):
+        raise Exception('The backend runs the forecast without trainer')
+
     # Add forecast dates to Y_df
-    Y_df['ds'] = pd.to_datetime(Y_df['ds'])
     if X_df is not None:
-        X_df['ds'] = pd.to_datetime(X_df['ds'])
-    forecast_dates = pd.date_range(Y_df['ds'].max(), periods=self.output_size+1, freq=self.frequency)[1:]
-    index = pd.MultiIndex.from_product([Y_df['unique_id'].unique(), forecast_dates], names=['unique_id', 'ds'])
-    forecast_df = pd.DataFrame({'y':[0]}, index=index).reset_index()
-
-    Y_df = Y_df.append(forecast_df).sort_values(['unique_id','ds']).reset_index(drop=True)
+        X_df = X_df.assign(ds=pd.to_datetime(X_df['ds']))
+    Y_df, ids, ds = make_future_dataframe(Y_df, horizon=self.output_size, freq=self.frequency)
 
     # Dataset, loader and trainer
     dataset = TimeSeriesDataset(Y_df=Y_df, X_df=X_df,
@@ -385,25 +409,28 @@ def forecast(self: RNN, Y_df, X_df = None, S_df = None, batch_size=1, trainer=No
                                 is_test=True,
                                 input_size=self.input_size,
                                 output_size=self.output_size,
+                                calendar_cols=self.calendar_cols,
                                 verbose=True)
 
     loader = TimeSeriesLoader(dataset=dataset,
                               batch_size=batch_size,
                               shuffle=False)
 
-    if trainer is None:
-        gpus = -1 if t.cuda.is_available() else 0
-        trainer = pl.Trainer(progress_bar_refresh_rate=1,
-                             gpus=gpus,
-                             logger=False)
-
     # Forecast
-    outputs = trainer.predict(self, loader)
-
-    # Process forecast and include in forecast_df
-    _, forecast, _ = zip(*outputs)
-    forecast = t.cat([forecast_[:, -1] for forecast_ in forecast]).cpu().numpy()
-    forecast_df['y'] = forecast.flatten()
+    if trainer is None:
+        forecast, = get_runner(self).run(loader, copy=False,
+                                         forward=self.predict_last_window if backend is None else backend)
+    else:
+        outputs = trainer.predict(self, loader)
+        _, forecast, _ = zip(*outputs)
+        forecast = t.cat([forecast_[:, -1] for forecast_ in forecast]).cpu().numpy()
+
+    # Process forecast
+    y_hat = forecast.flatten()
+    if return_numpy:
+        return ids, ds, y_hat
+
+    forecast_df = pd.DataFrame({'unique_id': ids, 'ds': ds, 'y': y_hat})
 
     return forecast_df
 
@@ -4,6 +4,7 @@ __all__ = ['Informer']
 
 # Cell
 import random
+from typing import List, Optional
 from fastcore.foundation import patch
 
 import numpy as np
@@ -21,6 +22,7 @@ from ..components.embed import DataEmbedding
 from ...losses.utils import LossFunction
 from ...data.tsdataset import IterateWindowsDataset
 from ...data.tsloader import TimeSeriesLoader
+from ..inference import get_runner, make_future_dataframe, tail_series
 
 # Cell
 class _Informer(nn.Module):
@@ -107,7 +109,8 @@ class Informer(pl.LightningModule):
                  e_layers: int, d_layers: int, distil: bool,
                  loss_train: str, loss_valid: str, loss_hypar: float,
                  learning_rate: float, lr_decay: float, weight_decay: float,
-                 lr_decay_step_size: int, random_seed: int):
+                 lr_decay_step_size: int, random_seed: int,
+                 calendar_cols: Optional[List[str]] = None):
         super(Informer, self).__init__()
         """
         Transformer Informer model with Propspare attention.
@@ -169,6 +172,9 @@ class Informer(pl.LightningModule):
         random_seed: int
             random_seed for pseudo random pytorch initializer and
             numpy random generator.
+        calendar_cols: List[str]
+            Calendar features appended to X as time marks, see CALENDAR_GENERATORS,
+            for example the *_norm features. The forecast datasets compute the same features.
         """
 
         #------------------------ Model Attributes ------------------------#
@@ -207,6 +213,7 @@ class Informer(pl.LightningModule):
         self.weight_decay = weight_decay
         self.lr_decay_step_size = lr_decay_step_size
         self.random_seed = random_seed
+        self.calendar_cols = calendar_cols
 
         self.model = _Informer(pred_len, output_attention,
                                enc_in, dec_in, d_model, c_out,
@@ -316,7 +323,8 @@ class Informer(pl.LightningModule):
 # Cell
 @patch
 def forecast(self: Informer, Y_df: pd.DataFrame, X_df: pd.DataFrame = None,
-                S_df: pd.DataFrame = None, trainer: pl.Trainer =None) -> pd.DataFrame:
+                S_df: pd.DataFrame = None, trainer: pl.Trainer =None,
+                return_numpy: bool = False) -> pd.DataFrame:
     """
     Method for forecasting self.n_time_out periods after last timestamp of Y_df.
 
@@ -329,28 +337,29 @@ def forecast(self: Informer, Y_df: pd.DataFrame, X_df: pd.DataFrame = None,
         Note that 'unique_id' and 'ds' must match Y_df plus the forecasting horizon.
     S_df: pd.DataFrame
         Dataframe with static data, needs 'unique_id' column.
-    bath_size: int
-        Batch size for forecasting.
     trainer: pl.Trainer
         Trainer object for model training and evaluation.
+        If None the forecast runs without trainer with the model `InferenceRunner`.
+    return_numpy: bool
+        If True returns the arrays (ids, ds, y_hat) instead of a dataframe.
 
     Returns
     ----------
     forecast_df: pd.DataFrame
         Dataframe with forecasts.
+        If return_numpy, tuple of arrays (ids, ds, y_hat) of the forecasts.
     """
 
-    # Add forecast dates to Y_df
-    Y_df['ds'] = pd.to_datetime(Y_df['ds'])
+    # Only the last window is forecasted, it needs seq_len timestamps of history
+    Y_df = tail_series(Y_df, self.seq_len)
     if X_df is not None:
-        X_df['ds'] = pd.to_datetime(X_df['ds'])
-    self.frequency = pd.infer_freq(Y_df[Y_df['unique_id']==Y_df['unique_id'][0]]['ds']) # Infer with first unique_id series
-
-    forecast_dates = pd.date_range(Y_df['ds'].max(), periods=self.pred_len+1, freq=self.frequency)[1:]
-    index = pd.MultiIndex.from_product([Y_df['unique_id'].unique(), forecast_dates], names=['unique_id', 'ds'])
-    forecast_df = pd.DataFrame({'y':[0]}, index=index).reset_index()
+        X_df = tail_series(X_df, self.seq_len + self.pred_len)
+        X_df = X_df.assign(ds=pd.to_datetime(X_df['ds']))
 
-    Y_df = Y_df.append(forecast_df).sort_values(['unique_id','ds']).reset_index(drop=True)
+    # Add forecast dates to Y_df
+    first_ds = Y_df['ds'][Y_df['unique_id']==Y_df['unique_id'].iloc[0]]
+    self.frequency = pd.infer_freq(pd.to_datetime(first_ds)) # Infer with first unique_id series
+    Y_df, ids, ds = make_future_dataframe(Y_df, horizon=self.pred_len, freq=self.frequency)
 
     # Dataset, loader and trainer
     dataset = IterateWindowsDataset(S_df=S_df, Y_df=Y_df, X_df=X_df,
@@ -359,24 +368,27 @@ def forecast(self: Informer, Y_df: pd.DataFrame, X_df: pd.DataFrame = None,
                                     output_size=self.pred_len,
                                     ds_in_test=self.pred_len,
                                     is_test=True,
+                                    calendar_cols=self.calendar_cols,
                                     verbose=True)
 
+    # The last window holds every series as channels, it is a single batch
     loader = TimeSeriesLoader(dataset=dataset,
                                 batch_size=1,
                                 shuffle=False)
 
-    if trainer is None:
-        gpus = -1 if torch.cuda.is_available() else 0
-        trainer = pl.Trainer(progress_bar_refresh_rate=1,
-                             gpus=gpus,
-                             logger=False)
-
     # Forecast
-    outputs = trainer.predict(self, loader)
+    if trainer is None:
+        forecast, = get_runner(self).run(loader, copy=False, transform=lambda outputs: [outputs[1]])
+    else:
+        outputs = trainer.predict(self, loader)
+        _, forecast, _, _ = [torch.cat(output).cpu().numpy() for output in zip(*outputs)]
 
-    # Process forecast and include in forecast_df
-    _, forecast, _, _ = [torch.cat(output).cpu().numpy() for output in zip(*outputs)]
+    # Process forecast
     forecast = np.transpose(forecast, (0, 2, 1))
-    forecast_df['y'] = forecast.flatten()
+    y_hat = forecast.flatten()
+    if return_numpy:
+        return ids, ds, y_hat
+
+    forecast_df = pd.DataFrame({'unique_id': ids, 'ds': ds, 'y': y_hat})
 
     return forecast_df